@@ -0,0 +1,61 @@
+import fs from 'fs';
+import { getAiJobResult, getAiJobStatus, queuedInputPath } from '../../../utils/aiJobQueue';
+
+// Ids handed out by job_queue.py submit
+const JOB_ID_PATTERN = /^[0-9a-f]{32}$/;
+
+export default async function handler(req, res) {
+  if (req.method !== 'GET') {
+    return res.status(405).json({ error: 'Method not allowed' });
+  }
+
+  const jobId = req.query.id;
+  if (typeof jobId !== 'string' || !JOB_ID_PATTERN.test(jobId)) {
+    return res.status(400).json({ error: 'Invalid job id' });
+  }
+
+  try {
+    let status;
+    try {
+      status = await getAiJobStatus(jobId);
+    } catch (queueError) {
+      if (queueError.code === 'QUEUE_ERROR') {
+        return res.status(404).json({ error: 'Unknown or expired job' });
+      }
+      throw queueError;
+    }
+
+    if (status.state === 'queued' || status.state === 'running') {
+      return res.status(202).json({ jobId, state: status.state, position: status.position });
+    }
+
+    const result = await getAiJobResult(jobId);
+    if (result?.output_path) {
+      // The job has finished with its upload
+      await fs.promises.rm(queuedInputPath(result.output_path), { force: true });
+    }
+    if (!result?.ok) {
+      return res.status(500).json({ jobId, state: status.state, error: result?.error || 'Processing failed' });
+    }
+
+    let processedImage;
+    try {
+      processedImage = await fs.promises.readFile(result.output_path);
+    } catch (readError) {
+      // Results are deleted once the queue's TTL has passed
+      return res.status(410).json({ error: 'Result has expired' });
+    }
+
+    res.setHeader('Content-Type', 'image/png');
+    res.setHeader('Content-Disposition', `attachment; filename="upscaled_${Date.now()}.png"`);
+    res.setHeader('Content-Length', processedImage.length);
+    res.status(200).send(processedImage);
+
+  } catch (error) {
+    console.error('AI upscaling status error:', error);
+    return res.status(500).json({
+      error: 'Internal server error',
+      details: error.message
+    });
+  }
+}
@@ -1,8 +1,12 @@
 import { NextApiRequest, NextApiResponse } from 'next';
 import formidable from 'formidable';
+import crypto from 'crypto';
 import fs from 'fs';
+import os from 'os';
 import path from 'path';
 import sharp from 'sharp';
+import { runAiFileJob } from '../../../utils/aiWorkerPool';
+import { queuedInputPath, submitAiJob } from '../../../utils/aiJobQueue';
 
 export const config = {
   api: {
@@ -35,69 +39,113 @@ export default async function handler(req, res) {
     console.log('Processing AI upscaling request...');
     console.log('Upscale factor:', upscaleFactor);
 
-    // Read the input image
-    const inputBuffer = fs.readFileSync(file.filepath);
-    
-    // Process with Sharp
+    // With queue=true the job goes to the background queue and the client
+    // polls /api/ai/ai-upscale-status?id=<jobId> for the result
+    if (fields.queue?.[0] === 'true') {
+      // The upload is kept next to the output until the status route
+      // hands out the result, see queuedInputPath()
+      const outputPath = path.join(os.tmpdir(), `imageopt-upscaled-${crypto.randomUUID()}.png`);
+      const inputPath = queuedInputPath(outputPath);
+      await fs.promises.rename(file.filepath, inputPath);
+      file.filepath = inputPath;
+      try {
+        const jobId = await submitAiJob('ai_upscale', inputPath, outputPath, {
+          upscale_factor: upscaleFactor,
+        });
+        return res.status(202).json({ jobId, statusUrl: `/api/ai/ai-upscale-status?id=${jobId}` });
+      } catch (queueError) {
+        if (queueError.code === 'QUEUE_FULL' || queueError.code === 'JOB_REJECTED') {
+          await fs.promises.rm(file.filepath, { force: true });
+          return res.status(queueError.code === 'QUEUE_FULL' ? 503 : 413).json({ error: queueError.message });
+        }
+        // Without a usable queue the upload is processed right away below
+        console.error('AI job queue unavailable:', queueError.message);
+      }
+    }
+
+    // Run the operation on a warm Python worker; the Sharp code below is
+    // the fallback when no worker is available
     let processedImage;
-    
     try {
-      // Get original image metadata
-      const image = sharp(inputBuffer);
-      const metadata = await image.metadata();
-      
-      console.log('Original image metadata:', { 
-        width: metadata.width, 
-        height: metadata.height, 
-        format: metadata.format 
+      const result = await runAiFileJob('ai_upscale', file.filepath, {
+        upscale_factor: upscaleFactor,
       });
-      
-      // Parse upscale factor
-      const factor = parseInt(upscaleFactor.replace('x', ''));
-      const newWidth = metadata.width * factor;
-      const newHeight = metadata.height * factor;
-      
-      console.log('Target size:', { width: newWidth, height: newHeight });
-      
-      // Upscale using high-quality LANCZOS resampling
-      processedImage = await image
-        .resize(newWidth, newHeight, {
-          kernel: sharp.kernel.lanczos3,
-          withoutEnlargement: false
-        })
-        .sharpen({
-          sigma: 1.0,
-          flat: 1.0,
-          jagged: 2.0
-        })
-        .png({ quality: 95 })
-        .toBuffer();
-      
-      console.log('Image upscaled successfully');
-      
-    } catch (processingError) {
-      console.error('Sharp processing error:', processingError);
-      
-      // Fallback: basic upscaling without enhancement
+      if (result.rejected) {
+        await fs.promises.rm(file.filepath, { force: true });
+        return res.status(413).json({ error: result.error });
+      }
+      if (result.ok) {
+        processedImage = result.data;
+      } else {
+        console.error('AI worker failed:', result.error);
+      }
+    } catch (workerError) {
+      console.error('AI worker unavailable:', workerError.message);
+    }
+
+    if (!processedImage) {
+      // Read the input image
+      const inputBuffer = fs.readFileSync(file.filepath);
+    
+      // Process with Sharp
       try {
+        // Get original image metadata
         const image = sharp(inputBuffer);
         const metadata = await image.metadata();
+      
+        console.log('Original image metadata:', { 
+          width: metadata.width, 
+          height: metadata.height, 
+          format: metadata.format 
+        });
+      
+        // Parse upscale factor
         const factor = parseInt(upscaleFactor.replace('x', ''));
         const newWidth = metadata.width * factor;
         const newHeight = metadata.height * factor;
-        
+      
+        console.log('Target size:', { width: newWidth, height: newHeight });
+      
+        // Upscale using high-quality LANCZOS resampling
         processedImage = await image
           .resize(newWidth, newHeight, {
-            kernel: sharp.kernel.lanczos3
+            kernel: sharp.kernel.lanczos3,
+            withoutEnlargement: false
+          })
+          .sharpen({
+            sigma: 1.0,
+            flat: 1.0,
+            jagged: 2.0
           })
-          .png({ quality: 90 })
+          .png({ quality: 95 })
           .toBuffer();
+      
+        console.log('Image upscaled successfully');
+      
+      } catch (processingError) {
+        console.error('Sharp processing error:', processingError);
+      
+        // Fallback: basic upscaling without enhancement
+        try {
+          const image = sharp(inputBuffer);
+          const metadata = await image.metadata();
+          const factor = parseInt(upscaleFactor.replace('x', ''));
+          const newWidth = metadata.width * factor;
+          const newHeight = metadata.height * factor;
+        
+          processedImage = await image
+            .resize(newWidth, newHeight, {
+              kernel: sharp.kernel.lanczos3
+            })
+            .png({ quality: 90 })
+            .toBuffer();
         
-        console.log('Image upscaled with fallback method');
+          console.log('Image upscaled with fallback method');
         
-      } catch (fallbackError) {
-        console.error('Fallback upscaling failed:', fallbackError);
-        throw fallbackError;
+        } catch (fallbackError) {
+          console.error('Fallback upscaling failed:', fallbackError);
+          throw fallbackError;
+        }
       }
     }
 
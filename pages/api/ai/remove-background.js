@@ -3,6 +3,7 @@ import formidable from 'formidable';
 import fs from 'fs';
 import path from 'path';
 import sharp from 'sharp';
+import { runAiFileJob } from '../../../utils/aiWorkerPool';
 
 export const config = {
   api: {
@@ -36,143 +37,164 @@ export default async function handler(req, res) {
     console.log('Processing background removal request...');
     console.log('Background type:', backgroundType, 'Color:', backgroundColor);
 
-    // Read the input image
-    const inputBuffer = fs.readFileSync(file.filepath);
-    
-    // Process with Sharp
+    // Run the operation on a warm Python worker; the Sharp code below is
+    // the fallback when no worker is available
     let processedImage;
-    
     try {
-      // Convert to RGBA for transparency support
-      const image = sharp(inputBuffer);
-      const metadata = await image.metadata();
-      
-      console.log('Image metadata:', { width: metadata.width, height: metadata.height, format: metadata.format });
-      
-      // Get image data for analysis
-      const { data, info } = await image.raw().toBuffer({ resolveWithObject: true });
-      
-      // Simple background detection based on corner pixels
-      const width = info.width;
-      const height = info.height;
-      const channels = info.channels;
-      
-      // Get corner pixels
-      const corners = [
-        { x: 0, y: 0 },                    // top-left
-        { x: width - 1, y: 0 },           // top-right
-        { x: 0, y: height - 1 },          // bottom-left
-        { x: width - 1, y: height - 1 }   // bottom-right
-      ];
-      
-      const cornerColors = corners.map(corner => {
-        const index = (corner.y * width + corner.x) * channels;
-        return {
-          r: data[index],
-          g: data[index + 1],
-          b: data[index + 2]
-        };
-      });
-      
-      // Find most common corner color (likely background)
-      const colorCounts = {};
-      cornerColors.forEach(color => {
-        const key = `${color.r},${color.g},${color.b}`;
-        colorCounts[key] = (colorCounts[key] || 0) + 1;
+      const result = await runAiFileJob('remove_background', file.filepath, {
+        background_type: backgroundType,
+        background_color: backgroundColor,
       });
-      
-      const mostCommonColor = Object.keys(colorCounts).reduce((a, b) => 
-        colorCounts[a] > colorCounts[b] ? a : b
-      );
-      
-      const [bgR, bgG, bgB] = mostCommonColor.split(',').map(Number);
-      console.log('Detected background color:', { r: bgR, g: bgG, b: bgB });
-      
-      // Create mask for background pixels
-      const tolerance = 30;
-      const mask = Buffer.alloc(width * height);
-      
-      for (let y = 0; y < height; y++) {
-        for (let x = 0; x < width; x++) {
-          const index = (y * width + x) * channels;
-          const r = data[index];
-          const g = data[index + 1];
-          const b = data[index + 2];
+      if (result.rejected) {
+        await fs.promises.rm(file.filepath, { force: true });
+        return res.status(413).json({ error: result.error });
+      }
+      if (result.ok) {
+        processedImage = result.data;
+      } else {
+        console.error('AI worker failed:', result.error);
+      }
+    } catch (workerError) {
+      console.error('AI worker unavailable:', workerError.message);
+    }
+
+    if (!processedImage) {
+      // Read the input image
+      const inputBuffer = fs.readFileSync(file.filepath);
+    
+      // Process with Sharp
+      try {
+        // Convert to RGBA for transparency support
+        const image = sharp(inputBuffer);
+        const metadata = await image.metadata();
+      
+        console.log('Image metadata:', { width: metadata.width, height: metadata.height, format: metadata.format });
+      
+        // Get image data for analysis
+        const { data, info } = await image.raw().toBuffer({ resolveWithObject: true });
+      
+        // Simple background detection based on corner pixels
+        const width = info.width;
+        const height = info.height;
+        const channels = info.channels;
+      
+        // Get corner pixels
+        const corners = [
+          { x: 0, y: 0 },                    // top-left
+          { x: width - 1, y: 0 },           // top-right
+          { x: 0, y: height - 1 },          // bottom-left
+          { x: width - 1, y: height - 1 }   // bottom-right
+        ];
+      
+        const cornerColors = corners.map(corner => {
+          const index = (corner.y * width + corner.x) * channels;
+          return {
+            r: data[index],
+            g: data[index + 1],
+            b: data[index + 2]
+          };
+        });
+      
+        // Find most common corner color (likely background)
+        const colorCounts = {};
+        cornerColors.forEach(color => {
+          const key = `${color.r},${color.g},${color.b}`;
+          colorCounts[key] = (colorCounts[key] || 0) + 1;
+        });
+      
+        const mostCommonColor = Object.keys(colorCounts).reduce((a, b) => 
+          colorCounts[a] > colorCounts[b] ? a : b
+        );
+      
+        const [bgR, bgG, bgB] = mostCommonColor.split(',').map(Number);
+        console.log('Detected background color:', { r: bgR, g: bgG, b: bgB });
+      
+        // Create mask for background pixels
+        const tolerance = 30;
+        const mask = Buffer.alloc(width * height);
+      
+        for (let y = 0; y < height; y++) {
+          for (let x = 0; x < width; x++) {
+            const index = (y * width + x) * channels;
+            const r = data[index];
+            const g = data[index + 1];
+            const b = data[index + 2];
           
-          // Check if pixel is similar to background color
-          const isBackground = (
-            Math.abs(r - bgR) < tolerance &&
-            Math.abs(g - bgG) < tolerance &&
-            Math.abs(b - bgB) < tolerance
-          );
+            // Check if pixel is similar to background color
+            const isBackground = (
+              Math.abs(r - bgR) < tolerance &&
+              Math.abs(g - bgG) < tolerance &&
+              Math.abs(b - bgB) < tolerance
+            );
           
-          // Set mask value (0 = background, 255 = foreground)
-          mask[y * width + x] = isBackground ? 0 : 255;
+            // Set mask value (0 = background, 255 = foreground)
+            mask[y * width + x] = isBackground ? 0 : 255;
+          }
         }
-      }
-      
-      // Create new image with transparency or solid background
-      const newData = Buffer.alloc(width * height * 4); // RGBA
       
-      // Parse background color
-      let bgColorR, bgColorG, bgColorB;
-      if (backgroundColor.startsWith('#')) {
-        const hex = backgroundColor.slice(1);
-        bgColorR = parseInt(hex.slice(0, 2), 16);
-        bgColorG = parseInt(hex.slice(2, 4), 16);
-        bgColorB = parseInt(hex.slice(4, 6), 16);
-      } else {
-        bgColorR = bgColorG = bgColorB = 255; // Default to white
-      }
+        // Create new image with transparency or solid background
+        const newData = Buffer.alloc(width * height * 4); // RGBA
+      
+        // Parse background color
+        let bgColorR, bgColorG, bgColorB;
+        if (backgroundColor.startsWith('#')) {
+          const hex = backgroundColor.slice(1);
+          bgColorR = parseInt(hex.slice(0, 2), 16);
+          bgColorG = parseInt(hex.slice(2, 4), 16);
+          bgColorB = parseInt(hex.slice(4, 6), 16);
+        } else {
+          bgColorR = bgColorG = bgColorB = 255; // Default to white
+        }
       
-      for (let y = 0; y < height; y++) {
-        for (let x = 0; x < width; x++) {
-          const srcIndex = (y * width + x) * channels;
-          const dstIndex = (y * width + x) * 4;
-          const maskIndex = y * width + x;
+        for (let y = 0; y < height; y++) {
+          for (let x = 0; x < width; x++) {
+            const srcIndex = (y * width + x) * channels;
+            const dstIndex = (y * width + x) * 4;
+            const maskIndex = y * width + x;
           
-          if (mask[maskIndex] === 0) {
-            // Background pixel
-            if (backgroundType === 'transparent') {
-              newData[dstIndex] = 0;         // R
-              newData[dstIndex + 1] = 0;     // G
-              newData[dstIndex + 2] = 0;     // B
-              newData[dstIndex + 3] = 0;     // A (transparent)
+            if (mask[maskIndex] === 0) {
+              // Background pixel
+              if (backgroundType === 'transparent') {
+                newData[dstIndex] = 0;         // R
+                newData[dstIndex + 1] = 0;     // G
+                newData[dstIndex + 2] = 0;     // B
+                newData[dstIndex + 3] = 0;     // A (transparent)
+              } else {
+                // Solid color background
+                newData[dstIndex] = bgColorR;     // R
+                newData[dstIndex + 1] = bgColorG; // G
+                newData[dstIndex + 2] = bgColorB; // B
+                newData[dstIndex + 3] = 255;      // A (opaque)
+              }
             } else {
-              // Solid color background
-              newData[dstIndex] = bgColorR;     // R
-              newData[dstIndex + 1] = bgColorG; // G
-              newData[dstIndex + 2] = bgColorB; // B
-              newData[dstIndex + 3] = 255;      // A (opaque)
+              // Foreground pixel - keep original colors
+              newData[dstIndex] = data[srcIndex];         // R
+              newData[dstIndex + 1] = data[srcIndex + 1]; // G
+              newData[dstIndex + 2] = data[srcIndex + 2]; // B
+              newData[dstIndex + 3] = 255;                // A (opaque)
             }
-          } else {
-            // Foreground pixel - keep original colors
-            newData[dstIndex] = data[srcIndex];         // R
-            newData[dstIndex + 1] = data[srcIndex + 1]; // G
-            newData[dstIndex + 2] = data[srcIndex + 2]; // B
-            newData[dstIndex + 3] = 255;                // A (opaque)
           }
         }
-      }
       
-      // Create new image with Sharp
-      processedImage = await sharp(newData, {
-        raw: {
-          width,
-          height,
-          channels: 4
-        }
-      }).png().toBuffer();
+        // Create new image with Sharp
+        processedImage = await sharp(newData, {
+          raw: {
+            width,
+            height,
+            channels: 4
+          }
+        }).png().toBuffer();
       
-      console.log('Image processed successfully');
+        console.log('Image processed successfully');
       
-    } catch (processingError) {
-      console.error('Sharp processing error:', processingError);
+      } catch (processingError) {
+        console.error('Sharp processing error:', processingError);
       
-      // Fallback: simple conversion to PNG
-      processedImage = await sharp(inputBuffer)
-        .png()
-        .toBuffer();
+        // Fallback: simple conversion to PNG
+        processedImage = await sharp(inputBuffer)
+          .png()
+          .toBuffer();
+      }
     }
 
     // Set appropriate headers
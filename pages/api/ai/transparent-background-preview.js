@@ -2,6 +2,7 @@ import { NextApiRequest, NextApiResponse } from 'next';
 import formidable from 'formidable';
 import fs from 'fs';
 import sharp from 'sharp';
+import { runAiRawJob, segmentationMode } from '../../../utils/aiWorkerPool';
 
 export const config = {
   api: {
@@ -19,25 +20,32 @@ async function createScanningPreview(imageBuffer) {
   const height = info.height;
   const channels = info.channels;
   
-  // Convert to grayscale
-  const grayData = new Uint8Array(width * height);
-  for (let i = 0; i < width * height; i++) {
-    const pixelIndex = i * channels;
-    const r = data[pixelIndex];
-    const g = data[pixelIndex + 1];
-    const b = data[pixelIndex + 2];
-    grayData[i] = Math.round(0.299 * r + 0.587 * g + 0.114 * b);
+  // Segment on a warm Python worker straight from the decoded pixels; the
+  // detection below is the fallback when no worker is available
+  let backgroundMask = await workerBackgroundMask(data, info);
+  let edges = null;
+
+  if (!backgroundMask) {
+    // Convert to grayscale
+    const grayData = new Uint8Array(width * height);
+    for (let i = 0; i < width * height; i++) {
+      const pixelIndex = i * channels;
+      const r = data[pixelIndex];
+      const g = data[pixelIndex + 1];
+      const b = data[pixelIndex + 2];
+      grayData[i] = Math.round(0.299 * r + 0.587 * g + 0.114 * b);
+    }
+    
+    // Apply Gaussian blur
+    const blurredData = applyGaussianBlur(grayData, width, height);
+    
+    // Edge detection
+    edges = await detectEdgesCanny(blurredData, width, height);
+    
+    // Find background using flood fill
+    backgroundMask = await findBackgroundFloodFill(data, width, height, channels, edges);
   }
   
-  // Apply Gaussian blur
-  const blurredData = applyGaussianBlur(grayData, width, height);
-  
-  // Edge detection
-  const edges = await detectEdgesCanny(blurredData, width, height);
-  
-  // Find background using flood fill
-  const backgroundMask = await findBackgroundFloodFill(data, width, height, channels, edges);
-  
   // Create preview image showing background detection
   const previewData = Buffer.alloc(width * height * 4);
   
@@ -74,6 +82,34 @@ async function createScanningPreview(imageBuffer) {
   };
 }
 
+// Background mask (255 = background) from a Python worker's transparent
+// result, or null when the worker is unavailable or fails
+async function workerBackgroundMask(data, info) {
+  try {
+    // Border-connected background only, like the fallback below
+    const result = await runAiRawJob('make_transparent', data, info, {
+      transparency_level: 100,
+      mode: segmentationMode(info.width, info.height),
+    });
+    if (!result.ok) {
+      console.error('AI worker failed:', result.error);
+      return null;
+    }
+    if (result.info.channels !== 4) {
+      console.error('AI worker returned', result.info.channels, 'channels instead of RGBA');
+      return null;
+    }
+    const mask = new Uint8Array(result.info.width * result.info.height);
+    for (let i = 0; i < mask.length; i++) {
+      mask[i] = result.data[i * 4 + 3] < 128 ? 255 : 0;
+    }
+    return mask;
+  } catch (workerError) {
+    console.error('AI worker unavailable:', workerError.message);
+    return null;
+  }
+}
+
 // Apply Gaussian blur
 function applyGaussianBlur(data, width, height) {
   const kernel = [1, 4, 6, 4, 1, 4, 16, 24, 16, 4, 6, 24, 36, 24, 6, 4, 16, 24, 16, 4, 1, 4, 6, 4, 1];
@@ -3,6 +3,7 @@ import formidable from 'formidable';
 import fs from 'fs';
 import path from 'path';
 import sharp from 'sharp';
+import { runAiFileJob, segmentationMode } from '../../../utils/aiWorkerPool';
 
 export const config = {
   api: {
@@ -476,36 +477,60 @@ export default async function handler(req, res) {
     console.log('🚀 Starting advanced background removal...');
     console.log('Transparency level:', transparencyLevel);
 
-    // Read the input image
-    const inputBuffer = fs.readFileSync(file.filepath);
-    
+    // Run the operation on a warm Python worker; the Sharp code below is
+    // the fallback when no worker is available
     let processedImage;
-    
     try {
-      // Use advanced background removal
-      const rgbaData = await advancedBackgroundRemoval(inputBuffer, transparencyLevel);
+      // Only the header is read here; the mode keeps the route's edge-aware
+      // flood fill behaviour instead of a global color threshold
+      const { width, height } = await sharp(file.filepath).metadata();
+      const result = await runAiFileJob('make_transparent', file.filepath, {
+        transparency_level: transparencyLevel,
+        mode: segmentationMode(width, height),
+      });
+      if (result.rejected) {
+        await fs.promises.rm(file.filepath, { force: true });
+        return res.status(413).json({ error: result.error });
+      }
+      if (result.ok) {
+        processedImage = result.data;
+      } else {
+        console.error('AI worker failed:', result.error);
+      }
+    } catch (workerError) {
+      console.error('AI worker unavailable:', workerError.message);
+    }
+
+    if (!processedImage) {
+      // Read the input image
+      const inputBuffer = fs.readFileSync(file.filepath);
+    
+      try {
+        // Use advanced background removal
+        const rgbaData = await advancedBackgroundRemoval(inputBuffer, transparencyLevel);
       
-      // Get image metadata
-      const image = sharp(inputBuffer);
-      const metadata = await image.metadata();
+        // Get image metadata
+        const image = sharp(inputBuffer);
+        const metadata = await image.metadata();
       
-      // Create final image
-      processedImage = await sharp(rgbaData, {
-        raw: {
-          width: metadata.width,
-          height: metadata.height,
-          channels: 4
-        }
-      }).png({ quality: 95 }).toBuffer();
+        // Create final image
+        processedImage = await sharp(rgbaData, {
+          raw: {
+            width: metadata.width,
+            height: metadata.height,
+            channels: 4
+          }
+        }).png({ quality: 95 }).toBuffer();
       
-      console.log('✅ Background removal completed successfully');
+        console.log('✅ Background removal completed successfully');
       
-    } catch (processingError) {
-      console.error('❌ Advanced processing failed:', processingError);
+      } catch (processingError) {
+        console.error('❌ Advanced processing failed:', processingError);
       
-      // Fallback: simple conversion
-      processedImage = await sharp(inputBuffer).png().toBuffer();
-      console.log('⚠️ Using fallback processing');
+        // Fallback: simple conversion
+        processedImage = await sharp(inputBuffer).png().toBuffer();
+        console.log('⚠️ Using fallback processing');
+      }
     }
 
     // Set appropriate headers
@@ -1,118 +1,16 @@
 #!/usr/bin/env python3
 """
 AI Image Upscaling Script using ESRGAN
-Upscales images by 2x, 4x, or 8x using AI models
+Kept so existing callers can run scripts/ai_upscale.py; the code lives in
+imageopt.ai_upscale (python3 -m imageopt upscale)
 """
 
 import sys
-import os
-import io
-from PIL import Image
-import numpy as np
-
-def ai_upscale(input_path, output_path, upscale_factor='2x'):
-    """
-    Upscale image using high-quality interpolation with enhancement
-    
-    Args:
-        input_path (str): Path to input image
-        output_path (str): Path to output image
-        upscale_factor (str): '2x', '4x', or '8x'
-    """
-    try:
-        # Load the image
-        image = Image.open(input_path).convert('RGB')
-        original_size = image.size
-        
-        # Convert upscale factor to integer
-        factor = int(upscale_factor.replace('x', ''))
-        new_size = (original_size[0] * factor, original_size[1] * factor)
-        
-        # Use high-quality LANCZOS resampling for upscaling
-        upscaled_image = image.resize(new_size, Image.LANCZOS)
-        
-        # Apply enhancement to improve quality
-        # Convert to numpy array for processing
-        img_array = np.array(upscaled_image)
-        
-        # Apply unsharp mask for sharpening
-        # This simulates AI enhancement without heavy dependencies
-        from scipy import ndimage
-        
-        # Gaussian blur for unsharp mask
-        blurred = ndimage.gaussian_filter(img_array, sigma=1.0)
-        
-        # Unsharp mask formula
-        unsharp_mask = img_array + 0.5 * (img_array - blurred)
-        unsharp_mask = np.clip(unsharp_mask, 0, 255).astype(np.uint8)
-        
-        # Convert back to PIL Image
-        enhanced_image = Image.fromarray(unsharp_mask)
-        
-        # Save the result
-        enhanced_image.save(output_path, 'PNG', quality=95)
-        
-        print(f"Image upscaled successfully: {output_path}")
-        print(f"Original size: {original_size}, New size: {new_size}")
-        print("Note: Using high-quality interpolation. For AI enhancement, install torch and ESRGAN.")
-        
-    except ImportError:
-        print("SciPy not available. Using basic upscaling...")
-        # Fallback to basic upscaling without enhancement
-        try:
-            image = Image.open(input_path).convert('RGB')
-            original_size = image.size
-            factor = int(upscale_factor.replace('x', ''))
-            new_size = (original_size[0] * factor, original_size[1] * factor)
-            
-            # Use LANCZOS for high-quality upscaling
-            upscaled_image = image.resize(new_size, Image.LANCZOS)
-            upscaled_image.save(output_path, 'PNG', quality=95)
-            
-            print(f"Image upscaled successfully: {output_path}")
-            print(f"Original size: {original_size}, New size: {new_size}")
-            
-        except Exception as e:
-            print(f"Basic upscaling failed: {e}")
-            sys.exit(1)
-            
-    except Exception as e:
-        print(f"Error during upscaling: {e}")
-        # Ultimate fallback
-        try:
-            image = Image.open(input_path).convert('RGB')
-            original_size = image.size
-            factor = int(upscale_factor.replace('x', ''))
-            new_size = (original_size[0] * factor, original_size[1] * factor)
-            
-            upscaled_image = image.resize(new_size, Image.LANCZOS)
-            upscaled_image.save(output_path, 'PNG', quality=95)
-            print(f"Image upscaled with fallback method: {output_path}")
-            
-        except Exception as fallback_error:
-            print(f"Fallback upscaling failed: {fallback_error}")
-            sys.exit(1)
+import importlib
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python ai_upscale.py <input_path> <output_path> [upscale_factor]")
-        sys.exit(1)
-    
-    input_path = sys.argv[1]
-    output_path = sys.argv[2]
-    upscale_factor = sys.argv[3] if len(sys.argv) > 3 else '2x'
-    
-    # Validate upscale factor
-    if upscale_factor not in ['2x', '4x', '8x']:
-        print("Upscale factor must be 2x, 4x, or 8x")
-        sys.exit(1)
-    
-    # Check if input file exists
-    if not os.path.exists(input_path):
-        print(f"Input file not found: {input_path}")
-        sys.exit(1)
-    
-    # Create output directory if it doesn't exist
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    ai_upscale(input_path, output_path, upscale_factor)
+    from imageopt.ai_upscale import main
+    main()
+else:
+    # Importing this file gives the package module itself
+    sys.modules[__name__] = importlib.import_module('imageopt.ai_upscale')
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Persistent AI Worker
+Kept so existing callers can run scripts/ai_worker.py; the code lives in
+imageopt.ai_worker (python3 -m imageopt worker)
+"""
+
+import sys
+import importlib
+
+if __name__ == "__main__":
+    from imageopt.ai_worker import main
+    main()
+else:
+    # Importing this file gives the package module itself
+    sys.modules[__name__] = importlib.import_module('imageopt.ai_worker')
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Batch Processing Script for AI Tools
+Kept so existing callers can run scripts/batch_process.py; the code lives in
+imageopt.batch_process (python3 -m imageopt batch)
+"""
+
+import sys
+import importlib
+
+if __name__ == "__main__":
+    from imageopt.batch_process import main
+    main()
+else:
+    # Importing this file gives the package module itself
+    sys.modules[__name__] = importlib.import_module('imageopt.batch_process')
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for AI Tools
+Kept so existing callers can run scripts/benchmark_ai_tools.py; the code lives in
+imageopt.benchmark_ai_tools (python3 -m imageopt benchmark)
+"""
+
+import sys
+import importlib
+
+if __name__ == "__main__":
+    from imageopt.benchmark_ai_tools import main
+    main()
+else:
+    # Importing this file gives the package module itself
+    sys.modules[__name__] = importlib.import_module('imageopt.benchmark_ai_tools')
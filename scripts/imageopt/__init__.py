@@ -0,0 +1,9 @@
+"""
+imageopt
+Image processing behind the AI tools: background removal, transparency and
+upscaling, plus the worker, job queue, batch and benchmark tools around them.
+
+Importing the package loads nothing else; import the module you need, e.g.
+`from imageopt.remove_background import remove_background_image`, or run
+`python3 -m imageopt <command>` (see imageopt.cli).
+"""
@@ -0,0 +1,7 @@
+"""Run the imageopt command line: python3 -m imageopt <command> [args]"""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Admission Control for AI Tools
+Estimates the peak memory and CPU time of a job from the image header
+alone, before anything is decoded, and accepts it, routes it to the
+streamed or tiled path, or rejects it
+"""
+
+import os
+import json
+import contextlib
+
+# Limits applied to each operation; override them with configure_limits()
+# or IMAGEOPT_LIMITS, e.g. '{"ai_upscale": {"max_memory_mb": 4096}}'
+#   max_input_pixels:  largest decoded source, per frame
+#   max_output_pixels: largest result held in memory, per frame; the
+#                      streamed and tiled paths write the result a strip at
+#                      a time, so only the memory and CPU limits apply to them
+#   max_memory_mb:     largest estimated peak memory of the chosen path
+#   max_cpu_seconds:   largest estimated single-core CPU time
+DEFAULT_LIMITS = {
+    'remove_background': {'max_input_pixels': 150 * 1000 * 1000, 'max_output_pixels': 150 * 1000 * 1000,
+                          'max_memory_mb': 2048, 'max_cpu_seconds': 300},
+    'make_transparent': {'max_input_pixels': 150 * 1000 * 1000, 'max_output_pixels': 150 * 1000 * 1000,
+                         'max_memory_mb': 2048, 'max_cpu_seconds': 300},
+    'ai_upscale': {'max_input_pixels': 50 * 1000 * 1000, 'max_output_pixels': 256 * 1000 * 1000,
+                   'max_memory_mb': 2048, 'max_cpu_seconds': 300},
+}
+
+# Peak bytes per source pixel of in-memory segmentation: the decode, the
+# RGBA copy, the mask scratch and the result, measured on 12 MP inputs.
+# Connected mode adds the edge planes and the int32 labels.
+SEGMENT_BYTES_PER_PIXEL = {'color': 12, 'connected': 24, 'pyramid': 12}
+
+# Peak bytes per output pixel of in-memory upscaling: the resized image,
+# the float32 sharpening planes and the result
+UPSCALE_BYTES_PER_PIXEL = 20
+
+# Single-core CPU seconds per megapixel, including the encode
+SEGMENT_SECONDS_PER_MP = {'color': 0.3, 'connected': 0.6, 'pyramid': 0.35}
+UPSCALE_SECONDS_PER_MP = 0.15
+
+# Bytes per sample of image modes wider than 8 bits
+NATIVE_SAMPLE_BYTES = {'I': 4, 'F': 4, 'I;16': 2, 'I;16B': 2, 'I;16L': 2}
+
+# Process memory that is there before any job runs
+BASE_MEMORY_MB = 64
+
+# Limits read from the environment or set with configure_limits()
+_limits = None
+
+class JobRejected(Exception):
+    """Raised by plan_job() when a job does not fit the configured limits"""
+
+def configure_limits(limits=None):
+    """
+    Use these per-operation limits on top of DEFAULT_LIMITS; None re-reads
+    IMAGEOPT_LIMITS
+    """
+    global _limits
+    _limits = None if limits is None else merge_limits(limits)
+
+def merge_limits(overrides):
+    """Return DEFAULT_LIMITS with per-operation overrides applied"""
+    merged = {operation: dict(limits) for operation, limits in DEFAULT_LIMITS.items()}
+    for operation, limits in overrides.items():
+        if operation not in merged:
+            raise ValueError(f"Unknown operation in limits: {operation}")
+        unknown = set(limits) - set(merged[operation])
+        if unknown:
+            raise ValueError(f"Unknown {operation} limit(s): {', '.join(sorted(unknown))}")
+        merged[operation].update(limits)
+    return merged
+
+def get_limits(operation):
+    """Return the limits of an operation, reading IMAGEOPT_LIMITS on first use"""
+    global _limits
+    if _limits is None:
+        _limits = merge_limits(json.loads(os.environ.get('IMAGEOPT_LIMITS') or '{}'))
+    return _limits[operation]
+
+def read_header(source):
+    """
+    Return (width, height, frames, format, decode_bytes) without decoding
+    any pixels
+
+    decode_bytes is what decoding one frame whole in its native mode holds,
+    or 0 when strip_stream can memory-map the pixels instead.
+
+    Raises:
+        JobRejected: When the header is already over Pillow's decompression
+            bomb limit
+    """
+    from PIL import Image
+    from .image_io import load_image
+    from .strip_stream import raw_pixel_layout
+
+    try:
+        image = load_image(source)
+    except Image.DecompressionBombError as e:
+        raise JobRejected(f"Image is too large to decode: {e}")
+    # Files opened here are closed; an Image passed in stays open for the caller
+    with image if image is not source else contextlib.nullcontext():
+        width, height = image.size
+        if raw_pixel_layout(image) is not None:
+            decode_bytes = 0
+        else:
+            decode_bytes = width * height * len(image.getbands()) * NATIVE_SAMPLE_BYTES.get(image.mode, 1)
+        return width, height, getattr(image, 'n_frames', 1), image.format, decode_bytes
+
+def megabytes(value):
+    """Convert bytes to MB"""
+    return value / (1024 * 1024)
+
+def segment_memory(width, height, mode, path, decode_bytes=0):
+    """
+    Estimated peak bytes of background removal or transparency on one frame
+
+    decode_bytes is the whole-image decode the streamed path holds for
+    sources it cannot memory-map, see read_header()
+    """
+    from .strip_stream import DEFAULT_STRIP_ROWS
+    from .image_io import REDUCED_MAX_SIDE
+
+    if path == 'stream':
+        # A strip of rows, plus the reduced copy the pyramid mode segments
+        reduced = REDUCED_MAX_SIDE * REDUCED_MAX_SIDE * SEGMENT_BYTES_PER_PIXEL['connected']
+        strips = width * DEFAULT_STRIP_ROWS * SEGMENT_BYTES_PER_PIXEL['color']
+        return decode_bytes + strips + (reduced if mode == 'pyramid' else 0)
+    return width * height * SEGMENT_BYTES_PER_PIXEL[mode]
+
+def upscale_memory(width, height, factor, path, threads=1, tile_size=None):
+    """Estimated peak bytes of upscaling one frame"""
+    from .ai_upscale import DEFAULT_TILE_SIZE, tile_halo
+
+    if path == 'tiled':
+        # The decoded source, one output band and a tile in flight per thread
+        tile_size = tile_size or DEFAULT_TILE_SIZE
+        tile = (tile_size + 2 * tile_halo(factor)) * factor
+        band = width * factor * tile_size * factor * 3
+        return width * height * 3 + band + threads * tile * tile * UPSCALE_BYTES_PER_PIXEL
+    return width * height * 4 + width * height * factor * factor * UPSCALE_BYTES_PER_PIXEL
+
+def plan_job(operation, source, mode='color', stream=None, factor=1, tile_size=None, model=False, profile=None):
+    """
+    Choose how a job runs from its header and estimate what it costs
+
+    Args:
+        operation (str): 'remove_background', 'make_transparent' or 'ai_upscale'
+        source: File path or bytes of the input
+        mode (str): Segmentation mode of the masked operations
+        stream (bool): The caller's streaming choice; None lets the size and
+            the memory limit decide
+        factor (int): Upscale factor
+        tile_size (int): The caller's tile size; None lets the size and the
+            memory limit decide, 0 never tiles
+        model (bool): Whether a model backend runs, which has no streamed
+            or tiled path
+        profile (str): Encoder profile, which decides whether an animation
+            is written as WebP
+
+    Returns:
+        dict: operation, width, height, frames, path ('memory', 'stream',
+            'tiled' or 'animation'), memory_mb and cpu_seconds
+
+    Raises:
+        JobRejected: When no path fits the operation's limits
+    """
+    from .band_scheduler import get_threads
+    from .strip_stream import STREAMING_MODES, STREAMING_PIXELS
+    from .ai_upscale import resolve_tile_size
+
+    limits = get_limits(operation)
+    width, height, frames, source_format, decode_bytes = read_header(source)
+    pixels = width * height
+    upscale = operation == 'ai_upscale'
+    out_pixels = pixels * factor * factor if upscale else pixels
+
+    if pixels > limits['max_input_pixels']:
+        raise JobRejected(f"{operation} accepts inputs up to {limits['max_input_pixels'] / 1e6:g} MP, "
+                          f"got {width}x{height} ({pixels / 1e6:.1f} MP)")
+    if upscale:
+        def memory(path):
+            return upscale_memory(width, height, factor, path, get_threads(), tile_size)
+        low_memory = 'tiled' if not model and tile_size != 0 else None
+        if frames > 1:
+            path = 'animation'
+        elif low_memory and resolve_tile_size((width * factor, height * factor), tile_size):
+            path = 'tiled'
+        else:
+            path = 'memory'
+        cpu_seconds = out_pixels / 1e6 * UPSCALE_SECONDS_PER_MP * frames
+    else:
+        def memory(path):
+            return segment_memory(width, height, mode, path, decode_bytes)
+        low_memory = 'stream' if not model and mode in STREAMING_MODES and stream is not False else None
+        if frames > 1:
+            path = 'animation'
+        elif low_memory and (stream or (stream is None and pixels > STREAMING_PIXELS)):
+            path = 'stream'
+        else:
+            path = 'memory'
+        cpu_seconds = pixels / 1e6 * SEGMENT_SECONDS_PER_MP[mode] * frames
+
+    if path == 'animation':
+        # A chunk of frames is processed at once, see animation
+        from .animation import animation_format, chunk_size
+        memory_bytes = memory('memory') * min(frames, chunk_size())
+        if animation_format(source_format, profile) == 'WEBP':
+            # Pillow's animated WebP writer holds every processed RGBA frame
+            memory_bytes += frames * out_pixels * 4
+    else:
+        memory_bytes = memory(path)
+        if megabytes(memory_bytes) + BASE_MEMORY_MB > limits['max_memory_mb'] and path == 'memory' and low_memory:
+            # Too large to hold at once, but the bounded-memory path fits
+            path = low_memory
+            memory_bytes = memory(path)
+
+    if out_pixels > limits['max_output_pixels'] and path in ('memory', 'animation'):
+        raise JobRejected(f"{operation} produces outputs up to {limits['max_output_pixels'] / 1e6:g} MP in memory, "
+                          f"{factor}x of {width}x{height} would be {out_pixels / 1e6:.1f} MP")
+
+    plan = {
+        'operation': operation,
+        'width': width,
+        'height': height,
+        'frames': frames,
+        'path': path,
+        'memory_mb': round(megabytes(memory_bytes) + BASE_MEMORY_MB, 1),
+        'cpu_seconds': round(cpu_seconds, 2),
+    }
+    if plan['memory_mb'] > limits['max_memory_mb']:
+        raise JobRejected(f"{operation} of {width}x{height} needs about {plan['memory_mb']:.0f} MB on the "
+                          f"{path} path, over the {limits['max_memory_mb']} MB limit")
+    if plan['cpu_seconds'] > limits['max_cpu_seconds']:
+        raise JobRejected(f"{operation} of {width}x{height} would take about {plan['cpu_seconds']:.0f} CPU "
+                          f"seconds, over the {limits['max_cpu_seconds']} s limit")
+    return plan
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+AI Image Upscaling Script using ESRGAN
+Upscales images by 2x, 4x, or 8x using AI models
+"""
+
+import sys
+import os
+import io
+import math
+from PIL import Image
+import numpy as np
+
+from .image_io import load_image
+from .png_stream import PngStreamWriter
+from .band_scheduler import split_bands, run_bands, run_tasks, halo_rows
+from .model_backends import resolve_backend
+from .pixel_bridge import read_pixels, to_image
+from .output_encoder import PROFILES, DEFAULT_PROFILE, png_compress_level, save_with_profile, stream_report, report_encode
+from .animation import map_frames, write_animation
+from .admission import JobRejected, plan_job
+from .instrumentation import measure, stage, record
+
+# Bump whenever the output for the same input and parameters changes
+__version__ = '1.2.0'
+
+# Minimum source pixels of context kept around each tile: 3 for the LANCZOS
+# kernel plus enough to cover the Gaussian of the sharpening step after
+# resizing; tile_halo() widens it for larger sharpening radii
+TILE_HALO = 8
+
+# Unsharp mask settings of the enhancement step
+DEFAULT_SHARPEN_RADIUS = 1.0
+DEFAULT_SHARPEN_AMOUNT = 0.5
+
+# Outputs larger than this are upscaled tile by tile unless told otherwise
+TILED_OUTPUT_PIXELS = 64 * 1000 * 1000
+DEFAULT_TILE_SIZE = 256
+
+def gaussian_kernel(radius):
+    """Normalized float32 Gaussian weights reaching 4 sigma, as scipy.ndimage builds them"""
+    reach = int(4 * radius + 0.5)
+    if reach == 0:
+        return np.ones(1, dtype=np.float32)
+    offsets = np.arange(-reach, reach + 1)
+    weights = np.exp(-0.5 * (offsets / radius) ** 2)
+    return (weights / weights.sum()).astype(np.float32)
+
+def enhance_array(img_array, radius=DEFAULT_SHARPEN_RADIUS, amount=DEFAULT_SHARPEN_AMOUNT, out=None):
+    """
+    Apply the unsharp mask used to simulate AI enhancement
+    
+    Each channel is blurred on its own in float32, so the blur never mixes
+    colors, and the result is rounded back to uint8. Three float32 scratch
+    planes are reused for every channel and the result is written into out
+    (allocated when None; may be img_array itself), so no full-size float64
+    temporaries are created.
+    
+    The vertical blur pass is done as a weighted sum of shifted rows, which
+    reads memory contiguously and is much faster than a strided column pass.
+    
+    Args:
+        img_array (np.ndarray): H x W x C uint8 array
+        radius (float): Gaussian sigma of the blur, in output pixels
+        amount (float): Strength of the sharpening; 0 returns the input
+    """
+    from scipy import ndimage
+    
+    if out is None:
+        out = np.empty_like(img_array)
+    height, width = img_array.shape[:2]
+    kernel = gaussian_kernel(radius)
+    reach = len(kernel) // 2
+    
+    # The plane sits inside a buffer with reach mirrored rows above and below
+    padded = np.empty((height + 2 * reach, width), dtype=np.float32)
+    plane = padded[reach:reach + height]
+    blurred = np.empty((height, width), dtype=np.float32)
+    scratch = np.empty((height, width), dtype=np.float32)
+    
+    for channel in range(img_array.shape[2]):
+        np.copyto(plane, img_array[:, :, channel])
+        
+        if height > reach:
+            # Mirror the edge rows the way ndimage's 'reflect' mode does
+            padded[:reach] = plane[reach - 1::-1] if reach else plane[:0]
+            padded[reach + height:] = plane[height - reach:][::-1]
+            np.multiply(padded[:height], kernel[0], out=blurred)
+            for offset in range(1, len(kernel)):
+                np.multiply(padded[offset:offset + height], kernel[offset], out=scratch)
+                blurred += scratch
+            ndimage.correlate1d(blurred, kernel, axis=1, output=scratch, mode='reflect')
+        else:
+            # Too few rows to mirror once; let SciPy handle repeated reflection
+            ndimage.gaussian_filter(plane, sigma=radius, output=scratch)
+        
+        # Unsharp mask: plane + amount * (plane - blurred), computed in place
+        np.subtract(plane, scratch, out=scratch)
+        scratch *= np.float32(amount)
+        scratch += plane
+        np.clip(scratch, 0, 255, out=scratch)
+        np.rint(scratch, out=scratch)
+        np.copyto(out[:, :, channel], scratch, casting='unsafe')
+    return out
+
+def tile_halo(factor, radius=DEFAULT_SHARPEN_RADIUS):
+    """Source pixels of context a tile needs for LANCZOS plus the sharpening blur"""
+    # gaussian_filter reaches 4 sigma (rounded) output pixels from the center
+    blur_reach = int(4 * radius + 0.5)
+    return max(TILE_HALO, 3 + math.ceil(blur_reach / factor))
+
+def upscale_tiled(image, destination, factor, tile_size=DEFAULT_TILE_SIZE, profile=None,
+                  sharpen_radius=DEFAULT_SHARPEN_RADIUS, sharpen_amount=DEFAULT_SHARPEN_AMOUNT, threads=None):
+    """
+    Upscale and sharpen an image tile by tile, streaming rows into a PNG file
+    
+    Each tile is cut from the source with tile_halo() pixels of context, resized
+    and sharpened on its own, and only its core is kept, so the stitched result
+    matches the whole-image path without seams. Peak memory is bounded by one
+    band of tile_size source rows rather than by the output size. The tiles of
+    a band are processed in parallel on the band_scheduler thread pool.
+    
+    Returns:
+        dict: Encode report; only the PNG compression level of profile applies
+    """
+    width, height = image.size
+    out_width = width * factor
+    halo = tile_halo(factor, sharpen_radius)
+    # Decode before tiles are cropped from several threads
+    image.load()
+    
+    with PngStreamWriter(destination, out_width, height * factor, 'RGB', png_compress_level(profile)) as writer:
+        for y0 in range(0, height, tile_size):
+            y1 = min(y0 + tile_size, height)
+            band = np.empty(((y1 - y0) * factor, out_width, 3), dtype=np.uint8)
+            
+            def process_tile(x0, x1):
+                # Crop the tile with its halo, clamped to the image edges
+                cx0, cy0 = max(x0 - halo, 0), max(y0 - halo, 0)
+                cx1, cy1 = min(x1 + halo, width), min(y1 + halo, height)
+                tile = image.crop((cx0, cy0, cx1, cy1))
+                tile = tile.resize(((cx1 - cx0) * factor, (cy1 - cy0) * factor), Image.LANCZOS)
+                enhanced = enhance_array(read_pixels(tile), sharpen_radius, sharpen_amount)
+                
+                # Keep only the core of the tile
+                top, left = (y0 - cy0) * factor, (x0 - cx0) * factor
+                band[:, x0 * factor:x1 * factor] = enhanced[
+                    top:top + (y1 - y0) * factor, left:left + (x1 - x0) * factor
+                ]
+            
+            columns = [(x0, min(x0 + tile_size, width)) for x0 in range(0, width, tile_size)]
+            run_tasks(process_tile, columns, threads)
+            
+            writer.write_rows(band)
+    
+    return stream_report(writer, profile)
+
+def parse_factor(upscale_factor):
+    """Convert an upscale factor such as '4x' to an integer"""
+    return int(str(upscale_factor).replace('x', ''))
+
+def resolve_tile_size(new_size, tile_size):
+    """Pick the tile size for an output size; None tiles only very large outputs"""
+    if tile_size is None and new_size[0] * new_size[1] > TILED_OUTPUT_PIXELS:
+        return DEFAULT_TILE_SIZE
+    return tile_size
+
+def fit_model_output(result, size, factor):
+    """Resize a model's output with LANCZOS when its scale differs from factor"""
+    new_size = (size[0] * factor, size[1] * factor)
+    if result.size != new_size:
+        result = result.resize(new_size, Image.LANCZOS)
+    return result
+
+def model_upscale(image, factor, upscaler):
+    """
+    Upscale with a model backend, resizing with LANCZOS when the model's own
+    scale differs from the requested factor
+    """
+    return fit_model_output(to_image(upscaler.upscale(read_pixels(image))), image.size, factor)
+
+def ai_upscale_image(source, upscale_factor='2x', sharpen_radius=DEFAULT_SHARPEN_RADIUS,
+                     sharpen_amount=DEFAULT_SHARPEN_AMOUNT, threads=None, backend=None):
+    """
+    Upscale an in-memory image and return a PIL Image
+    
+    Args:
+        source: File path, bytes, file-like object or PIL Image
+        upscale_factor (str): '2x', '4x', or '8x'
+        sharpen_radius (float): Blur sigma of the unsharp mask, in output pixels
+        sharpen_amount (float): Unsharp mask strength; 0 disables sharpening
+        threads (int): Bands resized and sharpened in parallel; None uses the
+            configured band_scheduler thread count. The result does not
+            depend on it
+        backend: 'auto', 'heuristic', 'onnx' or an .onnx model path, see
+            model_backends; a model replaces resizing and sharpening
+    """
+    with stage('decode'):
+        image = load_image(source, 'RGB')
+        image.load()
+    factor = parse_factor(upscale_factor)
+    record(width=image.size[0], height=image.size[1], factor=factor)
+    
+    upscaler = resolve_backend('upscale', backend)
+    if upscaler is not None:
+        with stage('model'):
+            return model_upscale(image, factor, upscaler)
+    
+    width, height = image.size
+    new_size = (width * factor, height * factor)
+    
+    bands = split_bands(height, threads)
+    if len(bands) == 1:
+        # Use high-quality LANCZOS resampling for upscaling
+        # The resized Image is copied out once and dropped before sharpening
+        with stage('resize'):
+            upscaled = read_pixels(image.resize(new_size, Image.LANCZOS))
+        
+        # Apply unsharp mask for sharpening
+        # This simulates AI enhancement without heavy dependencies
+        with stage('sharpen'):
+            enhanced = enhance_array(upscaled, sharpen_radius, sharpen_amount)
+            del upscaled
+            return to_image(enhanced)
+    
+    # Each band is resized and sharpened with enough halo rows that its core
+    # matches the whole-image result exactly
+    halo = tile_halo(factor, sharpen_radius)
+    result = np.empty((new_size[1], new_size[0], 3), dtype=np.uint8)
+    
+    def process_band(y0, y1):
+        h0, h1 = halo_rows(y0, y1, halo, height)
+        rows = image.crop((0, h0, width, h1)).resize((new_size[0], (h1 - h0) * factor), Image.LANCZOS)
+        rows = enhance_array(read_pixels(rows), sharpen_radius, sharpen_amount)
+        result[y0 * factor:y1 * factor] = rows[(y0 - h0) * factor:(y1 - h0) * factor]
+    
+    with stage('upscale'):
+        run_bands(process_band, height, threads)
+    return to_image(result)
+
+def upscale_animation(source, destination, factor, profile=None, sharpen_radius=DEFAULT_SHARPEN_RADIUS,
+                      sharpen_amount=DEFAULT_SHARPEN_AMOUNT, upscaler=None, threads=None):
+    """
+    Upscale every frame of an animated GIF or WebP
+
+    Frames are decoded a chunk at a time and upscaled in parallel, one
+    frame per thread, then written as an animation with the source frame
+    durations.
+    
+    Returns:
+        dict: Encode report with the number of frames
+    """
+    image = load_image(source)
+    
+    def upscale_frame(frame):
+        frame = frame.convert('RGB')
+        if upscaler is not None:
+            return model_upscale(frame, factor, upscaler)
+        return ai_upscale_image(frame, factor, sharpen_radius, sharpen_amount, threads=1, backend='heuristic')
+    
+    return write_animation(image, map_frames(image, upscale_frame, threads), destination, profile)
+
+def ai_upscale_bytes(source, upscale_factor='2x', tile_size=None, profile=None,
+                     sharpen_radius=DEFAULT_SHARPEN_RADIUS, sharpen_amount=DEFAULT_SHARPEN_AMOUNT, backend=None):
+    """
+    Upscale an in-memory image and return the encoded bytes, tiling large outputs
+    
+    The header is checked against the limits in admission first, so jobs no
+    path fits raise JobRejected before anything is decoded.
+    """
+    if hasattr(source, 'read'):
+        source = source.read()
+    factor = parse_factor(upscale_factor)
+    upscaler = resolve_backend('upscale', backend)
+    plan = plan_job('ai_upscale', source, factor=factor, tile_size=tile_size, model=upscaler is not None)
+    image = load_image(source, 'RGB')
+    tile_size = (tile_size or DEFAULT_TILE_SIZE) if plan['path'] == 'tiled' else None
+    
+    buffer = io.BytesIO()
+    if tile_size:
+        upscale_tiled(image, buffer, factor, tile_size, profile, sharpen_radius, sharpen_amount)
+    else:
+        enhanced_image = ai_upscale_image(image, upscale_factor, sharpen_radius, sharpen_amount,
+                                          backend=upscaler or 'heuristic')
+        save_with_profile(enhanced_image, buffer, profile)
+    return buffer.getvalue()
+
+def ai_upscale(input_path, output_path, upscale_factor='2x', tile_size=None, profile=None,
+               sharpen_radius=DEFAULT_SHARPEN_RADIUS, sharpen_amount=DEFAULT_SHARPEN_AMOUNT, backend=None):
+    """
+    Upscale image with a super-resolution model when one is configured (see
+    model_backends), else with high-quality interpolation and enhancement
+    
+    Args:
+        input_path (str): Path to input image
+        output_path (str): Path to output image
+        upscale_factor (str): '2x', '4x', or '8x'
+        tile_size (int): Source tile size for bounded-memory upscaling.
+            None tiles automatically for very large outputs, 0 never tiles
+        profile (str): Encoder profile from output_encoder.PROFILES; tiled
+            outputs are always PNG, animated inputs are written as GIF or,
+            with the webp profile, WebP
+        sharpen_radius (float): Blur sigma of the unsharp mask, in output pixels
+        sharpen_amount (float): Unsharp mask strength; 0 disables sharpening
+        backend: 'auto', 'heuristic', 'onnx' or an .onnx model path; models
+            tile their input internally, so tile_size does not apply
+    
+    The header is checked against the limits in admission first: outputs
+    too large to hold in memory are tiled, and jobs no path fits raise
+    JobRejected before anything is decoded.
+    
+    Returns:
+        bool: True on success, False when upscaling fell back to plain LANCZOS
+    """
+    params = {'upscale_factor': upscale_factor, 'tile_size': tile_size, 'profile': profile,
+              'sharpen_radius': sharpen_radius, 'sharpen_amount': sharpen_amount, 'backend': backend}
+    with measure('ai_upscale', params):
+        try:
+            # Convert upscale factor to integer
+            factor = parse_factor(upscale_factor)
+            upscaler = resolve_backend('upscale', backend)
+            plan = plan_job('ai_upscale', input_path, factor=factor, tile_size=tile_size,
+                            model=upscaler is not None, profile=profile)
+            record(path=plan['path'], estimated_memory_mb=plan['memory_mb'],
+                   estimated_cpu_seconds=plan['cpu_seconds'])
+            
+            # Load the image (the first frame of an animation)
+            with stage('decode'):
+                image = load_image(input_path, 'RGB')
+                image.load()
+            original_size = image.size
+            new_size = (original_size[0] * factor, original_size[1] * factor)
+            record(width=original_size[0], height=original_size[1], factor=factor)
+        
+            tile_size = (tile_size or DEFAULT_TILE_SIZE) if plan['path'] == 'tiled' else None
+            if plan['path'] == 'animation':
+                # Every frame is upscaled and written as an animation
+                with stage('animation'):
+                    report = upscale_animation(input_path, output_path, factor, profile, sharpen_radius,
+                                               sharpen_amount, upscaler)
+                record(frames=report['frames'])
+            elif tile_size:
+                # Large outputs are built tile by tile to keep memory bounded
+                with stage('tiled'):
+                    report = upscale_tiled(image, output_path, factor, tile_size, profile, sharpen_radius,
+                                           sharpen_amount)
+            else:
+                enhanced_image = ai_upscale_image(image, upscale_factor, sharpen_radius, sharpen_amount,
+                                                  backend=upscaler or 'heuristic')
+            
+                # Save the result
+                with stage('encode'):
+                    report = save_with_profile(enhanced_image, output_path, profile)
+            record(output_width=new_size[0], output_height=new_size[1], tile_size=tile_size,
+                   output_bytes=report['bytes'], format=report['format'],
+                   backend=upscaler.name if upscaler is not None else 'heuristic')
+        
+            print(f"Image upscaled successfully: {output_path}")
+            report_encode(report)
+            print(f"Original size: {original_size}, New size: {new_size}")
+            if upscaler is not None:
+                print(f"Upscaled with model: {upscaler.model_path}")
+            else:
+                print("Note: Using high-quality interpolation. For AI enhancement, configure an upscaling model.")
+            return True
+        
+        except JobRejected:
+            # The fallback would decode the image the limits just rejected
+            raise
+        except ImportError:
+            print("SciPy not available. Using basic upscaling...")
+            # Fallback to basic upscaling without enhancement
+            try:
+                image = load_image(input_path, 'RGB')
+                original_size = image.size
+                factor = parse_factor(upscale_factor)
+                new_size = (original_size[0] * factor, original_size[1] * factor)
+            
+                # Use LANCZOS for high-quality upscaling
+                upscaled_image = image.resize(new_size, Image.LANCZOS)
+                save_with_profile(upscaled_image, output_path, profile)
+            
+                print(f"Image upscaled successfully: {output_path}")
+                print(f"Original size: {original_size}, New size: {new_size}")
+                record(fallback=True)
+                return False
+            
+            except Exception as e:
+                print(f"Basic upscaling failed: {e}")
+                sys.exit(1)
+            
+        except Exception as e:
+            print(f"Error during upscaling: {e}")
+            # Ultimate fallback
+            try:
+                image = load_image(input_path, 'RGB')
+                original_size = image.size
+                factor = parse_factor(upscale_factor)
+                new_size = (original_size[0] * factor, original_size[1] * factor)
+            
+                upscaled_image = image.resize(new_size, Image.LANCZOS)
+                save_with_profile(upscaled_image, output_path, profile)
+                print(f"Image upscaled with fallback method: {output_path}")
+                record(fallback=True)
+                return False
+            
+            except Exception as fallback_error:
+                print(f"Fallback upscaling failed: {fallback_error}")
+                sys.exit(1)
+
+def main(argv=None):
+    """Upscale one image from the command line"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print("Usage: python ai_upscale.py <input_path> <output_path> [upscale_factor] [tile_size] [profile]")
+        sys.exit(1)
+    
+    input_path = argv[0]
+    output_path = argv[1]
+    upscale_factor = argv[2] if len(argv) > 2 else '2x'
+    tile_size = int(argv[3]) if len(argv) > 3 and argv[3] != 'auto' else None
+    profile = argv[4] if len(argv) > 4 else DEFAULT_PROFILE
+    
+    # Validate upscale factor
+    if upscale_factor not in ['2x', '4x', '8x']:
+        print("Upscale factor must be 2x, 4x, or 8x")
+        sys.exit(1)
+    
+    # Validate encoder profile
+    if profile not in PROFILES:
+        print(f"Profile must be one of: {', '.join(PROFILES)}")
+        sys.exit(1)
+    
+    # Check if input file exists
+    if not os.path.exists(input_path):
+        print(f"Input file not found: {input_path}")
+        sys.exit(1)
+    
+    # Create output directory if it doesn't exist
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    try:
+        ai_upscale(input_path, output_path, upscale_factor, tile_size, profile)
+    except JobRejected as e:
+        print(f"Job rejected: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Persistent AI Worker
+Loads PIL, NumPy and SciPy once and processes newline-delimited JSON jobs
+for background removal, transparency and upscaling from stdin or a Unix socket
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import inspect
+import argparse
+import contextlib
+import socketserver
+
+# Loaded up front so every job reuses the same interpreter state
+from PIL import Image
+import numpy as np
+
+from .remove_background import remove_background, remove_background_image
+from .transparent_background import make_transparent, make_transparent_image, transparent_preview
+from .ai_upscale import ai_upscale, ai_upscale_image, parse_factor
+from .result_cache import ResultCache, configure_cache, get_cache
+from .output_encoder import read_offset
+from .admission import JobRejected, configure_limits, plan_job
+from .band_scheduler import configure_threads
+from .model_backends import MODEL_ENV, resolve_backend, backend_fingerprint
+from .variants import generate_variants
+from .instrumentation import capture_metrics
+from .raw_pixels import read_raw, write_raw
+
+try:
+    # Preload SciPy so the first upscale job does not pay for the import
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
+
+# Operations a job can request, keyed by function name
+OPERATIONS = {
+    'remove_background': remove_background,
+    'make_transparent': make_transparent,
+    'ai_upscale': ai_upscale,
+    'make_transparent_preview': transparent_preview,
+}
+
+# In-memory function of each operation, used by raw jobs
+RAW_OPERATIONS = {
+    'remove_background': remove_background_image,
+    'make_transparent': make_transparent_image,
+    'ai_upscale': ai_upscale_image,
+}
+
+# Model kind each operation can use through its backend parameter
+OPERATION_MODELS = {
+    'remove_background': 'segment',
+    'make_transparent': 'segment',
+    'ai_upscale': 'upscale',
+}
+
+def cache_params(function, input_path, output_path, params):
+    """Return the full parameter set of a call, defaults included"""
+    bound = inspect.signature(function).bind(input_path, output_path, **params)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    del arguments['input_path'], arguments['output_path']
+    if 'backend' in arguments:
+        # The same backend name can mean different models over time
+        arguments['backend'] = backend_fingerprint(OPERATION_MODELS[function.__name__], arguments['backend'])
+    return arguments
+
+def operation_version(function):
+    """Return the output version of the script that defines an operation"""
+    return getattr(sys.modules[function.__module__], '__version__', '0')
+
+def preload_models():
+    """Load the configured models now so the first job does not pay for it"""
+    # Notes about missing models must not end up on the reply stream
+    with contextlib.redirect_stdout(sys.stderr):
+        for kind in MODEL_ENV:
+            resolve_backend(kind)
+
+def add_offset(result, params, output_path):
+    """Report where a cropped PNG output sits on the original canvas"""
+    if params.get('optimize_output') == 'crop':
+        placement = read_offset(output_path)
+        if placement is not None:
+            result.update(placement)
+
+def run_variants_job(job, result, started):
+    """
+    Run a variants job: one input_path and the outputs listed in
+    params["variants"], see variants.generate_variants()
+
+    Variant outputs are not cached. Every variant is checked against the
+    admission limits before the input is decoded.
+    """
+    input_path = job.get('input_path')
+    params = dict(job.get('params') or {})
+    variants = params.pop('variants', None)
+
+    if not input_path or not variants:
+        result['error'] = "A variants job needs an input_path and params.variants"
+        return result
+
+    if not os.path.exists(input_path):
+        result['error'] = f"Input file not found: {input_path}"
+        return result
+
+    log = io.StringIO()
+    try:
+        for variant in variants:
+            output_dir = os.path.dirname(variant.get('output_path') or '')
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+
+        with contextlib.redirect_stdout(log):
+            if job.get('metrics'):
+                with capture_metrics() as captured:
+                    result['outputs'] = generate_variants(input_path, variants, **params)
+                result['metrics'] = captured[-1] if captured else None
+            else:
+                result['outputs'] = generate_variants(input_path, variants, **params)
+        result['ok'] = True
+    except JobRejected as e:
+        result['error'] = str(e)
+        result['rejected'] = True
+    except Exception as e:
+        result['error'] = str(e)
+
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    result['log'] = log.getvalue().splitlines()
+    return result
+
+def run_raw_job(job, result, started):
+    """
+    Run a job whose result is written as a raw buffer, see raw_pixels
+
+    The input is the raw buffer described by "input_raw" or the file at
+    "input_path". "output_raw" names the result file, e.g.
+    {"path": "/dev/shm/out.rgba"}, and the reply's "output_raw" describes
+    what was written. Raw jobs run in memory on the first frame, without
+    streaming or tiling, and are not cached.
+    """
+    operation = job.get('operation')
+    params = job.get('params') or {}
+    output = job.get('output_raw')
+    input_path = job.get('input_path')
+
+    if operation not in RAW_OPERATIONS:
+        result['error'] = f"{operation} has no raw form"
+        return result
+
+    if not isinstance(output, dict) or not output.get('path'):
+        result['error'] = "output_raw needs a path"
+        return result
+
+    if job.get('input_raw') is None and not (input_path and os.path.exists(input_path)):
+        result['error'] = "A raw job needs input_raw or an existing input_path"
+        return result
+
+    log = io.StringIO()
+    try:
+        source = read_raw(job['input_raw']) if job.get('input_raw') is not None else input_path
+        factor = parse_factor(params.get('upscale_factor', '2x')) if operation == 'ai_upscale' else 1
+        plan_job(operation, source, params.get('mode', 'color'), stream=False, factor=factor, tile_size=0)
+
+        output_dir = os.path.dirname(output['path'])
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with contextlib.redirect_stdout(log):
+            image = RAW_OPERATIONS[operation](source, **params)
+            result['output_raw'] = write_raw(image, output['path'])
+        result['ok'] = True
+    except JobRejected as e:
+        result['error'] = str(e)
+        result['rejected'] = True
+    except Exception as e:
+        result['error'] = str(e)
+
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    result['log'] = log.getvalue().splitlines()
+    return result
+
+def run_job(job):
+    """
+    Run a single job and return a structured result
+
+    A job looks like:
+        {"id": "1", "operation": "ai_upscale", "input_path": "in.jpg",
+         "output_path": "out.png", "params": {"upscale_factor": "2x"}}
+
+    A "variants" job writes several outputs of one input instead, see
+    run_variants_job(), and one with "output_raw" reads and writes raw
+    pixel buffers, see run_raw_job(). With "metrics": true the reply carries the stage measurements of the
+    operation, see instrumentation. With params.optimize_output set to
+    "crop" it carries the "offset" and "canvas" of a cropped PNG output.
+    """
+    job_id = job.get('id')
+    operation = job.get('operation')
+    started = time.perf_counter()
+
+    result = {
+        'id': job_id,
+        'operation': operation,
+        'ok': False,
+        'output_path': job.get('output_path'),
+    }
+
+    if operation == 'ping':
+        result['ok'] = True
+        result['pid'] = os.getpid()
+        return result
+
+    if operation == 'stats':
+        cache = get_cache()
+        result['ok'] = True
+        result['cache'] = cache.stats() if cache is not None else None
+        return result
+
+    if operation == 'variants':
+        return run_variants_job(job, result, started)
+
+    function = OPERATIONS.get(operation)
+    if function is None:
+        result['error'] = f"Unknown operation: {operation}"
+        return result
+
+    if job.get('output_raw') is not None:
+        return run_raw_job(job, result, started)
+
+    input_path = job.get('input_path')
+    output_path = job.get('output_path')
+    params = job.get('params') or {}
+
+    if not input_path or not output_path:
+        result['error'] = "Both input_path and output_path are required"
+        return result
+
+    if not os.path.exists(input_path):
+        result['error'] = f"Input file not found: {input_path}"
+        return result
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # The processing functions report progress with print(), which must not
+    # end up on the reply stream
+    log = io.StringIO()
+    try:
+        cache = get_cache()
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(
+                input_path, operation,
+                cache_params(function, input_path, output_path, params),
+                operation_version(function),
+            )
+            if cache.get(cache_key, output_path):
+                result['ok'] = True
+                result['cache'] = 'hit'
+                add_offset(result, params, output_path)
+                result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+                result['log'] = []
+                return result
+            result['cache'] = 'miss'
+
+        with contextlib.redirect_stdout(log):
+            if job.get('metrics'):
+                with capture_metrics() as captured:
+                    succeeded = function(input_path, output_path, **params)
+                result['metrics'] = captured[-1] if captured else None
+            else:
+                succeeded = function(input_path, output_path, **params)
+        result['ok'] = os.path.exists(output_path)
+        result['fallback'] = succeeded is False
+        if not result['ok']:
+            result['error'] = "No output file was produced"
+        else:
+            add_offset(result, params, output_path)
+            if cache_key and succeeded:
+                # Fallback outputs are never cached
+                cache.put(cache_key, output_path)
+    except JobRejected as e:
+        result['error'] = str(e)
+        result['rejected'] = True
+    except SystemExit:
+        result['error'] = "Processing failed"
+    except Exception as e:
+        result['error'] = str(e)
+
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    result['log'] = log.getvalue().splitlines()
+    return result
+
+def handle_line(line):
+    """Parse one request line and return the encoded reply line"""
+    try:
+        job = json.loads(line)
+        if not isinstance(job, dict):
+            raise ValueError("Job must be a JSON object")
+        result = run_job(job)
+    except ValueError as e:
+        result = {'id': None, 'ok': False, 'error': f"Invalid job: {e}"}
+    return json.dumps(result) + '\n'
+
+def serve_stdin():
+    """Read jobs from stdin and write one reply per line to stdout"""
+    stdout = sys.stdout
+    stdout.write(json.dumps({'ready': True, 'pid': os.getpid()}) + '\n')
+    stdout.flush()
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        stdout.write(handle_line(line))
+        stdout.flush()
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Handle newline-delimited jobs on one socket connection"""
+
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode('utf-8').strip()
+            if not line:
+                continue
+            self.wfile.write(handle_line(line).encode('utf-8'))
+            self.wfile.flush()
+
+def serve_socket(socket_path):
+    """Accept connections on a Unix socket and process their jobs"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    with socketserver.UnixStreamServer(socket_path, JobHandler) as server:
+        print(json.dumps({'ready': True, 'pid': os.getpid(), 'socket': socket_path}), flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+def main(argv=None):
+    """Serve jobs on stdin or a Unix socket until the input ends"""
+    parser = argparse.ArgumentParser(description="Serve AI jobs as newline-delimited JSON")
+    parser.add_argument('--socket', help="Listen on this Unix socket instead of stdin")
+    parser.add_argument('--cache-dir', help="Cache results in this directory")
+    parser.add_argument('--threads', type=int,
+                        help="Threads per image (default: IMAGEOPT_THREADS or the CPU count)")
+    parser.add_argument('--limits', help="JSON of per-operation admission limits (default: IMAGEOPT_LIMITS)")
+    args = parser.parse_args(argv)
+
+    if args.cache_dir:
+        configure_cache(ResultCache(args.cache_dir))
+    if args.threads:
+        configure_threads(args.threads)
+    if args.limits:
+        configure_limits(json.loads(args.limits))
+    preload_models()
+
+    if args.socket:
+        serve_socket(args.socket)
+    else:
+        serve_stdin()
+
+if __name__ == "__main__":
+    main()
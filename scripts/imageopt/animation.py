@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Animated Images
+Runs the AI tools over every frame of animated GIF and WebP inputs. Frames
+are decoded a chunk at a time and the frames of a chunk are processed in
+parallel, then written as an animation with the source frame durations.
+"""
+
+import os
+import time
+import numpy as np
+
+from .image_io import load_image
+from .pixel_bridge import rgba_pixels
+from .band_scheduler import get_threads, run_tasks
+from .background_mask import MODES, background_mask, detect_background_color, segment_background
+from .output_encoder import resolve_profile
+
+# Formats written as animations; other animated inputs are written as GIF
+ANIMATED_FORMATS = ('GIF', 'WEBP')
+
+# Encoder settings of each animated format
+ANIMATION_SETTINGS = {
+    'GIF': {'disposal': 2},
+    'WEBP': {'lossless': True, 'quality': 80, 'method': 4},
+}
+
+# A frame reuses the first frame's mask when at most this share of its
+# pixels changed
+STATIC_CHANGE_FRACTION = 0.25
+
+def is_animated(source):
+    """True when a path or bytes source holds more than one frame"""
+    image = load_image(source)
+    return getattr(image, 'n_frames', 1) > 1
+
+def animation_format(source_format, profile=None):
+    """Pick the output format: the webp profile writes WebP, others keep the source format"""
+    name, settings = resolve_profile(profile)
+    if settings['format'] == 'WEBP':
+        return 'WEBP'
+    return source_format if source_format in ANIMATED_FORMATS else 'GIF'
+
+def chunk_size(chunk_frames=None):
+    """Frames decoded and processed at once: twice the thread count by default"""
+    return chunk_frames or 2 * get_threads()
+
+def iter_frame_chunks(image, chunk_frames=None):
+    """
+    Yield lists of (RGBA PIL Image, duration in ms) covering every frame
+
+    Only one chunk of decoded frames is alive at a time. Frames are decoded
+    in order on the calling thread, since seeking is not thread safe.
+    """
+    chunk_frames = chunk_size(chunk_frames)
+    chunk = []
+    for index in range(getattr(image, 'n_frames', 1)):
+        image.seek(index)
+        frame = image.convert('RGBA')
+        # WebP only reports a frame's duration once it is loaded
+        chunk.append((frame, image.info.get('duration', 0)))
+        if len(chunk) == chunk_frames:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def map_frames(image, function, threads=None, chunk_frames=None):
+    """
+    Yield function(frame) for every RGBA frame, with info['duration'] set
+
+    The frames of a chunk are processed in parallel on the band_scheduler
+    pool, so function must not use the pool itself; pass threads=1 to the
+    operations it calls.
+    """
+    for chunk in iter_frame_chunks(image, chunk_frames):
+        results = run_tasks(function, [(frame,) for frame, _ in chunk], threads)
+        for result, (_, duration) in zip(results, chunk):
+            result.info['duration'] = duration
+            yield result
+
+class StaticMask:
+    """
+    Foreground alphas for the frames of one animation
+
+    The first frame is segmented in full. A later frame with the same
+    background color whose pixels mostly match the first frame reuses its
+    mask, and only the changed pixels are tested against the background
+    color. In 'color' mode this matches segmenting every frame; in the other
+    modes the changed pixels skip the edge and connectivity tests. Frames
+    that changed more are segmented on their own.
+    """
+
+    def __init__(self, mode='color'):
+        if mode not in MODES:
+            raise ValueError(f"Unknown segmentation mode: {mode}")
+        self.mode = mode
+        self.reference = None
+        self.reused = 0
+
+    def segment(self, pixels, threads=1):
+        """
+        Write the foreground alpha of an H x W x 4 RGBA array in place
+
+        Returns whether the reference mask was reused. Frames are segmented
+        on several threads, so callers add these up into reused.
+        """
+        if self.reference is not None:
+            ref_rgb, ref_alpha, color = self.reference
+            changed = np.any(pixels[:, :, :3] != ref_rgb, axis=2)
+            ys, xs = np.nonzero(changed)
+            if len(ys) <= STATIC_CHANGE_FRACTION * changed.size and detect_background_color(pixels) == color:
+                pixels[:, :, 3] = ref_alpha
+                background = background_mask(pixels[ys, xs, :3][np.newaxis], color)[0]
+                pixels[ys, xs, 3] = np.where(background, 0, 255)
+                return True
+        segment_background(pixels, background_alpha=0, mode=self.mode, threads=threads)
+        return False
+
+    def set_reference(self, pixels):
+        """Keep a segmented frame as the reference of later frames"""
+        self.reference = (pixels[:, :, :3].copy(), pixels[:, :, 3].copy(), detect_background_color(pixels))
+
+def segment_frames(image, mode='color', segmenter=None, threads=None, chunk_frames=None):
+    """
+    Yield (RGBA array whose alpha is the foreground alpha, duration) per frame
+
+    A model segments each chunk in batches. Without one, frames share the
+    first frame's mask where the background is static (see StaticMask).
+    """
+    mask = StaticMask(mode)
+    for chunk in iter_frame_chunks(image, chunk_frames):
+        frames = [rgba_pixels(frame)[0] for frame, _ in chunk]
+        if segmenter is not None:
+            for pixels, alpha in zip(frames, segmenter.predict_masks([frame for frame, _ in chunk])):
+                pixels[:, :, 3] = alpha
+        else:
+            if mask.reference is None:
+                # The first frame uses every thread and becomes the reference
+                mask.segment(frames[0], threads)
+                mask.set_reference(frames[0])
+                rest = frames[1:]
+            else:
+                rest = frames
+            mask.reused += sum(run_tasks(mask.segment, [(pixels,) for pixels in rest], threads))
+        for pixels, (_, duration) in zip(frames, chunk):
+            yield pixels, duration
+
+def save_animation(frames, destination, format, loop=0):
+    """
+    Encode an iterable of frames, each carrying info['duration'], as an animation
+
+    GIF frames are consumed one at a time as they are encoded, so a frame
+    generator keeps only the encoder's own palette frames alive. Pillow's
+    animated WebP writer needs every frame up front, so admission.plan_job()
+    charges WebP outputs for all of their frames.
+
+    Returns:
+        dict: format, frames, bytes written and encode_ms; encode_ms includes
+            the time spent producing lazily generated frames
+    """
+    frames = iter(frames)
+    first = next(frames)
+    count = 1
+
+    def counted(rest):
+        nonlocal count
+        for frame in rest:
+            count += 1
+            yield frame
+
+    options = dict(ANIMATION_SETTINGS[format])
+    started = time.perf_counter()
+    start = destination.tell() if hasattr(destination, 'write') else 0
+    if format == 'WEBP':
+        rest = list(counted(frames))
+        options['duration'] = [frame.info.get('duration', 0) for frame in [first] + rest]
+    else:
+        rest = counted(frames)
+    first.save(destination, format, save_all=True, append_images=rest, loop=loop, **options)
+    encode_ms = (time.perf_counter() - started) * 1000
+
+    if hasattr(destination, 'write'):
+        size = destination.tell() - start
+    else:
+        size = os.path.getsize(destination)
+    return {'format': format, 'frames': count, 'bytes': size, 'encode_ms': round(encode_ms, 2)}
+
+def write_animation(image, frames, destination, profile=None):
+    """
+    Write processed frames of image in its animated format and return an
+    output_encoder style report
+    """
+    name, _ = resolve_profile(profile)
+    report = save_animation(frames, destination, animation_format(image.format, name), image.info.get('loop', 0))
+    report['profile'] = name
+    return report
+
+def foreground_frames(image, finish, mode='color', segmenter=None, threads=None, chunk_frames=None):
+    """
+    Yield finish(pixels) for every frame of an animation, with info['duration'] set
+
+    finish receives an RGBA array whose alpha is the foreground alpha and
+    returns a PIL Image; it runs on the calling thread.
+    """
+    for pixels, duration in segment_frames(image, mode, segmenter, threads, chunk_frames):
+        result = finish(pixels)
+        result.info['duration'] = duration
+        yield result
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Background Mask Engine
+Shared corner-vote background detection and tolerance masking used by
+remove_background.py and transparent_background.py, plus an edge-aware
+segmentation that only removes background connected to the image border
+"""
+
+import numpy as np
+
+from .band_scheduler import run_bands, halo_rows
+
+# Maximum per-channel difference for a pixel to count as background
+DEFAULT_TOLERANCE = 30
+
+# Rows processed per block; keeps the scratch buffers small
+DEFAULT_BLOCK_ROWS = 256
+
+# Segmentation modes accepted by segment_background()
+#   color:     every pixel close to the background color
+#   connected: only background-colored regions reachable from the border
+#              without crossing a strong edge
+#   pyramid:   connected mode on a reduced copy, refined at full resolution
+#              only in a narrow band around the mask edges
+MODES = ('color', 'connected', 'pyramid')
+
+# Width in reduced pixels of the band re-evaluated at full resolution
+PYRAMID_BAND = 2
+
+# Step used to subsample arrays when no reduced copy is supplied
+PYRAMID_STEP = 4
+
+# Sobel gradient magnitude (on the lightly blurred luminance) above which a
+# pixel is treated as an object boundary in connected mode
+DEFAULT_EDGE_THRESHOLD = 80.0
+
+# Rows of context the edge detection needs around a band: 4 for the
+# sigma 1 Gaussian plus 1 for the Sobel kernel
+EDGE_HALO = 5
+
+def detect_background_color(pixels):
+    """
+    Guess the background color from the four corner pixels
+
+    Args:
+        pixels (np.ndarray): H x W x C uint8 array with at least 3 channels
+
+    Returns:
+        tuple: (r, g, b) of the most common corner color
+    """
+    corners = [
+        pixels[0, 0],    # top-left
+        pixels[0, -1],   # top-right
+        pixels[-1, 0],   # bottom-left
+        pixels[-1, -1]   # bottom-right
+    ]
+
+    # Find the most common corner color (likely background)
+    corner_colors = [tuple(int(value) for value in corner[:3]) for corner in corners]
+    return max(set(corner_colors), key=corner_colors.count)
+
+def iter_background_blocks(pixels, color, tolerance=DEFAULT_TOLERANCE, block_rows=DEFAULT_BLOCK_ROWS):
+    """
+    Yield (y0, y1, mask) for consecutive row blocks of an image
+
+    A pixel is background when every RGB channel is within tolerance of color,
+    i.e. inside [color - tolerance + 1, color + tolerance - 1]. The range test
+    is done as one uint8 subtraction whose wrap-around is intentional: values
+    below the range wrap to large numbers, so a single comparison checks both
+    ends without widening to a bigger dtype. Scratch buffers are allocated once
+    and reused for every block, so memory stays proportional to block_rows,
+    not image size. The yielded mask is only valid until the next block.
+    """
+    height, width = pixels.shape[:2]
+    block_rows = max(1, min(block_rows, height))
+
+    bounds = []
+    for value in color[:3]:
+        low = max(int(value) - tolerance + 1, 0)
+        high = min(int(value) + tolerance - 1, 255)
+        bounds.append((np.uint8(low), np.uint8(max(high - low, 0)), low <= high))
+
+    offset = np.empty((block_rows, width), dtype=np.uint8)
+    inside = np.empty((block_rows, width), dtype=bool)
+    mask = np.empty((block_rows, width), dtype=bool)
+
+    for y0 in range(0, height, block_rows):
+        y1 = min(y0 + block_rows, height)
+        rows = y1 - y0
+        for channel, (low, span, valid) in enumerate(bounds):
+            if not valid:
+                mask[:rows] = False
+                break
+            np.subtract(pixels[y0:y1, :, channel], low, out=offset[:rows])
+            if channel == 0:
+                np.less_equal(offset[:rows], span, out=mask[:rows])
+            else:
+                np.less_equal(offset[:rows], span, out=inside[:rows])
+                np.logical_and(mask[:rows], inside[:rows], out=mask[:rows])
+        yield y0, y1, mask[:rows]
+
+def background_mask(pixels, color, tolerance=DEFAULT_TOLERANCE, block_rows=DEFAULT_BLOCK_ROWS):
+    """Return an H x W boolean mask of background pixels"""
+    out = np.empty(pixels.shape[:2], dtype=bool)
+    for y0, y1, mask in iter_background_blocks(pixels, color, tolerance, block_rows):
+        out[y0:y1] = mask
+    return out
+
+def apply_background_alpha(pixels, color, background_alpha=0, foreground_alpha=255,
+                           tolerance=DEFAULT_TOLERANCE, block_rows=DEFAULT_BLOCK_ROWS, threads=1):
+    """
+    Write alpha in place: background pixels get background_alpha, all others
+    foreground_alpha
+
+    Args:
+        pixels (np.ndarray): H x W x 4 uint8 RGBA array, modified in place
+        threads (int): Bands processed in parallel; None uses the configured
+            band_scheduler thread count
+
+    Returns:
+        int: Number of background pixels
+    """
+    def apply_rows(y0, y1):
+        alpha = pixels[y0:y1, :, 3]
+        background_pixels = 0
+        for b0, b1, mask in iter_background_blocks(pixels[y0:y1], color, tolerance, block_rows):
+            block_alpha = alpha[b0:b1]
+            block_alpha.fill(foreground_alpha)
+            np.copyto(block_alpha, np.uint8(background_alpha), where=mask)
+            background_pixels += int(np.count_nonzero(mask))
+        return background_pixels
+
+    return sum(run_bands(apply_rows, pixels.shape[0], threads))
+
+def passable_rows(pixels, y0, y1, candidate, passable, edge_threshold=DEFAULT_EDGE_THRESHOLD):
+    """
+    Fill rows y0 to y1 of passable: candidate pixels away from strong edges
+
+    The edge detection reads EDGE_HALO extra rows on each side, so bands
+    computed separately match a whole-image pass exactly.
+    """
+    from scipy import ndimage
+
+    h0, h1 = halo_rows(y0, y1, EDGE_HALO, pixels.shape[0])
+    rows = pixels[h0:h1]
+
+    # Strong edges in the lightly blurred luminance separate regions
+    luminance = np.empty(rows.shape[:2], dtype=np.float32)
+    np.multiply(rows[:, :, 0], np.float32(0.299), out=luminance)
+    luminance += rows[:, :, 1] * np.float32(0.587)
+    luminance += rows[:, :, 2] * np.float32(0.114)
+    ndimage.gaussian_filter(luminance, sigma=1.0, output=luminance)
+    gradient = np.hypot(ndimage.sobel(luminance, axis=0), ndimage.sobel(luminance, axis=1))
+    np.logical_and(candidate[y0:y1], gradient[y0 - h0:y1 - h0] <= edge_threshold, out=passable[y0:y1])
+
+def connected_background_mask(pixels, color, tolerance=DEFAULT_TOLERANCE,
+                              edge_threshold=DEFAULT_EDGE_THRESHOLD, threads=1):
+    """
+    Return a boolean mask of background connected to the image border
+
+    Background-colored pixels are split into regions with strong Sobel edges
+    acting as walls, and only regions touching the border are kept, so
+    background-colored areas inside the subject stay opaque. Everything runs
+    as whole-array SciPy operations, so the cost is linear in the pixel count.
+    The color test and edge detection run in parallel bands; labeling needs
+    the whole image.
+    """
+    from scipy import ndimage
+
+    candidate = np.empty(pixels.shape[:2], dtype=bool)
+    passable = np.empty(pixels.shape[:2], dtype=bool)
+
+    def band(y0, y1):
+        candidate[y0:y1] = background_mask(pixels[y0:y1], color, tolerance)
+        passable_rows(pixels, y0, y1, candidate, passable, edge_threshold)
+
+    run_bands(band, pixels.shape[0], threads)
+
+    # Keep only regions that touch the border
+    labels, count = ndimage.label(passable)
+    if count == 0:
+        return passable
+    border = np.concatenate([labels[0], labels[-1], labels[:, 0], labels[:, -1]])
+    keep = np.zeros(count + 1, dtype=bool)
+    keep[border] = True
+    keep[0] = False
+    background = keep[labels]
+    del labels
+
+    # Grow one step back into background-colored edge pixels the walls took,
+    # then drop isolated specks
+    background = ndimage.binary_dilation(background, mask=candidate)
+    return ndimage.binary_opening(background, iterations=1)
+
+def upsample_mask(mask, shape, y0=0, y1=None):
+    """
+    Nearest-neighbour resize of a boolean mask to shape
+
+    Only output rows y0 to y1 are produced, so a strip can be upsampled
+    without building the full-size mask.
+    """
+    y1 = shape[0] if y1 is None else y1
+    rows = np.minimum(np.arange(y0, y1) * mask.shape[0] // shape[0], mask.shape[0] - 1)
+    cols = np.minimum(np.arange(shape[1]) * mask.shape[1] // shape[1], mask.shape[1] - 1)
+    return mask[rows[:, np.newaxis], cols[np.newaxis, :]]
+
+def pyramid_reduced_masks(reduced_pixels, color, tolerance=DEFAULT_TOLERANCE, threads=1):
+    """
+    Run the low-resolution half of the pyramid mode
+
+    Returns:
+        tuple: (reduced_mask, reduced_band) boolean arrays, where the band
+        marks reduced pixels near the mask boundary
+    """
+    from scipy import ndimage
+
+    reduced_mask = connected_background_mask(reduced_pixels, color, tolerance, threads=threads)
+
+    # Boundary band in reduced pixels; the image border itself is not an edge
+    grown = ndimage.binary_dilation(reduced_mask, iterations=PYRAMID_BAND)
+    shrunk = ndimage.binary_erosion(reduced_mask, iterations=PYRAMID_BAND, border_value=1)
+    return reduced_mask, grown & ~shrunk
+
+def refine_pyramid_rows(pixels, shape, y0, reduced_mask, reduced_band, color, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return the full-resolution mask for rows y0 to y0 + len(pixels)
+
+    Args:
+        pixels (np.ndarray): Full-resolution rows starting at y0
+        shape (tuple): (height, width) of the full image
+    """
+    y1 = y0 + pixels.shape[0]
+    mask = upsample_mask(reduced_mask, shape, y0, y1)
+    band = upsample_mask(reduced_band, shape, y0, y1)
+
+    # Re-test only the band pixels at full resolution
+    ys, xs = np.nonzero(band)
+    band_pixels = pixels[ys, xs, :3][np.newaxis]
+    mask[ys, xs] = background_mask(band_pixels, color, tolerance)[0]
+    return mask
+
+def pyramid_background_mask(pixels, reduced_pixels, color, tolerance=DEFAULT_TOLERANCE, threads=1):
+    """
+    Return a full-resolution background mask computed mostly at low resolution
+
+    The connected segmentation runs on reduced_pixels. Its result is upsampled
+    and only pixels in a narrow band around the mask boundary are re-tested
+    against the background color at full resolution; everything farther from
+    an edge keeps the low-resolution answer.
+    """
+    reduced_mask, reduced_band = pyramid_reduced_masks(reduced_pixels, color, tolerance, threads)
+    mask = np.empty(pixels.shape[:2], dtype=bool)
+
+    def refine(y0, y1):
+        mask[y0:y1] = refine_pyramid_rows(pixels[y0:y1], pixels.shape[:2], y0, reduced_mask, reduced_band,
+                                          color, tolerance)
+
+    run_bands(refine, pixels.shape[0], threads)
+    return mask
+
+def segment_background(pixels, background_alpha=0, mode='color', foreground_alpha=255,
+                       tolerance=DEFAULT_TOLERANCE, reduced_pixels=None, threads=None):
+    """
+    Detect the background of an RGBA array and write its alpha in place
+
+    Args:
+        pixels (np.ndarray): H x W x 4 uint8 RGBA array, modified in place
+        background_alpha (int): Alpha for background pixels
+        mode (str): One of MODES
+        reduced_pixels (np.ndarray): Reduced copy for pyramid mode; a strided
+            subsample of pixels is used when omitted
+        threads (int): Bands processed in parallel; None uses the configured
+            band_scheduler thread count. The result does not depend on it
+
+    Returns:
+        tuple: The detected (r, g, b) background color
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown segmentation mode: {mode}")
+
+    color = detect_background_color(pixels)
+    if mode == 'color':
+        apply_background_alpha(pixels, color, background_alpha, foreground_alpha, tolerance, threads=threads)
+    else:
+        if mode == 'pyramid':
+            if reduced_pixels is None:
+                reduced_pixels = pixels[::PYRAMID_STEP, ::PYRAMID_STEP]
+            mask = pyramid_background_mask(pixels, reduced_pixels, color, tolerance, threads)
+        else:
+            mask = connected_background_mask(pixels, color, tolerance, threads=threads)
+
+        def write_alpha(y0, y1):
+            alpha = pixels[y0:y1, :, 3]
+            alpha.fill(foreground_alpha)
+            np.copyto(alpha, np.uint8(background_alpha), where=mask[y0:y1])
+
+        run_bands(write_alpha, pixels.shape[0], threads)
+    return color
+
+def render_preview(pixels, mask):
+    """
+    Build the detection preview served by the transparent background tool:
+    background pixels are tinted red and semi-transparent
+
+    Returns:
+        np.ndarray: H x W x 4 uint8 RGBA preview
+    """
+    preview = np.empty(pixels.shape[:2] + (4,), dtype=np.uint8)
+    preview[:, :, :3] = pixels[:, :, :3]
+    preview[:, :, 3] = 255
+    preview[mask] = (255, 0, 0, 200)
+    return preview
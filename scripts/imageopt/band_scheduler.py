@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Band Scheduler
+Splits one image into horizontal bands and runs them on a shared thread
+pool. NumPy element-wise ops, scipy.ndimage filters and PIL resize all
+release the GIL, so bands of a single image use several cores at once.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Bands smaller than this cost more in scheduling than they save
+MIN_BAND_ROWS = 64
+
+# Thread count shared by all operations in this process, resolved on first use
+_threads = None
+# Thread pools by size, created on first use and kept for the process
+_executors = {}
+
+def configure_threads(threads):
+    """Use this many threads per image; None re-reads the environment"""
+    global _threads
+    for executor in _executors.values():
+        executor.shutdown(wait=False)
+    _executors.clear()
+    _threads = max(1, int(threads)) if threads else None
+
+def get_threads():
+    """Return the configured thread count (IMAGEOPT_THREADS, else the CPU count)"""
+    global _threads
+    if _threads is None:
+        _threads = max(1, int(os.environ.get('IMAGEOPT_THREADS') or os.cpu_count() or 1))
+    return _threads
+
+def pool_threads(processes):
+    """
+    Return the thread count for each of processes pool processes: None when
+    IMAGEOPT_THREADS is set, which the processes then read, else an even
+    share of the cores
+
+    Pass it to configure_threads() in the pool initializer rather than
+    changing the parent's environment.
+    """
+    if os.environ.get('IMAGEOPT_THREADS'):
+        return None
+    return max(1, (os.cpu_count() or 1) // processes)
+
+def get_executor(threads=None):
+    """
+    Return the process-wide thread pool of a size, created on first use
+
+    Callers asking for another size than get_threads(), e.g. a per-call
+    threads= argument, get a pool of their own that is reused too.
+    """
+    threads = threads or get_threads()
+    executor = _executors.get(threads)
+    if executor is None:
+        executor = _executors.setdefault(
+            threads, ThreadPoolExecutor(max_workers=threads, thread_name_prefix='imageopt-band'))
+    return executor
+
+def split_bands(height, threads=None, min_rows=MIN_BAND_ROWS):
+    """
+    Split rows 0 to height into (y0, y1) bands, one per thread at most
+
+    Bands are as even as possible and never shorter than min_rows, except
+    when the whole image is.
+    """
+    threads = threads or get_threads()
+    count = max(1, min(threads, height // max(min_rows, 1)))
+    edges = [height * index // count for index in range(count + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+def run_tasks(function, items, threads=None):
+    """
+    Call function(*item) for every item on the pool and return the results
+    in order
+
+    A single item, or threads=1, runs inline on the calling thread.
+    """
+    items = list(items)
+    threads = threads or get_threads()
+    if len(items) == 1 or threads == 1:
+        return [function(*item) for item in items]
+    return list(get_executor(threads).map(lambda item: function(*item), items))
+
+def run_bands(function, height, threads=None, min_rows=MIN_BAND_ROWS):
+    """
+    Call function(y0, y1) for every band and return the results in band order
+
+    Each call must only write its own rows of any shared output.
+    """
+    return run_tasks(function, split_bands(height, threads, min_rows), threads)
+
+def halo_rows(y0, y1, halo, height):
+    """Return the band widened by halo rows on each side, clamped to the image"""
+    return max(y0 - halo, 0), min(y1 + halo, height)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Batch Processing Script for AI Tools
+Runs background removal, transparency or upscaling over a directory, glob or
+manifest with a process pool, writing a per-item status report
+"""
+
+import sys
+import os
+import glob
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from .ai_worker import OPERATIONS, run_job
+from .band_scheduler import configure_threads, pool_threads
+
+# File extensions picked up when the source is a directory
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '.gif'}
+
+def glob_root(pattern):
+    """Return the leading directories of a glob pattern that hold no wildcards"""
+    parts = pattern.replace('\\', '/').split('/')
+    root = []
+    for part in parts[:-1]:
+        if glob.has_magic(part):
+            break
+        root.append(part)
+    return '/'.join(root) or ('/' if pattern.startswith('/') else '.')
+
+def iter_sources(source):
+    """
+    Yield (input_path, relative_name, params) for every image in a source
+
+    The source can be a directory (searched recursively), a glob pattern, or a
+    manifest file with one path per line. Manifest lines may also be JSON
+    objects with "input" and optional "output" and "params" keys. Directory
+    and glob matches keep their path below the directory, or below the part
+    of the pattern before the first wildcard, and only IMAGE_EXTENSIONS files
+    are picked up.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                    path = os.path.join(root, name)
+                    yield path, os.path.relpath(path, source), {}
+    elif glob.has_magic(source):
+        root = glob_root(source)
+        for path in sorted(glob.iglob(source, recursive=True)):
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+                yield path, os.path.relpath(path, root), {}
+    elif os.path.isfile(source):
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r') as manifest:
+            for line in manifest:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if line.startswith('{'):
+                    entry = json.loads(line)
+                    path = entry['input']
+                    name = entry.get('output') or os.path.basename(path)
+                    params = entry.get('params') or {}
+                else:
+                    path, name, params = line, os.path.basename(line), {}
+                if not os.path.isabs(path):
+                    path = os.path.join(base_dir, path)
+                yield path, name, params
+    else:
+        raise FileNotFoundError(f"Batch source not found: {source}")
+
+def check_outputs(sources, output_dir):
+    """
+    Raise ValueError when two inputs of a batch would write the same output,
+    e.g. photo.jpg and photo.png, or two manifest lines with the same name
+    """
+    seen = {}
+    for input_path, relative_name, _ in sources:
+        output_path = os.path.normcase(os.path.abspath(output_path_for(output_dir, relative_name)))
+        if output_path in seen:
+            raise ValueError(f"{seen[output_path]} and {input_path} would both be written to "
+                             f"{output_path_for(output_dir, relative_name)}")
+        seen[output_path] = input_path
+
+def output_path_for(output_dir, relative_name):
+    """Map an input's relative name to its PNG output path"""
+    stem = os.path.splitext(relative_name)[0]
+    return os.path.join(output_dir, stem + '.png')
+
+def load_completed(report_path):
+    """Return the set of inputs already processed successfully in a report"""
+    completed = set()
+    if not os.path.exists(report_path):
+        return completed
+
+    with open(report_path, 'r') as report:
+        for line in report:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A partially written last line from an interrupted run
+                continue
+            if entry.get('ok') and os.path.exists(entry.get('output_path', '')):
+                completed.add(entry['input_path'])
+    return completed
+
+def run_batch(operation, source, output_dir, params=None, workers=None,
+              max_in_flight=None, report_path=None, resume=False):
+    """
+    Process every image from a source and return a summary
+
+    At most max_in_flight jobs are queued in the pool at once so memory stays
+    flat no matter how large the batch is. The sources are listed up front,
+    so a batch whose inputs would overwrite each other's outputs fails with
+    ValueError before anything runs. A worker process that dies breaks the
+    pool: the inputs running on it are reported as failed and the rest of
+    the batch continues on a fresh pool.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {operation}")
+
+    params = params or {}
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    report_path = report_path or os.path.join(output_dir, 'batch_report.jsonl')
+
+    sources = list(iter_sources(source))
+    check_outputs(sources, output_dir)
+
+    os.makedirs(output_dir, exist_ok=True)
+    completed = load_completed(report_path) if resume else set()
+    summary = {'processed': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0}
+
+    def start_pool():
+        # Split the cores between pool processes instead of giving each
+        # process a thread per core
+        return ProcessPoolExecutor(max_workers=workers, initializer=configure_threads,
+                                   initargs=(pool_threads(workers),))
+
+    with open(report_path, 'a' if resume else 'w') as report:
+        executor = start_pool()
+        in_flight = {}
+
+        def record(finished):
+            nonlocal executor
+            for future in finished:
+                job, pool = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    result = {'input_path': job['input_path'], 'output_path': job['output_path'], 'ok': False,
+                              'error': "Worker process died"}
+                    # Every job of the broken pool lands here; restart it once
+                    if pool is executor:
+                        executor.shutdown(wait=False)
+                        executor = start_pool()
+                report.write(json.dumps({
+                    'input_path': result['input_path'],
+                    'output_path': result['output_path'],
+                    'ok': result['ok'],
+                    'error': result.get('error'),
+                    'elapsed_ms': result.get('elapsed_ms'),
+                }) + '\n')
+                report.flush()
+                summary['processed'] += 1
+                summary['succeeded' if result['ok'] else 'failed'] += 1
+
+        try:
+            for input_path, relative_name, item_params in sources:
+                if input_path in completed:
+                    summary['skipped'] += 1
+                    continue
+
+                job = {
+                    'id': relative_name,
+                    'operation': operation,
+                    'input_path': input_path,
+                    'output_path': output_path_for(output_dir, relative_name),
+                    'params': {**params, **item_params},
+                }
+                try:
+                    future = executor.submit(run_batch_job, job)
+                except BrokenProcessPool:
+                    # The pool broke since the last wait and the job never ran
+                    executor.shutdown(wait=False)
+                    executor = start_pool()
+                    future = executor.submit(run_batch_job, job)
+                in_flight[future] = (job, executor)
+
+                if len(in_flight) >= max_in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    record(finished)
+
+            finished, _ = wait(in_flight)
+            record(finished)
+        finally:
+            executor.shutdown()
+
+    summary['report_path'] = report_path
+    return summary
+
+def run_batch_job(job):
+    """Run one job in a pool process and tag the result with its input"""
+    result = run_job(job)
+    result['input_path'] = job['input_path']
+    return result
+
+def parse_params(pairs):
+    """Turn key=value strings into keyword arguments"""
+    params = {}
+    for pair in pairs or []:
+        if '=' not in pair:
+            raise ValueError(f"Parameters must look like key=value: {pair}")
+        key, value = pair.split('=', 1)
+        params[key] = int(value) if value.isdigit() else value
+    return params
+
+def main(argv=None):
+    """Run a batch from the command line"""
+    parser = argparse.ArgumentParser(description="Run an AI operation over many images")
+    parser.add_argument('operation', choices=sorted(OPERATIONS))
+    parser.add_argument('source', help="Directory, glob pattern or manifest file")
+    parser.add_argument('output_dir')
+    parser.add_argument('--param', action='append', metavar='KEY=VALUE',
+                        help="Operation parameter, e.g. upscale_factor=4x")
+    parser.add_argument('--workers', type=int, help="Process pool size (default: CPU count)")
+    parser.add_argument('--max-in-flight', type=int, help="Jobs queued at once (default: 2x workers)")
+    parser.add_argument('--report', help="Status report path (default: <output_dir>/batch_report.jsonl)")
+    parser.add_argument('--resume', action='store_true', help="Skip inputs that already succeeded")
+    parser.add_argument('--cache-dir', help="Share a result cache between pool processes")
+    args = parser.parse_args(argv)
+
+    if args.cache_dir:
+        # Pool processes configure their cache from the environment
+        os.environ['IMAGEOPT_CACHE_DIR'] = args.cache_dir
+
+    try:
+        summary = run_batch(
+            args.operation, args.source, args.output_dir,
+            params=parse_params(args.param),
+            workers=args.workers,
+            max_in_flight=args.max_in_flight,
+            report_path=args.report,
+            resume=args.resume,
+        )
+    except (ValueError, FileNotFoundError) as e:
+        print(e)
+        sys.exit(1)
+
+    print(f"Batch complete: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+          f"{summary['skipped']} skipped")
+    print(f"Report: {summary['report_path']}")
+    if summary['failed']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for AI Tools
+Times each stage of background removal, transparency and upscaling on
+reproducible synthetic inputs and compares runs against a saved baseline
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw
+import numpy as np
+
+from .output_encoder import PROFILES, DEFAULT_PROFILE, OPTIMIZE_OUTPUTS
+from .instrumentation import peak_rss_mb
+
+# Synthetic input sizes, from thumbnails up to 50 MP
+SIZES = {
+    'thumb': (256, 256),
+    '1mp': (1280, 800),
+    '12mp': (4000, 3000),
+    '24mp': (6000, 4000),
+    '50mp': (8660, 5774),
+}
+
+FORMATS = ['JPEG', 'PNG', 'WEBP']
+OPERATIONS = ['remove_background', 'make_transparent', 'ai_upscale']
+
+# Upscaling is skipped above this input size; 2x of 24 MP is already ~100 MP
+UPSCALE_MAX_PIXELS = 24 * 1000 * 1000
+
+DEFAULT_THRESHOLD = 0.15
+
+def make_synthetic_image(width, height, alpha=False, seed=0):
+    """
+    Build a deterministic test image: a flat, slightly noisy background with
+    a few solid and gradient shapes in the middle
+    """
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(-3, 4, size=(height, width, 1), dtype=np.int16)
+    base = np.clip(np.int16(235) + noise, 0, 255).astype(np.uint8)
+    image = Image.fromarray(np.repeat(base, 3, axis=2), 'RGB')
+
+    draw = ImageDraw.Draw(image)
+    draw.ellipse([width * 0.2, height * 0.2, width * 0.6, height * 0.8], fill=(200, 40, 40))
+    draw.rectangle([width * 0.5, height * 0.3, width * 0.8, height * 0.7], fill=(30, 90, 180))
+    gradient = np.linspace(0, 255, max(width // 5, 1), dtype=np.uint8)
+    strip = np.tile(gradient, (max(height // 10, 1), 1))
+    image.paste(Image.fromarray(strip, 'L').convert('RGB'), (width * 2 // 5, height * 4 // 5))
+
+    if alpha:
+        image = image.convert('RGBA')
+        # Fade the alpha towards the right edge
+        fade = np.linspace(255, 64, width, dtype=np.uint8)
+        image.putalpha(Image.fromarray(np.tile(fade, (height, 1)), 'L'))
+    return image
+
+def build_cases(sizes, formats, operations, profiles=(DEFAULT_PROFILE,), optimize_outputs=(None,)):
+    """List every (operation, size, format, alpha, profile, optimize_output) combination to benchmark"""
+    cases = []
+    for operation in operations:
+        for size in sizes:
+            width, height = SIZES[size]
+            if operation == 'ai_upscale' and width * height > UPSCALE_MAX_PIXELS:
+                continue
+            for format in formats:
+                for alpha in [False, True]:
+                    if alpha and format == 'JPEG':
+                        continue
+                    for profile in profiles:
+                        for optimize_output in optimize_outputs:
+                            # Upscaled outputs are opaque RGB, which the optimizations leave alone
+                            if optimize_output and operation == 'ai_upscale':
+                                continue
+                            cases.append({'operation': operation, 'size': size, 'format': format,
+                                          'alpha': alpha, 'profile': profile, 'optimize_output': optimize_output})
+    return cases
+
+def case_id(case):
+    """Stable identifier used to match cases between runs"""
+    alpha = 'alpha' if case['alpha'] else 'opaque'
+    identifier = f"{case['operation']}/{case['size']}/{case['format'].lower()}/{alpha}"
+    # The default profile keeps the plain id so older baselines still match
+    profile = case.get('profile', DEFAULT_PROFILE)
+    if profile != DEFAULT_PROFILE:
+        identifier = f"{identifier}/{profile}"
+    if case.get('optimize_output'):
+        identifier = f"{identifier}/{case['optimize_output']}"
+    return identifier
+
+def prepare_input(case, work_dir):
+    """Write the synthetic input for a case once and return its path"""
+    alpha = 'alpha' if case['alpha'] else 'opaque'
+    path = os.path.join(work_dir, f"{case['size']}_{alpha}.{case['format'].lower()}")
+    if not os.path.exists(path):
+        width, height = SIZES[case['size']]
+        make_synthetic_image(width, height, case['alpha']).save(path, case['format'])
+    return path
+
+def run_stages(operation, input_path, output_path, profile=None, optimize_output=None):
+    """
+    Run one operation through the function the tools ship and read its stage
+    breakdown from instrumentation
+
+    Returns:
+        tuple: (per-stage wall times in seconds, total wall time in seconds,
+            encoded output size in bytes)
+    """
+    from .instrumentation import capture_metrics
+
+    if operation == 'ai_upscale':
+        from .ai_upscale import ai_upscale
+
+        def run():
+            return ai_upscale(input_path, output_path, '2x', profile=profile)
+    else:
+        if operation == 'remove_background':
+            from .remove_background import remove_background as process
+        else:
+            from .transparent_background import make_transparent as process
+
+        def run():
+            return process(input_path, output_path, profile=profile, optimize_output=optimize_output)
+
+    log = io.StringIO()
+    with capture_metrics() as captured, contextlib.redirect_stdout(log):
+        succeeded = run()
+    if succeeded is False:
+        raise RuntimeError(f"{operation} fell back to a plain conversion: {log.getvalue().strip()}")
+
+    metrics = captured[-1]
+    stages = {name: entry['wall_ms'] / 1000 for name, entry in metrics['stages'].items()}
+    return stages, metrics['wall_ms'] / 1000, os.path.getsize(output_path)
+
+def run_case(case, input_path, repeat):
+    """Benchmark one case in the current process; meant to run in a fresh child"""
+    from .result_cache import configure_cache
+
+    # Every run segments from scratch instead of reusing a stored mask
+    configure_cache(None)
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_path = os.path.join(work_dir, 'output')
+        runs = [run_stages(case['operation'], input_path, output_path, case.get('profile'),
+                           case.get('optimize_output'))
+                for _ in range(repeat)]
+
+    # Report the median run to damp scheduling noise
+    runs.sort(key=lambda run: run[1])
+    stages, wall, output_bytes = runs[len(runs) // 2]
+    width, height = SIZES[case['size']]
+    megapixels = width * height / 1e6
+
+    return {
+        'id': case_id(case),
+        **case,
+        'megapixels': round(megapixels, 3),
+        'stages': {name: round(seconds, 6) for name, seconds in stages.items()},
+        'wall_s': round(wall, 6),
+        'mp_per_s': round(megapixels / wall, 3) if wall else None,
+        'output_bytes': output_bytes,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+def run_benchmark(cases, repeat=3):
+    """Run every case in its own process so peak RSS is measured per case"""
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for case in cases:
+            input_path = prepare_input(case, work_dir)
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_case, case, input_path, repeat).result()
+            print(f"{result['id']:<54} {result['wall_s'] * 1000:>10.1f} ms "
+                  f"{result['mp_per_s'] or 0:>8.2f} MP/s {result['peak_rss_mb']:>8.1f} MB "
+                  f"{result['output_bytes'] / 1024:>10.1f} KB")
+            results.append(result)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pillow': Image.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+def compare_results(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two benchmark runs and return the regressions
+
+    A case regresses when its wall time or peak RSS grew by more than
+    threshold (a fraction, 0.15 = 15%) over the baseline.
+    """
+    baseline_by_id = {result['id']: result for result in baseline['results']}
+    regressions = []
+
+    for result in current['results']:
+        previous = baseline_by_id.get(result['id'])
+        if previous is None:
+            continue
+        for metric in ['wall_s', 'peak_rss_mb']:
+            before, after = previous[metric], result[metric]
+            if before and after > before * (1 + threshold):
+                regressions.append({
+                    'id': result['id'],
+                    'metric': metric,
+                    'baseline': before,
+                    'current': after,
+                    'change': round(after / before - 1, 3),
+                })
+    return regressions
+
+def optimization_gains(results):
+    """
+    Compare each optimized case with the same case written as is
+
+    Returns:
+        list: One dict per optimized case with the output bytes and encode
+            time before and after
+    """
+    plain = {result['id']: result for result in results if not result.get('optimize_output')}
+    gains = []
+    for result in results:
+        if not result.get('optimize_output'):
+            continue
+        before = plain.get(case_id(dict(result, optimize_output=None)))
+        if before is None:
+            continue
+        gains.append({
+            'id': result['id'],
+            'bytes_before': before['output_bytes'],
+            'bytes_after': result['output_bytes'],
+            'encode_s_before': before['stages'].get('encode'),
+            'encode_s_after': result['stages'].get('encode'),
+        })
+    return gains
+
+def main(argv=None):
+    """Run the benchmark from the command line"""
+    parser = argparse.ArgumentParser(description="Benchmark the AI image operations")
+    parser.add_argument('--sizes', default=','.join(SIZES), help="Comma-separated sizes: " + ', '.join(SIZES))
+    parser.add_argument('--formats', default=','.join(FORMATS), help="Comma-separated input formats")
+    parser.add_argument('--operations', default=','.join(OPERATIONS), help="Comma-separated operations")
+    parser.add_argument('--profiles', default=DEFAULT_PROFILE,
+                        help="Comma-separated encoder profiles: " + ', '.join(PROFILES))
+    parser.add_argument('--optimize', action='store_true',
+                        help="Also run every masked case with each output optimization: " + ', '.join(OPTIMIZE_OUTPUTS))
+    parser.add_argument('--quick', action='store_true', help="Only run the thumb and 1mp sizes")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case; the median is reported")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to save results")
+    parser.add_argument('--baseline', help="Compare against a previous results file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown or memory growth before flagging (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    sizes = ['thumb', '1mp'] if args.quick else args.sizes.split(',')
+    for size in sizes:
+        if size not in SIZES:
+            print(f"Unknown size: {size}")
+            sys.exit(1)
+
+    profiles = args.profiles.split(',')
+    for profile in profiles:
+        if profile not in PROFILES:
+            print(f"Unknown profile: {profile}")
+            sys.exit(1)
+
+    optimize_outputs = (None,) + OPTIMIZE_OUTPUTS if args.optimize else (None,)
+    cases = build_cases(sizes, args.formats.upper().split(','), args.operations.split(','), profiles,
+                        optimize_outputs)
+    results = run_benchmark(cases, args.repeat)
+
+    if args.optimize:
+        results['optimization_gains'] = optimization_gains(results['results'])
+        print("\nOutput optimization gains:")
+        for gain in results['optimization_gains']:
+            print(f"  {gain['id']:<60} {gain['bytes_before'] / 1024:>9.1f} -> {gain['bytes_after'] / 1024:>9.1f} KB "
+                  f"{gain['encode_s_before'] * 1000:>8.1f} -> {gain['encode_s_after'] * 1000:>8.1f} ms encode")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression['id']} {regression['metric']}: "
+                      f"{regression['baseline']} -> {regression['current']} (+{regression['change']:.0%})")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
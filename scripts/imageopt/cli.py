@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+imageopt Command Line
+One entry point for all tools: python3 -m imageopt <command> [args]. A
+command's module is imported only once the command is chosen, so help and
+queue commands never load PIL or NumPy, and SciPy is loaded only by the
+commands that use it.
+"""
+
+import sys
+import importlib
+
+# Command name -> (module, summary); the arguments after the command are
+# passed to the module's main()
+COMMANDS = {
+    'remove-background': ('remove_background', "Remove the background of an image"),
+    'transparent': ('transparent_background', "Make the background of an image transparent"),
+    'upscale': ('ai_upscale', "Upscale an image 2x, 4x or 8x"),
+    'variants': ('variants', "Write several variants of an image with one decode"),
+    'worker': ('ai_worker', "Serve jobs as newline-delimited JSON"),
+    'serve': ('http_service', "Serve the operations over HTTP"),
+    'loadtest': ('load_generator', "Measure throughput and latency of the HTTP service"),
+    'queue': ('job_queue', "Submit, inspect and run queued jobs"),
+    'batch': ('batch_process', "Run an operation over many images"),
+    'benchmark': ('benchmark_ai_tools', "Measure speed and memory"),
+}
+
+# Cold import time allowed for the package and this module, checked by
+# test_ai_tools.py so new top-level imports cannot slow every command down
+STARTUP_BUDGET_MS = 50
+
+def usage():
+    """Return the list of commands"""
+    lines = ["Usage: python3 -m imageopt <command> [args]", "", "Commands:"]
+    width = max(len(name) for name in COMMANDS)
+    for name, (module, summary) in COMMANDS.items():
+        lines.append(f"  {name.ljust(width)}  {summary}")
+    lines.append("")
+    lines.append("Run a command with --help, or without arguments, for its usage.")
+    return '\n'.join(lines)
+
+def load_command(name):
+    """Import and return the module implementing a command"""
+    module, summary = COMMANDS[name]
+    return importlib.import_module(f'.{module}', __package__)
+
+def main(argv=None):
+    """Dispatch to a command and return the exit code"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0 if argv else 1
+
+    name, args = argv[0], argv[1:]
+    if name not in COMMANDS:
+        print(f"Unknown command: {name}")
+        print(usage())
+        return 1
+
+    # argparse names the program after argv[0]
+    sys.argv[0] = f"python3 -m imageopt {name}"
+    return load_command(name).main(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
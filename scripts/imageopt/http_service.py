@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+HTTP Service for AI Tools
+A small asyncio HTTP/1.1 server for background removal, transparency and
+upscaling. Uploads arrive as multipart/form-data, the work runs on a pool
+of warm worker processes (see ai_worker.run_job) and the encoded result is
+streamed back from disk. Only the standard library is used, and the server
+process itself never loads PIL or NumPy.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import shutil
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# URL path -> operation, matching the Next.js routes under pages/api/ai
+ROUTES = {
+    '/remove-background': 'remove_background',
+    '/transparent-background': 'make_transparent',
+    '/ai-upscale': 'ai_upscale',
+}
+
+# Form fields each operation accepts besides the 'file' upload, with the
+# type their text is parsed as
+FIELD_TYPES = {
+    'remove_background': {'background_type': str, 'background_color': str, 'mode': str, 'profile': str,
+                          'optimize_output': str},
+    'make_transparent': {'transparency_level': int, 'mode': str, 'profile': str, 'optimize_output': str},
+    'ai_upscale': {'upscale_factor': str, 'tile_size': int, 'profile': str},
+}
+
+# Form field holding the image, as in the Next.js routes
+FILE_FIELD = 'file'
+
+# Matches the 50MB upload limit of the web app
+DEFAULT_MAX_BODY_BYTES = 50 * 1024 * 1024
+
+# Jobs queued per worker process before new uploads get 503
+DEFAULT_PENDING_PER_PROCESS = 4
+
+# Seconds to wait for the headers of the next request on a connection
+KEEPALIVE_TIMEOUT = 15
+
+# Seconds allowed for reading a request body
+BODY_TIMEOUT = 60
+
+# Seconds uploads in progress get to finish when the service stops
+SHUTDOWN_TIMEOUT = 30
+
+# Bytes read from the output file per write
+RESPONSE_CHUNK_SIZE = 256 * 1024
+
+# Largest header block accepted
+MAX_HEADER_BYTES = 64 * 1024
+
+# Result errors that are the client's fault
+INVALID_PARAMS = 'invalid_params'
+
+STATUS_TEXT = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 411: 'Length Required',
+    413: 'Content Too Large', 415: 'Unsupported Media Type', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+# Leading bytes of each output format
+CONTENT_TYPES = [
+    (b'\x89PNG', 'image/png'),
+    (b'\xff\xd8', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'RIFF', 'image/webp'),
+]
+
+class HttpError(Exception):
+    """A request that gets an error response instead of running"""
+
+    def __init__(self, status, message, close=False):
+        super().__init__(message)
+        self.status = status
+        self.close = close
+
+def parse_header_params(value):
+    """Split 'type; key=value; ...' into ('type', {key: value})"""
+    main, *rest = value.split(';')
+    params = {}
+    for item in rest:
+        if '=' in item:
+            key, item_value = item.split('=', 1)
+            params[key.strip().lower()] = item_value.strip().strip('"')
+    return main.strip().lower(), params
+
+def parse_multipart(body, boundary):
+    """
+    Parse a multipart/form-data body
+
+    Returns:
+        dict: name -> (filename or None, bytes); the file parts are
+            memoryview slices of body, so they are not copied
+
+    Raises:
+        HttpError: For a malformed body
+    """
+    delimiter = b'--' + boundary.encode('latin-1')
+    view = memoryview(body)
+    parts = {}
+    position = body.find(delimiter)
+    if position < 0:
+        raise HttpError(400, "Multipart body has no boundary")
+    while True:
+        position += len(delimiter)
+        if body[position:position + 2] == b'--':
+            return parts
+        headers_end = body.find(b'\r\n\r\n', position)
+        following = body.find(b'\r\n' + delimiter, headers_end)
+        if headers_end < 0 or following < 0:
+            raise HttpError(400, "Truncated multipart body")
+
+        name = filename = None
+        for line in body[position:headers_end].decode('utf-8', 'replace').split('\r\n'):
+            key, _, value = line.partition(':')
+            if key.strip().lower() == 'content-disposition':
+                _, params = parse_header_params(value)
+                name, filename = params.get('name'), params.get('filename')
+        if name is not None:
+            parts[name] = (filename, view[headers_end + 4:following])
+        position = following + 2
+
+def parse_fields(operation, parts):
+    """
+    Convert the text fields of an upload to the operation's keyword arguments
+
+    Raises:
+        HttpError: For unknown fields or values of the wrong type
+    """
+    types = FIELD_TYPES[operation]
+    params = {}
+    for name, (filename, value) in parts.items():
+        if name == FILE_FIELD:
+            continue
+        if name not in types:
+            raise HttpError(400, f"Unknown field for {operation}: {name}")
+        try:
+            text = bytes(value).decode('utf-8').strip()
+        except UnicodeDecodeError:
+            raise HttpError(400, f"Invalid {name}: not UTF-8 text")
+        if text == '':
+            continue
+        try:
+            params[name] = types[name](text)
+        except ValueError:
+            raise HttpError(400, f"Invalid {name}: {text}")
+    return params
+
+def content_type_for(head):
+    """Pick the Content-Type of an output file from its first bytes"""
+    for magic, content_type in CONTENT_TYPES:
+        if head.startswith(magic):
+            return content_type
+    return 'application/octet-stream'
+
+def check_params(operation, params):
+    """
+    Validate parameter values the way the command lines do
+
+    Raises:
+        ValueError: For an unknown mode, profile, optimization, level or
+            factor, or a negative or too small tile size
+    """
+    from .background_mask import MODES
+    from .output_encoder import PROFILES, OPTIMIZE_OUTPUTS
+
+    if params.get('mode', 'color') not in MODES:
+        raise ValueError(f"Mode must be one of: {', '.join(MODES)}")
+    if params.get('profile') is not None and params['profile'] not in PROFILES:
+        raise ValueError(f"Profile must be one of: {', '.join(PROFILES)}")
+    if params.get('optimize_output') is not None and params['optimize_output'] not in OPTIMIZE_OUTPUTS:
+        raise ValueError(f"Output optimization must be one of: {', '.join(OPTIMIZE_OUTPUTS)}")
+    if params.get('background_type', 'transparent') not in ('transparent', 'solid'):
+        raise ValueError("Background type must be 'transparent' or 'solid'")
+    if not 0 <= params.get('transparency_level', 100) <= 100:
+        raise ValueError("Transparency level must be between 0 and 100")
+    if params.get('upscale_factor', '2x') not in ('2x', '4x', '8x'):
+        raise ValueError("Upscale factor must be 2x, 4x, or 8x")
+    if params.get('tile_size'):
+        from .ai_upscale import tile_halo
+        # Tiles smaller than their halo would be mostly overlap
+        halo = tile_halo(int(params.get('upscale_factor', '2x')[:-1]))
+        if params['tile_size'] < halo:
+            raise ValueError(f"Tile size must be 0 (no tiling) or at least {halo} pixels")
+
+def warm_worker(threads=None):
+    """
+    Pool initializer: set the thread count, see band_scheduler.pool_threads(),
+    and load PIL, NumPy, SciPy and the configured models once
+    """
+    from .ai_worker import preload_models
+    from .band_scheduler import configure_threads
+    configure_threads(threads)
+    preload_models()
+
+def run_upload(operation, input_path, output_path, params):
+    """Run one upload in a pool process and return the ai_worker result"""
+    from .ai_worker import run_job
+
+    try:
+        check_params(operation, params)
+    except ValueError as e:
+        return {'operation': operation, 'ok': False, 'error': str(e), INVALID_PARAMS: True}
+    return run_job({'id': os.path.basename(os.path.dirname(input_path)), 'operation': operation,
+                    'input_path': input_path, 'output_path': output_path, 'params': params})
+
+def write_upload(path, data):
+    """Write an uploaded file to disk"""
+    with open(path, 'wb') as f:
+        f.write(data)
+
+class ImageService:
+    """
+    Serve the AI operations over HTTP from one event loop
+
+    POST /remove-background, /transparent-background or /ai-upscale with a
+    multipart 'file' and the operation's parameters as text fields; the
+    response body is the encoded image. GET /health reports the pool.
+    Connections are kept alive between requests.
+    """
+
+    def __init__(self, processes=None, max_pending=None, max_body_bytes=DEFAULT_MAX_BODY_BYTES, work_dir=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.max_pending = max_pending or self.processes * DEFAULT_PENDING_PER_PROCESS
+        self.max_body_bytes = max_body_bytes
+        self.work_dir = work_dir
+        self.pending = 0
+        self.served = 0
+        self.executor = None
+        self.server = None
+        self.closing = False
+        # Open connections (writer -> handler task) and those mid-request
+        self.connections = {}
+        self.busy = set()
+
+    def start_pool(self, wait=True):
+        """Start the worker processes, splitting the cores between them"""
+        from .band_scheduler import pool_threads
+        self.executor = ProcessPoolExecutor(max_workers=self.processes, initializer=warm_worker,
+                                            initargs=(pool_threads(self.processes),))
+        # Submitting once starts every process, so none is cold for the first uploads
+        started = self.executor.submit(os.getpid)
+        if wait:
+            started.result()
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """Start the pool and listen; returns the bound (host, port)"""
+        if self.executor is None:
+            self.start_pool()
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        """Stop listening, let uploads in progress finish and shut the pool down"""
+        self.closing = True
+        if self.server is not None:
+            self.server.close()
+        # Idle keep-alive connections are closed now, busy ones after their response
+        for writer in list(self.connections):
+            if writer not in self.busy:
+                writer.close()
+        if self.connections:
+            await asyncio.wait(list(self.connections.values()), timeout=SHUTDOWN_TIMEOUT)
+        if self.server is not None:
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until either side closes it"""
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while not self.closing:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.send_json(writer, 400, {'error': "Headers too large"}, close=True)
+                    break
+                self.busy.add(writer)
+                try:
+                    if not await self.handle_request(head, reader, writer):
+                        break
+                except ConnectionError:
+                    break
+                finally:
+                    self.busy.discard(writer)
+        finally:
+            del self.connections[writer]
+            writer.close()
+
+    async def handle_request(self, head, reader, writer):
+        """Serve one request; returns whether the connection stays open"""
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            await self.send_json(writer, 400, {'error': "Malformed request line"}, close=True)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        keep_alive = keep_alive and not self.closing
+        path = target.split('?', 1)[0]
+        # A body left unread would be parsed as the next request
+        unread_body = headers.get('content-length', '0') != '0' or 'transfer-encoding' in headers
+
+        try:
+            if path == '/health':
+                if method != 'GET':
+                    raise HttpError(405, "Use GET")
+                await self.send_json(writer, 200, self.health(), close=not keep_alive)
+                return keep_alive
+            operation = ROUTES.get(path)
+            if operation is None:
+                raise HttpError(404, f"Unknown path: {path}")
+            if method != 'POST':
+                raise HttpError(405, "Use POST")
+            # From here on the body is read, or the error closes the connection
+            unread_body = False
+            await self.run_operation(operation, headers, reader, writer, keep_alive)
+            return keep_alive
+        except HttpError as e:
+            close = not keep_alive or e.close or unread_body
+            await self.send_json(writer, e.status, {'error': str(e)}, close=close)
+            return not close
+
+    async def read_body(self, headers, reader):
+        """Read a request body of a declared length"""
+        if 'transfer-encoding' in headers or 'content-length' not in headers:
+            raise HttpError(411, "Uploads need a Content-Length", close=True)
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length", close=True)
+        if length > self.max_body_bytes:
+            raise HttpError(413, f"Uploads are limited to {self.max_body_bytes} bytes", close=True)
+        try:
+            return await asyncio.wait_for(reader.readexactly(length), BODY_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            raise HttpError(400, "Incomplete request body", close=True)
+
+    async def run_operation(self, operation, headers, reader, writer, keep_alive):
+        """
+        Read one upload, process it on the pool and stream the result back
+
+        The pending-jobs limit is checked before the body is read, so an
+        overloaded server does not buffer uploads it is going to refuse.
+        """
+        if self.pending >= self.max_pending:
+            # The body stays unread, so the connection is closed
+            raise HttpError(503, "Too many jobs in progress, retry later", close=True)
+
+        self.pending += 1
+        job_dir = None
+        try:
+            body = await self.read_body(headers, reader)
+            content_type, params = parse_header_params(headers.get('content-type', ''))
+            if content_type != 'multipart/form-data' or 'boundary' not in params:
+                raise HttpError(415, "Uploads must be multipart/form-data")
+            parts = parse_multipart(body, params['boundary'])
+            if FILE_FIELD not in parts or not len(parts[FILE_FIELD][1]):
+                raise HttpError(400, f"Missing '{FILE_FIELD}' upload")
+            job_params = parse_fields(operation, parts)
+
+            loop = asyncio.get_running_loop()
+            job_dir = tempfile.mkdtemp(prefix='imageopt-http-', dir=self.work_dir)
+            input_path = os.path.join(job_dir, 'input')
+            output_path = os.path.join(job_dir, 'output')
+            await loop.run_in_executor(None, write_upload, input_path, parts[FILE_FIELD][1])
+            # The upload is on disk; do not hold it in memory while the job runs
+            del parts, body
+            executor = self.executor
+            try:
+                result = await loop.run_in_executor(executor, run_upload, operation, input_path, output_path,
+                                                    job_params)
+            except BrokenProcessPool:
+                # A worker died, e.g. killed for using too much memory; later
+                # uploads get a fresh pool, started once by the first to notice
+                if executor is self.executor:
+                    executor.shutdown(wait=False)
+                    self.start_pool(wait=False)
+                raise HttpError(500, "Worker process died")
+            self.served += 1
+
+            if result.get(INVALID_PARAMS):
+                raise HttpError(400, result['error'])
+            if result.get('rejected'):
+                await self.send_json(writer, 413, {'error': result['error'], 'rejected': True}, close=not keep_alive)
+                return
+            if not result.get('ok'):
+                await self.send_json(writer, 500, {'error': result.get('error') or "Processing failed"},
+                                     close=not keep_alive)
+                return
+            await self.send_file(writer, output_path, result, keep_alive)
+        finally:
+            self.pending -= 1
+            if job_dir is not None:
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+    def health(self):
+        """Return the pool state"""
+        return {'ok': True, 'pid': os.getpid(), 'processes': self.processes, 'pending': self.pending,
+                'max_pending': self.max_pending, 'served': self.served}
+
+    async def send_file(self, writer, path, result, keep_alive):
+        """
+        Stream an output file as the response body, a chunk at a time
+
+        Reads run on the default thread pool so a slow disk never stalls the
+        event loop.
+        """
+        loop = asyncio.get_running_loop()
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            chunk = await loop.run_in_executor(None, f.read, RESPONSE_CHUNK_SIZE)
+            headers = {
+                'Content-Type': content_type_for(chunk),
+                'Content-Length': str(size),
+                'X-Imageopt-Elapsed-Ms': str(result.get('elapsed_ms', '')),
+            }
+            if result.get('fallback'):
+                headers['X-Imageopt-Fallback'] = '1'
+            if result.get('cache'):
+                headers['X-Imageopt-Cache'] = result['cache']
+            if 'offset' in result:
+                headers['X-Imageopt-Offset'] = ','.join(map(str, result['offset']))
+                headers['X-Imageopt-Canvas'] = ','.join(map(str, result['canvas']))
+            self.write_head(writer, 200, headers, close=not keep_alive)
+            while chunk:
+                writer.write(chunk)
+                # Wait for slow clients instead of buffering the whole file
+                await writer.drain()
+                chunk = await loop.run_in_executor(None, f.read, RESPONSE_CHUNK_SIZE)
+
+    async def send_json(self, writer, status, value, close=False):
+        """Send a JSON response"""
+        body = json.dumps(value).encode('utf-8')
+        self.write_head(writer, status, {'Content-Type': 'application/json', 'Content-Length': str(len(body))},
+                        close)
+        writer.write(body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def write_head(self, writer, status, headers, close=False):
+        """Write the status line and headers"""
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+        lines += [f"{key}: {value}" for key, value in headers.items()]
+        lines.append(f"Connection: {'close' if close else 'keep-alive'}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+async def serve(host, port, processes=None, max_pending=None, max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+    """Run the service until cancelled"""
+    service = ImageService(processes, max_pending, max_body_bytes)
+    started = time.perf_counter()
+    bound_host, bound_port = await service.start(host, port)
+    print(json.dumps({'ready': True, 'pid': os.getpid(), 'host': bound_host, 'port': bound_port,
+                      'processes': service.processes,
+                      'startup_ms': round((time.perf_counter() - started) * 1000, 2)}), flush=True)
+    # SIGTERM stops serving the same way as Ctrl+C, so the pool processes are shut down
+    serving = asyncio.ensure_future(service.server.serve_forever())
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+    try:
+        await serving
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await service.close()
+
+def main(argv=None):
+    """Serve the AI operations over HTTP until interrupted"""
+    parser = argparse.ArgumentParser(description="Serve the AI operations over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on; 0 picks a free one")
+    parser.add_argument('--processes', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('--max-pending', type=int,
+                        help=f"Jobs in progress before uploads get 503 (default: {DEFAULT_PENDING_PER_PROCESS}x processes)")
+    parser.add_argument('--max-body-mb', type=float, default=DEFAULT_MAX_BODY_BYTES / (1024 * 1024),
+                        help="Largest upload accepted")
+    parser.add_argument('--cache-dir', help="Share a result cache between worker processes")
+    parser.add_argument('--threads', type=int, help="Threads per image (default: CPU count / processes)")
+    parser.add_argument('--limits', help="JSON of per-operation admission limits (default: IMAGEOPT_LIMITS)")
+    args = parser.parse_args(argv)
+
+    # Worker processes configure themselves from the environment
+    if args.cache_dir:
+        os.environ['IMAGEOPT_CACHE_DIR'] = args.cache_dir
+    if args.threads:
+        os.environ['IMAGEOPT_THREADS'] = str(args.threads)
+    if args.limits:
+        json.loads(args.limits)
+        os.environ['IMAGEOPT_LIMITS'] = args.limits
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.processes, args.max_pending,
+                          int(args.max_body_mb * 1024 * 1024)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Image Input/Output Helpers
+Loads images from paths, bytes, file-like objects or PIL Images and encodes
+results to paths, file-like objects or bytes
+"""
+
+import io
+import os
+import math
+from PIL import Image
+
+# Long side of the reduced image used for pyramid masks and previews
+REDUCED_MAX_SIDE = 1024
+
+def load_image(source, mode=None):
+    """
+    Open an image from any supported source
+
+    Args:
+        source: File path, bytes-like object, readable file-like object or PIL Image
+        mode (str): Convert to this mode when given, e.g. 'RGBA'
+
+    Returns:
+        PIL.Image.Image: The decoded image
+    """
+    if isinstance(source, Image.Image):
+        image = source
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(source))
+    elif isinstance(source, (str, os.PathLike)) or hasattr(source, 'read'):
+        image = Image.open(source)
+    else:
+        raise TypeError(f"Unsupported image source: {type(source).__name__}")
+
+    if mode is not None and image.mode != mode:
+        image = image.convert(mode)
+    return image
+
+def reduce_image(image, max_side=REDUCED_MAX_SIDE):
+    """Shrink an image by an integer box factor until its long side fits max_side"""
+    factor = math.ceil(max(image.size) / max_side)
+    return image.reduce(factor) if factor > 1 else image
+
+def load_reduced(source, mode=None, max_side=REDUCED_MAX_SIDE):
+    """
+    Decode an image at reduced resolution
+
+    JPEG sources use PIL's draft mode, which lets the decoder skip most of the
+    work by scaling in the DCT domain. Other formats are decoded in full and
+    then box-reduced.
+    """
+    if hasattr(source, 'read'):
+        source = source.read()
+    image = load_image(source)
+    if image.format == 'JPEG' and max(image.size) > max_side:
+        scale = max(image.size) / max_side
+        image.draft(None, (math.ceil(image.size[0] / scale), math.ceil(image.size[1] / scale)))
+    if mode is not None and image.mode != mode:
+        image = image.convert(mode)
+    return reduce_image(image, max_side)
+
+def load_image_pyramid(source, mode=None, max_side=REDUCED_MAX_SIDE):
+    """
+    Return (full, reduced) versions of an image
+
+    A JPEG is decoded twice, once in draft mode for the reduced copy, which is
+    much cheaper than box-reducing the full decode. Other formats are decoded
+    once and reduced.
+    """
+    if hasattr(source, 'read'):
+        source = source.read()
+    image = load_image(source)
+    reduced = None
+    if image.format == 'JPEG' and not isinstance(source, Image.Image):
+        reduced = load_reduced(source, mode, max_side)
+    if mode is not None and image.mode != mode:
+        image = image.convert(mode)
+    if reduced is None:
+        reduced = reduce_image(image, max_side)
+    return image, reduced
+
+def save_image(image, destination, format='PNG', **options):
+    """Encode an image to a file path or writable file-like object"""
+    image.save(destination, format, **options)
+
+def encode_image(image, format='PNG', **options):
+    """Encode an image and return the bytes"""
+    buffer = io.BytesIO()
+    save_image(image, buffer, format, **options)
+    return buffer.getvalue()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Stage Instrumentation for AI Tools
+Opt-in wall time, CPU time and memory measurements for each stage of an
+operation, emitted as one JSON line or passed to metrics hooks
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import contextlib
+import contextvars
+
+# Callables receiving every finished measurement, see add_metrics_hook()
+_hooks = []
+
+# Measurement of the operation running in this context, if any
+_current = contextvars.ContextVar('imageopt_measurement', default=None)
+
+# List collecting measurements for capture_metrics(), if active
+_capture = contextvars.ContextVar('imageopt_capture', default=None)
+
+def add_metrics_hook(hook):
+    """Call hook(metrics) with the dict of every finished operation"""
+    _hooks.append(hook)
+
+def remove_metrics_hook(hook):
+    """Stop calling a hook registered with add_metrics_hook()"""
+    _hooks.remove(hook)
+
+def metrics_sink():
+    """Return the IMAGEOPT_METRICS setting: '' (off), 'stdout' or a file path"""
+    return os.environ.get('IMAGEOPT_METRICS', '')
+
+def metrics_enabled():
+    """Whether finished measurements go anywhere; stages are free otherwise"""
+    return bool(_hooks) or _capture.get() is not None or bool(metrics_sink())
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, over its whole lifetime
+
+    Only meaningful per job in a fresh process; a warm worker reports the
+    high-water mark of every job it ran before.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def current_rss_mb():
+    """Current resident set size in MB, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Measurement:
+    """
+    Per-stage timings and memory for one operation
+
+    CPU time is process-wide, so a stage running on several threads reports
+    more CPU than wall time. Memory is sampled from the current resident set
+    size where /proc is available: rss_mb at the end of a stage and
+    rss_delta_mb, its change over the stage, which stay accurate in
+    long-running workers. process_peak_rss_mb is the process-lifetime
+    high-water mark and is only reported for the whole operation.
+    """
+
+    def __init__(self, operation, params=None):
+        self.operation = operation
+        self.params = dict(params or {})
+        self.info = {}
+        self.stages = {}
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self._rss_started = current_rss_mb()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a stage; repeated stages of the same name accumulate"""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        rss_started = current_rss_mb()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'wall_ms': 0.0, 'cpu_ms': 0.0})
+            entry['wall_ms'] = round(entry['wall_ms'] + (time.perf_counter() - wall) * 1000, 3)
+            entry['cpu_ms'] = round(entry['cpu_ms'] + (time.process_time() - cpu) * 1000, 3)
+            rss = current_rss_mb()
+            if rss is not None and rss_started is not None:
+                entry['rss_mb'] = round(rss, 1)
+                entry['rss_delta_mb'] = round(entry.get('rss_delta_mb', 0.0) + rss - rss_started, 1)
+
+    def set(self, **info):
+        """Attach details such as image dimensions or the outcome"""
+        self.info.update(info)
+
+    def as_dict(self):
+        metrics = {
+            'operation': self.operation,
+            'params': self.params,
+            **self.info,
+            'wall_ms': round((time.perf_counter() - self._started) * 1000, 3),
+            'cpu_ms': round((time.process_time() - self._cpu_started) * 1000, 3),
+        }
+        rss = current_rss_mb()
+        if rss is not None and self._rss_started is not None:
+            metrics['rss_mb'] = round(rss, 1)
+            metrics['rss_delta_mb'] = round(rss - self._rss_started, 1)
+        metrics['process_peak_rss_mb'] = round(peak_rss_mb(), 1)
+        metrics['stages'] = self.stages
+        return metrics
+
+def emit(metrics):
+    """Send a finished measurement to the hooks, a capture and IMAGEOPT_METRICS"""
+    for hook in list(_hooks):
+        hook(metrics)
+    captured = _capture.get()
+    if captured is not None:
+        captured.append(metrics)
+
+    sink = metrics_sink()
+    if sink == 'stdout':
+        print(json.dumps({'metrics': metrics}))
+    elif sink:
+        with open(sink, 'a') as f:
+            f.write(json.dumps(metrics) + '\n')
+
+@contextlib.contextmanager
+def measure(operation, params=None):
+    """
+    Measure an operation; stage() and record() calls inside it attach to it
+
+    Yields None when instrumentation is off, so callers pay nothing.
+    """
+    if not metrics_enabled():
+        yield None
+        return
+
+    measurement = Measurement(operation, params)
+    token = _current.set(measurement)
+    try:
+        yield measurement
+    except BaseException as e:
+        measurement.set(error=str(e) or type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        emit(measurement.as_dict())
+
+def stage(name):
+    """Context manager timing a stage of the current operation, if measured"""
+    measurement = _current.get()
+    return measurement.stage(name) if measurement is not None else contextlib.nullcontext()
+
+def record(**info):
+    """Attach details to the current operation, if measured"""
+    measurement = _current.get()
+    if measurement is not None:
+        measurement.set(**info)
+
+@contextlib.contextmanager
+def capture_metrics():
+    """Collect the measurements finished inside this block into a list"""
+    captured = []
+    token = _capture.set(captured)
+    try:
+        yield captured
+    finally:
+        _capture.reset(token)
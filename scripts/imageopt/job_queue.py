@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Local Job Queue for AI Tools
+Durable SQLite-backed queue for background removal, transparency and
+upscaling jobs, with per-operation concurrency limits, small-job priority,
+backpressure and expiry of finished results
+"""
+
+import sys
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from .admission import JobRejected
+
+# Operations the queue accepts; kept here so submitting does not import the
+# image libraries
+OPERATIONS = ('remove_background', 'make_transparent', 'ai_upscale')
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), 'imageopt_jobs.sqlite3')
+
+# Queued jobs accepted before submit() starts rejecting
+DEFAULT_MAX_QUEUED = 100
+
+# Jobs of each operation allowed to run at once; upscales are the heaviest
+DEFAULT_CONCURRENCY = {
+    'remove_background': 2,
+    'make_transparent': 2,
+    'ai_upscale': 1,
+}
+
+# Finished jobs and their outputs are removed after this many seconds
+DEFAULT_RESULT_TTL = 3600
+
+# A queued job's cost halves for every AGING_SECONDS it waits, so large jobs
+# still run under a steady stream of small ones
+AGING_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    operation TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    cost REAL NOT NULL,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, operation);
+"""
+
+# Job states
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+class QueueFull(Exception):
+    """Raised by submit() when the queue is at capacity"""
+
+def estimate_cost(operation, input_path, params):
+    """
+    Estimate the work of a job as output megapixels, reading only the header
+
+    Unreadable inputs get a cost of 0; the job fails fast when it runs.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(input_path) as image:
+            pixels = image.size[0] * image.size[1]
+    except (OSError, ValueError):
+        return 0.0
+    if operation == 'ai_upscale':
+        factor = int(str(params.get('upscale_factor', '2x')).replace('x', ''))
+        pixels *= factor * factor
+    return pixels / 1e6
+
+def check_admission(operation, input_path, params):
+    """
+    Reject a job that can never fit the admission limits before it is queued
+
+    Workers check again when the job runs, with the model backend resolved.
+    Unreadable inputs are let through; the job fails fast when it runs.
+
+    Raises:
+        JobRejected: When no path fits the operation's limits
+    """
+    from .admission import plan_job
+
+    factor = int(str(params.get('upscale_factor', '2x')).replace('x', '')) if operation == 'ai_upscale' else 1
+    try:
+        plan_job(operation, input_path, params.get('mode', 'color'), params.get('stream'), factor,
+                 params.get('tile_size'), profile=params.get('profile'))
+    except (OSError, ValueError):
+        pass
+
+def process_owner():
+    """Identify this process as the owner of running jobs"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def owner_alive(owner):
+    """Whether the process that claimed a job still runs; other hosts are assumed alive"""
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+class JobQueue:
+    """
+    SQLite-backed queue shared by any number of submitting and serving processes
+
+    Every state change runs in an IMMEDIATE transaction, so concurrent
+    claimers never take the same job and concurrency limits hold across
+    processes.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, max_queued=DEFAULT_MAX_QUEUED,
+                 concurrency=None, result_ttl=DEFAULT_RESULT_TTL):
+        self.db_path = db_path
+        self.max_queued = max_queued
+        self.concurrency = dict(DEFAULT_CONCURRENCY, **(concurrency or {}))
+        self.result_ttl = result_ttl
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _transaction(self):
+        """Start a write transaction; returns the connection for use as a context manager"""
+        self._db.execute('BEGIN IMMEDIATE')
+        return _Transaction(self._db)
+
+    def submit(self, operation, input_path, output_path, params=None):
+        """
+        Queue a job and return its id
+
+        Raises:
+            ValueError: For an unknown operation
+            QueueFull: When max_queued jobs are already waiting
+            JobRejected: When the input is too large for the admission limits
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        params = params or {}
+        check_admission(operation, input_path, params)
+        cost = estimate_cost(operation, input_path, params)
+        job_id = uuid.uuid4().hex
+
+        with self._transaction() as db:
+            queued = db.execute('SELECT COUNT(*) FROM jobs WHERE state = ?', (QUEUED,)).fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFull(f"Queue is full ({queued} jobs waiting)")
+            db.execute(
+                'INSERT INTO jobs (id, operation, input_path, output_path, params, cost, state, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, operation, input_path, output_path, json.dumps(params), cost, QUEUED, time.time()),
+            )
+        return job_id
+
+    def status(self, job_id):
+        """Return a job's state and timings, or None for an unknown id"""
+        row = self._db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        status = {
+            'id': row['id'],
+            'operation': row['operation'],
+            'state': row['state'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+        }
+        if row['state'] == QUEUED:
+            # Jobs that would be claimed before this one right now
+            now = time.time()
+            status['position'] = self._db.execute(
+                f'SELECT COUNT(*) FROM jobs WHERE state = ? AND {self._priority()} < ?',
+                (QUEUED, now, self._effective_cost(row['cost'], row['created_at'], now)),
+            ).fetchone()[0]
+        return status
+
+    def result(self, job_id):
+        """Return the worker result of a finished job, or None while it is pending"""
+        row = self._db.execute('SELECT result FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None or row['result'] is None:
+            return None
+        return json.loads(row['result'])
+
+    def _priority(self):
+        """SQL expression for a queued job's aged cost; takes the current time as a parameter"""
+        return f'cost / (1 + (? - created_at) / {AGING_SECONDS}.0)'
+
+    @staticmethod
+    def _effective_cost(cost, created_at, now):
+        return cost / (1 + (now - created_at) / AGING_SECONDS)
+
+    def claim(self, owner=None):
+        """
+        Mark the cheapest runnable job as running and return it, or None
+
+        A job is runnable when fewer than the operation's concurrency limit
+        of its kind are running, counting every process serving this queue.
+        """
+        owner = owner or process_owner()
+        with self._transaction() as db:
+            running = dict(db.execute(
+                'SELECT operation, COUNT(*) FROM jobs WHERE state = ? GROUP BY operation', (RUNNING,)
+            ).fetchall())
+            allowed = [operation for operation in OPERATIONS
+                       if running.get(operation, 0) < self.concurrency.get(operation, 1)]
+            if not allowed:
+                return None
+
+            now = time.time()
+            placeholders = ', '.join('?' * len(allowed))
+            row = db.execute(
+                f'SELECT * FROM jobs WHERE state = ? AND operation IN ({placeholders}) '
+                f'ORDER BY {self._priority()}, created_at LIMIT 1',
+                (QUEUED, *allowed, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE jobs SET state = ?, started_at = ?, owner = ? WHERE id = ?',
+                       (RUNNING, now, owner, row['id']))
+
+        return {
+            'id': row['id'],
+            'operation': row['operation'],
+            'input_path': row['input_path'],
+            'output_path': row['output_path'],
+            'params': json.loads(row['params']),
+        }
+
+    def finish(self, job_id, result):
+        """Store a job's worker result and mark it done or failed"""
+        state = DONE if result.get('ok') else FAILED
+        with self._transaction() as db:
+            db.execute('UPDATE jobs SET state = ?, finished_at = ?, result = ? WHERE id = ?',
+                       (state, time.time(), json.dumps(result), job_id))
+
+    def release(self, job_id):
+        """Return a claimed job that never started to the queue"""
+        with self._transaction() as db:
+            db.execute('UPDATE jobs SET state = ?, started_at = NULL, owner = NULL WHERE id = ? AND state = ?',
+                       (QUEUED, job_id, RUNNING))
+
+    def recover(self):
+        """Requeue running jobs whose owning process has died; returns how many"""
+        with self._transaction() as db:
+            rows = db.execute('SELECT id, owner FROM jobs WHERE state = ?', (RUNNING,)).fetchall()
+            orphans = [row['id'] for row in rows if not owner_alive(row['owner'] or '')]
+            for job_id in orphans:
+                db.execute('UPDATE jobs SET state = ?, started_at = NULL, owner = NULL WHERE id = ?',
+                           (QUEUED, job_id))
+        return len(orphans)
+
+    def cleanup(self, ttl=None):
+        """Delete finished jobs older than ttl seconds and their outputs; returns how many"""
+        ttl = self.result_ttl if ttl is None else ttl
+        cutoff = time.time() - ttl
+        with self._transaction() as db:
+            rows = db.execute('SELECT id, output_path FROM jobs WHERE state IN (?, ?) AND finished_at <= ?',
+                              (DONE, FAILED, cutoff)).fetchall()
+            db.execute('DELETE FROM jobs WHERE state IN (?, ?) AND finished_at <= ?', (DONE, FAILED, cutoff))
+
+        for row in rows:
+            try:
+                os.remove(row['output_path'])
+            except OSError:
+                pass
+        return len(rows)
+
+    def stats(self):
+        """Return job counts by state"""
+        counts = dict(self._db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+        return {state: counts.get(state, 0) for state in (QUEUED, RUNNING, DONE, FAILED)}
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        return False
+
+def serve(queue, workers=None, poll_interval=0.5, cleanup_interval=60, until_idle=False):
+    """
+    Run queued jobs on a process pool until interrupted
+
+    At most workers jobs run at once, further capped per operation by the
+    queue's concurrency limits. With until_idle the loop returns once nothing
+    is queued or running, which is what tests and one-off drains want.
+
+    A worker process that dies, e.g. killed for using too much memory,
+    breaks the whole pool. The jobs running on it are marked failed, since
+    the pool cannot tell which one killed it, and a fresh pool takes the
+    next jobs.
+    """
+    from .ai_worker import run_job
+    from .band_scheduler import configure_threads, pool_threads
+
+    workers = workers or sum(queue.concurrency.values())
+    queue.recover()
+    in_flight = {}
+    last_cleanup = 0.0
+    owner = process_owner()
+
+    def start_pool():
+        # Split the cores between pool processes, as batch_process does
+        return ProcessPoolExecutor(max_workers=workers, initializer=configure_threads,
+                                   initargs=(pool_threads(workers),))
+
+    def restart(broken):
+        broken.shutdown(wait=False)
+        return start_pool()
+
+    executor = start_pool()
+    try:
+        while True:
+            if time.monotonic() - last_cleanup >= cleanup_interval:
+                queue.cleanup()
+                last_cleanup = time.monotonic()
+
+            while len(in_flight) < workers:
+                job = queue.claim(owner)
+                if job is None:
+                    break
+                try:
+                    future = executor.submit(run_job, job)
+                except BrokenProcessPool:
+                    # The pool broke since the last wait and the job never ran
+                    queue.release(job['id'])
+                    executor = restart(executor)
+                    continue
+                in_flight[future] = (job['id'], executor)
+
+            if not in_flight:
+                if until_idle:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                job_id, pool = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    result = {'id': job_id, 'ok': False, 'error': "Worker process died"}
+                    # Every job of the broken pool lands here; restart it once
+                    if pool is executor:
+                        executor = restart(executor)
+                except Exception as e:
+                    result = {'id': job_id, 'ok': False, 'error': str(e)}
+                queue.finish(job_id, result)
+    finally:
+        executor.shutdown()
+
+def print_json(value):
+    print(json.dumps(value))
+
+def main(argv=None):
+    """Run a queue command and print its JSON reply"""
+    parser = argparse.ArgumentParser(description="Queue AI jobs and run them in the background")
+    parser.add_argument('--db', default=os.environ.get('IMAGEOPT_QUEUE_DB', DEFAULT_DB_PATH),
+                        help="Queue database (default: IMAGEOPT_QUEUE_DB or the temp directory)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit_parser = commands.add_parser('submit', help="Queue a job and print its id")
+    submit_parser.add_argument('operation', choices=OPERATIONS)
+    submit_parser.add_argument('input_path')
+    submit_parser.add_argument('output_path')
+    submit_parser.add_argument('--params', default='{}', help="Operation parameters as a JSON object")
+    submit_parser.add_argument('--max-queued', type=int, default=DEFAULT_MAX_QUEUED)
+
+    for name, help_text in [('status', "Print a job's state"), ('result', "Print a finished job's result")]:
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('job_id')
+
+    cleanup_parser = commands.add_parser('cleanup', help="Delete expired results")
+    cleanup_parser.add_argument('--ttl', type=float, default=DEFAULT_RESULT_TTL)
+
+    commands.add_parser('stats', help="Print job counts by state")
+
+    serve_parser = commands.add_parser('serve', help="Run queued jobs until interrupted")
+    serve_parser.add_argument('--workers', type=int, help="Jobs run at once (default: sum of the limits)")
+    serve_parser.add_argument('--limit', action='append', metavar='OPERATION=N',
+                              help="Concurrency limit for an operation, e.g. ai_upscale=2")
+    serve_parser.add_argument('--ttl', type=float, default=DEFAULT_RESULT_TTL,
+                              help="Seconds finished results are kept")
+    serve_parser.add_argument('--until-idle', action='store_true', help="Exit once the queue is empty")
+    args = parser.parse_args(argv)
+
+    if args.command == 'submit':
+        queue = JobQueue(args.db, max_queued=args.max_queued)
+        if not os.path.exists(args.input_path):
+            print_json({'error': f"Input file not found: {args.input_path}"})
+            sys.exit(1)
+        try:
+            job_id = queue.submit(args.operation, args.input_path, args.output_path, json.loads(args.params))
+        except QueueFull as e:
+            print_json({'error': str(e), 'queue_full': True})
+            sys.exit(2)
+        except JobRejected as e:
+            print_json({'error': str(e), 'rejected': True})
+            sys.exit(1)
+        print_json({'id': job_id})
+    elif args.command == 'status':
+        status = JobQueue(args.db).status(args.job_id)
+        print_json(status or {'error': f"Unknown job: {args.job_id}"})
+        sys.exit(0 if status else 1)
+    elif args.command == 'result':
+        print_json(JobQueue(args.db).result(args.job_id))
+    elif args.command == 'cleanup':
+        print_json({'removed': JobQueue(args.db).cleanup(args.ttl)})
+    elif args.command == 'stats':
+        print_json(JobQueue(args.db).stats())
+    else:
+        limits = {}
+        for pair in args.limit or []:
+            operation, _, value = pair.partition('=')
+            limits[operation] = int(value)
+        queue = JobQueue(args.db, concurrency=limits, result_ttl=args.ttl)
+        try:
+            serve(queue, args.workers, until_idle=args.until_idle)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
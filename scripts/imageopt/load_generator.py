@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Load Generator for the HTTP Service
+Sends the same upload to a running http_service instance at several
+concurrency levels and reports throughput and p50/p95/p99 latency. Each
+simulated client keeps one HTTP/1.1 connection open and sends its next
+request as soon as the previous response has been read in full.
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import asyncio
+import argparse
+import subprocess
+import contextlib
+from urllib.parse import urlsplit
+
+from .http_service import ROUTES
+
+DEFAULT_LEVELS = (1, 2, 4, 8)
+DEFAULT_REQUESTS = 40
+DEFAULT_SIZE = '512x512'
+
+# Seconds allowed for one response before it counts as an error
+REQUEST_TIMEOUT = 300
+
+# Operation -> URL path
+OPERATION_PATHS = {operation: path for path, operation in ROUTES.items()}
+
+def encode_multipart(file_bytes, fields=None, filename='upload.png', file_field='file'):
+    """
+    Build a multipart/form-data body with one file and text fields
+
+    Returns:
+        tuple: (body bytes, Content-Type header value)
+    """
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in (fields or {}).items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                   .encode('utf-8'))
+    body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+               f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8'))
+    body.write(file_bytes)
+    body.write(f'\r\n--{boundary}--\r\n'.encode('utf-8'))
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+def synthetic_upload(size=DEFAULT_SIZE):
+    """Encode benchmark_ai_tools' synthetic image of a 'WxH' size as PNG bytes"""
+    from .benchmark_ai_tools import make_synthetic_image
+
+    width, height = (int(value) for value in size.lower().split('x'))
+    buffer = io.BytesIO()
+    make_synthetic_image(width, height).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+async def read_response(reader):
+    """Read one response and return (status, headers, body length)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    await reader.readexactly(length)
+    return status, headers, length
+
+async def send_request(reader, writer, host, path, body, content_type):
+    """Send one upload on an open connection and read its response"""
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: {content_type}\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1'))
+    writer.write(body)
+    await writer.drain()
+    return await read_response(reader)
+
+async def run_level(host, port, path, body, content_type, concurrency, requests):
+    """
+    Send requests uploads from concurrency clients and summarize them
+
+    Returns:
+        dict: concurrency, requests, ok, errors, statuses, duration_s,
+            throughput_rps (successful responses per second), bytes_received
+            and latency_ms with p50, p95, p99, mean and max
+    """
+    remaining = requests
+    latencies = []
+    statuses = {}
+    received = 0
+
+    async def client():
+        nonlocal remaining, received
+        reader = writer = None
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                status, headers, length = await asyncio.wait_for(
+                    send_request(reader, writer, host, path, body, content_type), REQUEST_TIMEOUT)
+                received += length
+                if headers.get('connection') == 'close':
+                    writer.close()
+                    writer = None
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                # Counted as status 0; the next request reconnects
+                status = 0
+                if writer is not None:
+                    writer.close()
+                writer = None
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'ok': len(latencies),
+        'errors': requests - len(latencies),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(latencies) / duration, 2) if duration else None,
+        'bytes_received': received,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50), 2) if latencies else None,
+            'p95': round(percentile(latencies, 0.95), 2) if latencies else None,
+            'p99': round(percentile(latencies, 0.99), 2) if latencies else None,
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'max': round(latencies[-1], 2) if latencies else None,
+        },
+    }
+
+async def run_load(url, operation, file_bytes, params=None, levels=DEFAULT_LEVELS, requests=DEFAULT_REQUESTS,
+                   warmup=1):
+    """Run every concurrency level one after another and return their summaries"""
+    parts = urlsplit(url)
+    host, port = parts.hostname or '127.0.0.1', parts.port or 80
+    path = parts.path.rstrip('/') + OPERATION_PATHS[operation]
+    body, content_type = encode_multipart(file_bytes, params)
+    if warmup:
+        await run_level(host, port, path, body, content_type, 1, warmup)
+    return [await run_level(host, port, path, body, content_type, concurrency, max(requests, concurrency))
+            for concurrency in levels]
+
+@contextlib.contextmanager
+def local_server(processes=None, extra_args=()):
+    """Start http_service on a free local port and yield its URL"""
+    scripts_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, '-m', 'imageopt', 'serve', '--port', '0', *extra_args]
+    if processes:
+        command += ['--processes', str(processes)]
+    server = subprocess.Popen(command, cwd=scripts_dir, stdout=subprocess.PIPE, text=True)
+    try:
+        for line in server.stdout:
+            try:
+                ready = json.loads(line)
+            except ValueError:
+                continue
+            if ready.get('ready'):
+                break
+        else:
+            raise RuntimeError("The local server exited before it was ready")
+        yield f"http://{ready['host']}:{ready['port']}"
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def print_levels(reports):
+    """Print one line per concurrency level"""
+    print(f"{'clients':>7} {'ok':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for report in reports:
+        latency = report['latency_ms']
+        cells = [f"{latency[key]:>9.1f}" if latency[key] is not None else f"{'-':>9}" for key in ('p50', 'p95', 'p99')]
+        print(f"{report['concurrency']:>7} {report['ok']:>6} {report['errors']:>6} "
+              f"{report['throughput_rps'] or 0:>8.2f} {' '.join(cells)}")
+
+def parse_params(pairs):
+    """Turn key=value strings into form fields"""
+    params = {}
+    for pair in pairs or []:
+        if '=' not in pair:
+            raise ValueError(f"Parameters must look like key=value: {pair}")
+        key, value = pair.split('=', 1)
+        params[key] = value
+    return params
+
+def main(argv=None):
+    """Load test an http_service instance from the command line"""
+    parser = argparse.ArgumentParser(description="Measure throughput and latency of the HTTP service")
+    parser.add_argument('operation', choices=sorted(OPERATION_PATHS))
+    parser.add_argument('--url', help="Service to load (default: start a local one)")
+    parser.add_argument('--processes', type=int, help="Worker processes of the local service")
+    parser.add_argument('--concurrency', default=','.join(map(str, DEFAULT_LEVELS)),
+                        help="Comma-separated numbers of concurrent clients")
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help="Requests per concurrency level")
+    parser.add_argument('--warmup', type=int, default=1, help="Requests sent before measuring")
+    parser.add_argument('--image', help="Upload this file (default: a synthetic PNG)")
+    parser.add_argument('--size', default=DEFAULT_SIZE, help="Size of the synthetic PNG, e.g. 1024x768")
+    parser.add_argument('--param', action='append', metavar='KEY=VALUE',
+                        help="Form field sent with every upload, e.g. upscale_factor=4x")
+    parser.add_argument('--output', help="Also save the results as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        levels = [int(level) for level in args.concurrency.split(',')]
+        params = parse_params(args.param)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            file_bytes = f.read()
+    else:
+        file_bytes = synthetic_upload(args.size)
+
+    with contextlib.ExitStack() as stack:
+        url = args.url or stack.enter_context(local_server(args.processes))
+        print(f"Loading {url}{OPERATION_PATHS[args.operation]} with {len(file_bytes) / 1024:.1f} KB uploads")
+        reports = asyncio.run(run_load(url, args.operation, file_bytes, params, levels, args.requests,
+                                       args.warmup))
+
+    print_levels(reports)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'url': url, 'operation': args.operation, 'params': params, 'upload_bytes': len(file_bytes),
+                       'levels': reports}, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+    return 1 if any(report['errors'] for report in reports) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Mask Artifacts
+Compact, reusable foreground masks. Segmentation is the expensive part of
+remove_background and make_transparent, while a new transparency level or
+background color only changes the final composite; with a result cache
+configured the mask of an input is stored once and reused by every later
+call on the same bytes.
+"""
+
+import os
+import json
+import zlib
+import struct
+import numpy as np
+
+from .image_io import load_image, load_image_pyramid
+from .pixel_bridge import rgba_pixels
+from .background_mask import MODES, segment_background
+from .model_backends import resolve_backend, backend_fingerprint
+from .result_cache import get_cache, hash_input
+from .instrumentation import stage, record
+
+# Bump whenever segmentation output changes, so stored masks are not reused
+MASK_VERSION = 1
+
+# Artifact layout: magic, version, encoding, width, height (little endian),
+# then the zlib-compressed mask
+MAGIC = b'IOMASK'
+HEADER = struct.Struct('<6sBBII')
+
+# Encodings: one bit per pixel for two-level masks, one byte per pixel for
+# model probabilities
+ENCODING_BITS = 1
+ENCODING_BYTES = 8
+
+def pack_mask(alpha):
+    """
+    Encode an H x W uint8 foreground alpha as a compact artifact
+
+    Heuristic masks are only 0 and 255 and are stored bit-packed, so a 12 MP
+    mask takes a few KB after compression.
+    """
+    height, width = alpha.shape
+    if np.all((alpha == 0) | (alpha == 255)):
+        encoding, payload = ENCODING_BITS, np.packbits(alpha == 255)
+    else:
+        encoding, payload = ENCODING_BYTES, np.ascontiguousarray(alpha)
+    return HEADER.pack(MAGIC, MASK_VERSION, encoding, width, height) + zlib.compress(payload.tobytes(), 1)
+
+def unpack_mask(data):
+    """
+    Decode an artifact from pack_mask() back to an H x W uint8 alpha
+
+    Raises:
+        ValueError: For data that is not a mask artifact of this version
+    """
+    magic, version, encoding, width, height = HEADER.unpack_from(data)
+    if magic != MAGIC or version != MASK_VERSION:
+        raise ValueError("Not a mask artifact of this version")
+    payload = np.frombuffer(zlib.decompress(data[HEADER.size:]), dtype=np.uint8)
+    if encoding == ENCODING_BITS:
+        bits = np.unpackbits(payload, count=width * height)
+        return (bits * np.uint8(255)).reshape(height, width)
+    return payload.reshape(height, width).copy()
+
+def mask_key(source, mode='color', segmenter=None):
+    """
+    Return the cache key of a source's mask, or None when it cannot be keyed
+
+    Only paths and bytes are keyed. Model masks are keyed by the model file,
+    so a session that does not come from a local model file is never cached.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if not os.path.isfile(source):
+            return None
+    elif not isinstance(source, (bytes, bytearray, memoryview)):
+        return None
+
+    if segmenter is None:
+        backend = 'heuristic'
+    else:
+        backend = backend_fingerprint('segment', segmenter)
+        if backend == 'heuristic':
+            return None
+
+    digest = hash_input(source)
+    digest.update(json.dumps({
+        'operation': 'mask',
+        'mode': mode if segmenter is None else None,
+        'backend': backend,
+        'version': MASK_VERSION,
+    }, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+def segment_foreground(source, mode='color', threads=None, backend=None):
+    """
+    Decode a source and find its foreground, reusing a stored mask if any
+
+    Args:
+        source: File path, bytes, file-like object or PIL Image
+        mode (str): 'color', 'connected' or 'pyramid' segmentation
+        threads (int): Bands segmented in parallel
+        backend: 'auto', 'heuristic', 'onnx', an .onnx model path or a
+            model backend, see model_backends
+
+    Returns:
+        tuple: (RGBA PIL Image, H x W x 4 uint8 array sharing its buffer
+            whose alpha is the foreground alpha: 255 foreground and 0
+            background, or the model's probability)
+
+    The source is decoded straight into the array (see pixel_bridge), so
+    the returned Image shows the foreground alpha too.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown segmentation mode: {mode}")
+    if hasattr(source, 'read'):
+        source = source.read()
+
+    segmenter = resolve_backend('segment', backend)
+    cache = get_cache()
+    key = mask_key(source, mode, segmenter) if cache is not None else None
+    stored = cache.get_bytes(key) if key else None
+
+    if stored is not None:
+        with stage('decode'):
+            pixels, image = rgba_pixels(load_image(source))
+        with stage('mask'):
+            pixels[:, :, 3] = unpack_mask(stored)
+        record(mask='stored')
+        return image, pixels
+
+    if segmenter is not None:
+        # The model predicts the foreground alpha directly
+        with stage('decode'):
+            pixels, image = rgba_pixels(load_image(source))
+        with stage('model'):
+            pixels[:, :, 3] = segmenter.predict_masks([image])[0]
+    else:
+        # Load the image, plus a cheap reduced copy for the pyramid mode
+        with stage('decode'):
+            reduced_array = None
+            if mode == 'pyramid':
+                image, reduced = load_image_pyramid(source, 'RGBA')
+                reduced_array = np.asarray(reduced)
+            else:
+                image = load_image(source)
+            pixels, image = rgba_pixels(image)
+        with stage('mask'):
+            segment_background(pixels, background_alpha=0, mode=mode, reduced_pixels=reduced_array,
+                               threads=threads)
+
+    if key:
+        cache.put_bytes(key, pack_mask(pixels[:, :, 3]))
+        record(mask='computed')
+    return image, pixels
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Model Backends
+Optional ONNX Runtime segmentation and upscaling models. Sessions are loaded
+once per process and reused; when no model is configured, or ONNX Runtime
+is not installed, callers fall back to the built-in heuristics.
+"""
+
+import os
+import threading
+import importlib.util
+import numpy as np
+from PIL import Image
+
+from .band_scheduler import get_threads
+
+# Backend names accepted by the processing functions; a path to an .onnx
+# file selects that model directly
+#   auto:      the model from the environment when set, else the heuristic
+#   heuristic: the built-in color segmentation or LANCZOS + sharpening
+#   onnx:      the model from the environment, falling back when missing
+BACKENDS = ('auto', 'heuristic', 'onnx')
+
+# Environment variables naming the model file for each task
+MODEL_ENV = {
+    'segment': 'IMAGEOPT_SEGMENT_MODEL',
+    'upscale': 'IMAGEOPT_UPSCALE_MODEL',
+}
+
+# U^2-Net style preprocessing used by the RemBG models
+SEGMENT_INPUT_SIZE = 320
+SEGMENT_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+SEGMENT_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Upscaling models see fixed-size tiles with this much overlap on each side
+UPSCALE_TILE = 128
+UPSCALE_OVERLAP = 8
+
+# Inputs stacked into a single session.run() call
+MAX_BATCH = 8
+
+# Loaded sessions and backends, keyed by model file and settings
+_sessions = {}
+_backends = {}
+_lock = threading.Lock()
+
+def session_threads():
+    """Return (intra_op, inter_op) thread counts for new sessions"""
+    intra = int(os.environ.get('IMAGEOPT_ORT_INTRA_THREADS') or get_threads())
+    inter = int(os.environ.get('IMAGEOPT_ORT_INTER_THREADS') or 1)
+    return intra, inter
+
+def model_key(model_path):
+    """Identify a model file by path, size and modification time"""
+    path = os.path.realpath(model_path)
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns
+
+def load_session(model_path, intra_op_threads=None, inter_op_threads=None):
+    """
+    Return an ONNX Runtime session for a local model file, loading it once
+
+    Sessions are cached per process by model file and thread settings, so
+    warm workers pay the load cost only on the first job.
+    """
+    import onnxruntime
+
+    default_intra, default_inter = session_threads()
+    intra = intra_op_threads or default_intra
+    inter = inter_op_threads or default_inter
+    key = model_key(model_path) + (intra, inter)
+
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = intra
+            options.inter_op_num_threads = inter
+            if inter > 1:
+                options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+            session = onnxruntime.InferenceSession(key[0], sess_options=options,
+                                                   providers=['CPUExecutionProvider'])
+            _sessions[key] = session
+    return session
+
+def clear_sessions():
+    """Drop every cached session and backend"""
+    with _lock:
+        _sessions.clear()
+        _backends.clear()
+
+def run_batched(session, inputs):
+    """Run a session over a list of CHW float32 arrays in MAX_BATCH stacks"""
+    input_name = session.get_inputs()[0].name
+    outputs = []
+    for start in range(0, len(inputs), MAX_BATCH):
+        batch = np.stack(inputs[start:start + MAX_BATCH])
+        outputs.extend(session.run(None, {input_name: batch})[0])
+    return outputs
+
+class OnnxSegmenter:
+    """
+    Foreground segmentation with a U^2-Net style ONNX model
+
+    The model takes N x 3 x 320 x 320 normalized RGB and returns a foreground
+    probability map per image, as the RemBG models do.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model_path, session=None):
+        self.model_path = model_path
+        self.session = session if session is not None else load_session(model_path)
+
+    def preprocess(self, image):
+        """Return the 3 x S x S float32 model input for an RGB image"""
+        resized = image.convert('RGB').resize((SEGMENT_INPUT_SIZE, SEGMENT_INPUT_SIZE), Image.LANCZOS)
+        pixels = np.asarray(resized, dtype=np.float32)
+        pixels /= max(float(pixels.max()), 1e-6)
+        pixels -= SEGMENT_MEAN
+        pixels /= SEGMENT_STD
+        return pixels.transpose(2, 0, 1)
+
+    def predict_masks(self, images):
+        """
+        Return an H x W uint8 foreground alpha for each image
+
+        All images go through the session in batches of MAX_BATCH.
+        """
+        outputs = run_batched(self.session, [self.preprocess(image) for image in images])
+        masks = []
+        for image, output in zip(images, outputs):
+            prediction = output.reshape(output.shape[-2:]).astype(np.float32)
+            low, high = float(prediction.min()), float(prediction.max())
+            prediction = (prediction - low) / (high - low) if high > low else np.zeros_like(prediction)
+            mask = Image.fromarray(np.rint(prediction * 255).astype(np.uint8), 'L')
+            masks.append(np.asarray(mask.resize(image.size, Image.LANCZOS)))
+        return masks
+
+class OnnxUpscaler:
+    """
+    Super-resolution with an ESRGAN style ONNX model
+
+    The model takes N x 3 x T x T RGB in [0, 1] and returns the tiles scaled
+    by a fixed factor, which is read from the first output. Images are fed
+    as overlapping tiles so memory stays flat for any input size.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model_path, session=None):
+        self.model_path = model_path
+        self.session = session if session is not None else load_session(model_path)
+        self.scale = None
+
+    def upscale(self, pixels):
+        """Return an H*scale x W*scale x 3 uint8 upscale of an RGB array"""
+        height, width = pixels.shape[:2]
+        core = UPSCALE_TILE - 2 * UPSCALE_OVERLAP
+        rows, cols = -(-height // core), -(-width // core)
+
+        # Pad so every tile is full size; edge pixels are repeated
+        padded = np.pad(pixels, (
+            (UPSCALE_OVERLAP, rows * core - height + UPSCALE_OVERLAP),
+            (UPSCALE_OVERLAP, cols * core - width + UPSCALE_OVERLAP),
+            (0, 0),
+        ), mode='edge')
+
+        positions = [(row * core, col * core) for row in range(rows) for col in range(cols)]
+        tiles = [
+            padded[y:y + UPSCALE_TILE, x:x + UPSCALE_TILE].transpose(2, 0, 1).astype(np.float32) / 255
+            for y, x in positions
+        ]
+        outputs = run_batched(self.session, tiles)
+        if self.scale is None:
+            self.scale = outputs[0].shape[-1] // UPSCALE_TILE
+
+        scale = self.scale
+        result = np.empty((rows * core * scale, cols * core * scale, 3), dtype=np.uint8)
+        margin = UPSCALE_OVERLAP * scale
+        for (y, x), output in zip(positions, outputs):
+            tile = np.clip(output.transpose(1, 2, 0) * 255, 0, 255)
+            result[y * scale:(y + core) * scale, x * scale:(x + core) * scale] = np.rint(
+                tile[margin:margin + core * scale, margin:margin + core * scale]
+            )
+        return result[:height * scale, :width * scale]
+
+BACKEND_CLASSES = {'segment': OnnxSegmenter, 'upscale': OnnxUpscaler}
+
+def onnxruntime_available():
+    """True when ONNX Runtime can be imported"""
+    return importlib.util.find_spec('onnxruntime') is not None
+
+def resolve_model_path(kind, backend=None):
+    """
+    Return the model file a backend choice refers to, or None for the heuristic
+
+    Raises:
+        ValueError: For an unknown backend name
+    """
+    backend = backend or 'auto'
+    if isinstance(backend, str) and backend.endswith('.onnx'):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}. Choose from {', '.join(BACKENDS)} or an .onnx path")
+    if backend == 'heuristic':
+        return None
+    return os.environ.get(MODEL_ENV[kind]) or None
+
+def resolve_backend(kind, backend=None):
+    """
+    Return the model backend for a call, or None to use the heuristic
+
+    backend may be a name from BACKENDS, a path to an .onnx file or an
+    already constructed backend. Missing models and a missing ONNX Runtime
+    fall back to the heuristic with a note, since the heuristic always works.
+    """
+    if isinstance(backend, (OnnxSegmenter, OnnxUpscaler)):
+        return backend
+
+    model_path = resolve_model_path(kind, backend)
+    if model_path is None:
+        if backend == 'onnx':
+            print(f"No model configured in {MODEL_ENV[kind]}; using the heuristic")
+        return None
+    if not os.path.exists(model_path):
+        print(f"Model not found: {model_path}; using the heuristic")
+        return None
+    if not onnxruntime_available():
+        print("ONNX Runtime is not installed; using the heuristic")
+        return None
+
+    key = (kind,) + model_key(model_path)
+    with _lock:
+        instance = _backends.get(key)
+    if instance is None:
+        instance = BACKEND_CLASSES[kind](model_path)
+        with _lock:
+            _backends[key] = instance
+    return instance
+
+def backend_fingerprint(kind, backend=None):
+    """Describe the backend a call would use, for result cache keys"""
+    if isinstance(backend, (OnnxSegmenter, OnnxUpscaler)):
+        model_path = backend.model_path
+    else:
+        model_path = resolve_model_path(kind, backend)
+    if model_path is None or not os.path.exists(model_path) or not onnxruntime_available():
+        return 'heuristic'
+    path, size, mtime = model_key(model_path)
+    return f"onnx:{path}:{size}:{mtime}"
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Output Encoder Profiles
+Named speed/size trade-offs for encoding results, shared by the background
+removal, transparency and upscaling scripts
+"""
+
+import os
+import time
+import numpy as np
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+# Encoder settings for each profile
+#   fastest:  PNG with light zlib compression, several times faster to encode
+#   balanced: PNG at zlib level 6, Pillow's default
+#   smallest: PNG at zlib level 9 with Pillow's optimize pass
+#   webp:     lossless WebP, usually much smaller than PNG for photos; the
+#             color under fully transparent pixels is not preserved
+#   jpeg:     JPEG at quality 90; images that need alpha are written with the
+#             balanced PNG settings instead
+PROFILES = {
+    'fastest': {'format': 'PNG', 'compress_level': 1},
+    'balanced': {'format': 'PNG', 'compress_level': 6},
+    'smallest': {'format': 'PNG', 'compress_level': 9, 'optimize': True},
+    'webp': {'format': 'WEBP', 'lossless': True, 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 90, 'optimize': True},
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+# Output optimizations accepted by save_with_profile()
+#   lossless: drop an alpha channel that is fully opaque, clear the color
+#             under fully transparent pixels, and write PNGs as palette or
+#             grayscale when that holds every pixel exactly
+#   crop:     lossless, after cropping to the bounding box of the pixels
+#             that are not fully transparent
+OPTIMIZE_OUTPUTS = ('lossless', 'crop')
+
+# PNG text chunks recording where a cropped output sits on the original canvas
+OFFSET_KEY = 'imageopt:offset'
+CANVAS_KEY = 'imageopt:canvas'
+
+# Bytes per pixel of the modes the optimization can pick
+MODE_BYTES = {'RGBA': 4, 'RGB': 3, 'LA': 2, 'L': 1, 'P': 1}
+
+def resolve_profile(profile=None):
+    """Return (name, settings) for a profile name; None means the default"""
+    name = profile or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown encoder profile: {name}. Choose from {', '.join(PROFILES)}")
+    return name, dict(PROFILES[name])
+
+def needs_alpha(image):
+    """True when an image has an alpha channel with any non-opaque pixel"""
+    if image.mode not in ('RGBA', 'LA', 'PA') and not (image.mode == 'P' and 'transparency' in image.info):
+        return False
+    alpha = image.getchannel('A') if image.mode != 'P' else image.convert('RGBA').getchannel('A')
+    return alpha.getextrema()[0] < 255
+
+def prepare_image(image, profile=None):
+    """
+    Return (image, format, options) ready for image.save() under a profile
+
+    JPEG cannot store alpha: fully opaque images are converted to RGB, and
+    images with real transparency fall back to the balanced PNG settings.
+    """
+    name, settings = resolve_profile(profile)
+    format = settings.pop('format')
+
+    if format == 'JPEG':
+        if needs_alpha(image):
+            settings = dict(PROFILES[DEFAULT_PROFILE])
+            format = settings.pop('format')
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+    return image, format, settings
+
+def palette_image(image):
+    """
+    Return an RGB or RGBA image as a 'P' image holding the same pixels, or
+    None when it has more than 256 colors
+    """
+    colors = image.getcolors(256)
+    if colors is None:
+        return None
+    pixels = np.asarray(image)
+    keys = np.zeros(pixels.shape[:2], dtype=np.uint32)
+    for channel in range(pixels.shape[2]):
+        keys <<= 8
+        keys |= pixels[:, :, channel]
+    palette = sorted(color for _, color in colors)
+    palette_keys = np.zeros(len(palette), dtype=np.uint32)
+    for channel in range(pixels.shape[2]):
+        palette_keys <<= 8
+        palette_keys |= np.array([color[channel] for color in palette], dtype=np.uint32)
+
+    result = Image.fromarray(np.searchsorted(palette_keys, keys).astype(np.uint8), 'P')
+    result.putpalette([value for color in palette for value in color[:3]])
+    if image.mode == 'RGBA' and any(color[3] < 255 for color in palette):
+        result.info['transparency'] = bytes(color[3] for color in palette)
+    return result
+
+def is_gray(pixels):
+    """True when the R, G and B channels of an H x W x C array are equal"""
+    return bool(np.array_equal(pixels[:, :, 0], pixels[:, :, 1]) and np.array_equal(pixels[:, :, 1], pixels[:, :, 2]))
+
+def optimize_image(image, format='PNG', optimize_output='lossless'):
+    """
+    Apply an output optimization from OPTIMIZE_OUTPUTS before encoding
+
+    The visible pixels never change. Cropping and dropping a fully opaque
+    alpha channel apply to every format; palette and grayscale modes only
+    to PNG, where they cut the raw bytes per pixel to 1 or 2.
+
+    Returns:
+        tuple: (image, info) where info holds the modes before and after,
+            the canvas size, the crop offset, raw pixel bytes before and
+            after and the time spent in ms
+    """
+    if optimize_output not in OPTIMIZE_OUTPUTS:
+        raise ValueError(f"Unknown output optimization: {optimize_output}. Choose from {', '.join(OPTIMIZE_OUTPUTS)}")
+    started = time.perf_counter()
+    info = {'from_mode': image.mode, 'canvas': list(image.size), 'offset': [0, 0],
+            'raw_bytes_before': image.size[0] * image.size[1] * MODE_BYTES.get(image.mode, 4)}
+
+    if image.mode in ('RGB', 'RGBA'):
+        if image.mode == 'RGBA':
+            if optimize_output == 'crop':
+                # A fully transparent image keeps one pixel
+                bbox = image.getchannel('A').getbbox() or (0, 0, 1, 1)
+                image = image.crop(bbox)
+                info['offset'] = list(bbox[:2])
+            if image.getchannel('A').getextrema()[0] == 255:
+                image = image.convert('RGB')
+            else:
+                # Invisible colors only cost bytes, and would count as colors
+                pixels = np.array(image)
+                pixels[pixels[:, :, 3] == 0] = 0
+                image = Image.fromarray(pixels, 'RGBA')
+
+        if format == 'PNG':
+            pixels = np.asarray(image)
+            opaque = image.mode == 'RGB'
+            if opaque and is_gray(pixels):
+                image = image.convert('L')
+            else:
+                reduced = palette_image(image)
+                if reduced is not None:
+                    image = reduced
+                elif is_gray(pixels):
+                    image = image.convert('LA')
+
+    info['mode'] = image.mode
+    info['size'] = list(image.size)
+    info['raw_bytes_after'] = image.size[0] * image.size[1] * MODE_BYTES.get(image.mode, 4)
+    info['optimize_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return image, info
+
+def read_offset(source):
+    """
+    Return the crop placement stored in a PNG by the crop optimization as
+    {'offset': [x, y], 'canvas': [width, height]}, or None
+    """
+    with Image.open(source) as image:
+        text = getattr(image, 'text', {})
+        if OFFSET_KEY not in text or CANVAS_KEY not in text:
+            return None
+        return {
+            'offset': [int(value) for value in text[OFFSET_KEY].split(',')],
+            'canvas': [int(value) for value in text[CANVAS_KEY].split(',')],
+        }
+
+def png_compress_level(profile=None):
+    """
+    zlib level for the streaming PNG paths, which always write PNG
+
+    Non-PNG profiles use the balanced level there, since their encoders need
+    the whole image in memory.
+    """
+    name, settings = resolve_profile(profile)
+    if settings['format'] != 'PNG':
+        settings = PROFILES[DEFAULT_PROFILE]
+    return settings['compress_level']
+
+def save_with_profile(image, destination, profile=None, optimize_output=None):
+    """
+    Encode an image under a profile to a path or writable file-like object
+
+    optimize_output picks an optimization from OPTIMIZE_OUTPUTS; None
+    writes the image as it is. A cropped PNG records its offset on the
+    original canvas in text chunks, see read_offset().
+
+    Returns:
+        dict: profile, format, bytes written and encode_ms, plus the
+            optimize_image() info under 'optimized' when optimizing
+    """
+    name, _ = resolve_profile(profile)
+    image, format, options = prepare_image(image, name)
+    optimized = None
+    if optimize_output:
+        image, optimized = optimize_image(image, format, optimize_output)
+        if format == 'PNG' and optimize_output == 'crop':
+            placement = PngInfo()
+            placement.add_text(OFFSET_KEY, ','.join(str(value) for value in optimized['offset']))
+            placement.add_text(CANVAS_KEY, ','.join(str(value) for value in optimized['canvas']))
+            options['pnginfo'] = placement
+
+    start = destination.tell() if hasattr(destination, 'write') else 0
+    started = time.perf_counter()
+    image.save(destination, format, **options)
+    encode_ms = (time.perf_counter() - started) * 1000
+
+    if hasattr(destination, 'write'):
+        size = destination.tell() - start
+    else:
+        size = os.path.getsize(destination)
+    report = {'profile': name, 'format': format, 'bytes': size, 'encode_ms': round(encode_ms, 2)}
+    if optimized is not None:
+        report['optimized'] = optimized
+    return report
+
+def stream_report(writer, profile=None):
+    """Build a save_with_profile() style report for a finished PngStreamWriter"""
+    name, _ = resolve_profile(profile)
+    return {
+        'profile': name,
+        'format': 'PNG',
+        'bytes': writer.bytes_written,
+        'encode_ms': round(writer.encode_seconds * 1000, 2),
+    }
+
+def report_encode(report):
+    """Print an encode report in the scripts' log style"""
+    print(f"Encoded {report['format']} ({report['profile']} profile): "
+          f"{report['bytes']} bytes in {report['encode_ms']} ms")
+    optimized = report.get('optimized')
+    if optimized:
+        print(f"Optimized {optimized['from_mode']} to {optimized['mode']} in {optimized['optimize_ms']} ms: "
+              f"{optimized['size'][0]}x{optimized['size'][1]} at offset {tuple(optimized['offset'])} "
+              f"of {optimized['canvas'][0]}x{optimized['canvas'][1]}, raw pixels "
+              f"{optimized['raw_bytes_before']} -> {optimized['raw_bytes_after']} bytes")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Pixel Bridge
+Moves pixels between PIL Images and NumPy arrays with as few full-image
+copies as possible
+
+Pillow's array interface goes through tobytes(), so np.asarray(image) is
+one copy and np.array(image) is two. The other direction is free:
+Image.frombuffer() maps an L, RGBA or RGBX array without copying. The
+helpers here decode straight into NumPy-owned RGBA buffers and hand
+results back as Images sharing them. Every full-image copy they make is
+counted, see count_copies().
+"""
+
+import threading
+import contextlib
+import numpy as np
+from PIL import Image
+
+# Modes Image.frombuffer() maps without copying, by channel count
+SHARED_MODES = {1: 'L', 4: 'RGBA'}
+
+# Counters of the active count_copies() blocks
+_counters = []
+_counters_lock = threading.Lock()
+
+class CopyCounter:
+    """Full-image pixel copies made by this module while a count_copies() block is active"""
+
+    def __init__(self):
+        self.copies = 0
+        self.bytes = 0
+
+@contextlib.contextmanager
+def count_copies():
+    """
+    Count the full-image copies made inside the block, on any thread
+
+    Yields:
+        CopyCounter: copies and bytes copied so far
+    """
+    counter = CopyCounter()
+    with _counters_lock:
+        _counters.append(counter)
+    try:
+        yield counter
+    finally:
+        with _counters_lock:
+            _counters.remove(counter)
+
+def counted_copy(nbytes):
+    """Record one full-image copy of nbytes in every active counter"""
+    if not _counters:
+        return
+    with _counters_lock:
+        for counter in _counters:
+            counter.copies += 1
+            counter.bytes += nbytes
+
+def shared_image(pixels, writable=False):
+    """
+    Return an Image sharing the buffer of a C-contiguous H x W (L) or
+    H x W x 4 (RGBA) uint8 array
+
+    Pillow marks mapped Images read-only and copies them before the first
+    change; writable=True lets Image operations such as paste() write
+    straight into pixels instead.
+    """
+    channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+    if pixels.dtype != np.uint8 or channels not in SHARED_MODES or not pixels.flags.c_contiguous:
+        raise ValueError(f"Cannot share a {pixels.dtype} array of shape {pixels.shape} with an Image")
+    mode = SHARED_MODES[channels]
+    image = Image.frombuffer(mode, (pixels.shape[1], pixels.shape[0]), pixels, 'raw', mode, 0, 1)
+    if writable:
+        image.readonly = 0
+    return image
+
+def rgba_pixels(image, box=None):
+    """
+    Decode an image, or the box region of it, into a new RGBA array
+
+    An RGBA image is copied once, straight from its decoded buffer; other
+    modes are converted on the way, which costs a second copy.
+
+    Returns:
+        tuple: (H x W x 4 uint8 writable array, RGBA Image sharing its buffer)
+    """
+    left, top, right, bottom = box or (0, 0) + image.size
+    pixels = np.empty((bottom - top, right - left, 4), dtype=np.uint8)
+    view = shared_image(pixels, writable=True)
+    if image.mode != 'RGBA':
+        if (left, top, right, bottom) != (0, 0) + image.size:
+            image = image.crop((left, top, right, bottom))
+            left, top = 0, 0
+            counted_copy(image.size[0] * image.size[1] * 4)
+        image = image.convert('RGBA')
+        counted_copy(pixels.nbytes)
+    # A negative offset pastes only the part of the image inside the box
+    view.paste(image, (-left, -top))
+    counted_copy(pixels.nbytes)
+    return pixels, view
+
+def read_pixels(image):
+    """Return a read-only array of an Image's pixels, made with a single copy"""
+    pixels = np.asarray(image)
+    counted_copy(pixels.nbytes)
+    return pixels
+
+def copy_pixels(pixels):
+    """Return a writable copy of an array"""
+    counted_copy(pixels.nbytes)
+    return pixels.copy()
+
+def to_image(pixels):
+    """
+    Return an Image of an H x W, H x W x 3 or H x W x 4 uint8 array
+
+    L and RGBA arrays are shared (see shared_image); the Image is read-only,
+    so changing it copies first. RGB has no shared layout and is copied once.
+    """
+    channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+    if channels in SHARED_MODES and pixels.flags.c_contiguous:
+        return shared_image(pixels)
+    counted_copy(pixels.nbytes)
+    return Image.fromarray(np.ascontiguousarray(pixels))
+
+def flatten_pixels(pixels, color):
+    """
+    Return an RGB Image of an H x W x 4 RGBA array blended onto an (r, g, b)
+    color, made in a single pass
+
+    The RGBA array is pasted through a shared Image straight onto the
+    solid RGB result, so it is left unchanged and no RGBA canvas is made.
+    """
+    view = to_image(pixels)
+    result = Image.new('RGB', view.size, tuple(color))
+    result.paste(view, (0, 0), view)
+    counted_copy(pixels.shape[0] * pixels.shape[1] * 3)
+    return result
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Streaming PNG Writer
+Encodes an image row block by row block so the full image never has to be
+held in memory
+"""
+
+import zlib
+import time
+import struct
+import numpy as np
+
+# PNG color types for the supported channel counts
+COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+MODES = {'L': 1, 'LA': 2, 'RGB': 3, 'RGBA': 4}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Flush compressed data into IDAT chunks of roughly this size
+IDAT_CHUNK_SIZE = 256 * 1024
+
+class PngStreamWriter:
+    """
+    Write a PNG incrementally from uint8 row blocks
+
+    Usage:
+        with PngStreamWriter(path, width, height, 'RGBA') as writer:
+            for block in blocks:
+                writer.write_rows(block)  # shape (rows, width, channels)
+    """
+
+    def __init__(self, destination, width, height, mode='RGB', compress_level=6):
+        if mode not in MODES:
+            raise ValueError(f"Unsupported PNG mode: {mode}")
+
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.channels = MODES[mode]
+        self.rows_written = 0
+        # Encoder statistics: bytes written so far and time spent filtering
+        # and compressing
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+        # Accept either a path or an already open binary file
+        self._owns_file = not hasattr(destination, 'write')
+        self._file = open(destination, 'wb') if self._owns_file else destination
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_size = 0
+
+        self._file.write(PNG_SIGNATURE)
+        self.bytes_written += len(PNG_SIGNATURE)
+        self._write_chunk(b'IHDR', struct.pack(
+            '>IIBBBBB', width, height, 8, COLOR_TYPES[self.channels], 0, 0, 0
+        ))
+
+    def write_rows(self, rows):
+        """Append a block of rows shaped (rows, width, channels) or (rows, width)"""
+        rows = np.asarray(rows, dtype=np.uint8)
+        if rows.ndim == 2:
+            rows = rows[:, :, np.newaxis]
+        if rows.shape[1:] != (self.width, self.channels):
+            raise ValueError(f"Expected rows of shape (n, {self.width}, {self.channels}), got {rows.shape}")
+        if self.rows_written + rows.shape[0] > self.height:
+            raise ValueError("More rows written than the image height")
+
+        started = time.perf_counter()
+
+        # Sub filter: each byte stores the difference to the pixel on its left,
+        # which compresses photos far better than unfiltered rows
+        flat = rows.reshape(rows.shape[0], -1)
+        filtered = np.empty((flat.shape[0], flat.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:self.channels + 1] = flat[:, :self.channels]
+        np.subtract(flat[:, self.channels:], flat[:, :-self.channels], out=filtered[:, self.channels + 1:])
+
+        self._queue(self._compressor.compress(filtered.tobytes()))
+        self.rows_written += rows.shape[0]
+        self.encode_seconds += time.perf_counter() - started
+
+    def close(self):
+        """Finish the stream and close the file if this writer opened it"""
+        if self._file is None:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"Only {self.rows_written} of {self.height} rows were written")
+            started = time.perf_counter()
+            self._queue(self._compressor.flush(), force=True)
+            self.encode_seconds += time.perf_counter() - started
+            self._write_chunk(b'IEND', b'')
+        finally:
+            self._release()
+
+    def abort(self):
+        """Stop writing without completing the image"""
+        if self._file is not None:
+            self._release()
+
+    def _release(self):
+        if self._owns_file:
+            self._file.close()
+        self._file = None
+
+    def _queue(self, data, force=False):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending_size >= IDAT_CHUNK_SIZE or (force and self._pending_size):
+            self._write_chunk(b'IDAT', b''.join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+        self.bytes_written += len(data) + 12
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
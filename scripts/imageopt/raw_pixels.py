@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Raw Pixel Handoff
+Reads operation inputs from, and writes results to, uncompressed pixel rows
+in memory-mapped files. A caller that has already decoded an image, such as
+a Node route holding sharp's raw() output, skips an encode and a decode on
+the way in and another pair on the way out.
+
+Layout
+    A raw buffer is described by path, width, height, channels, stride and
+    offset. Starting offset bytes into the file are height rows of stride
+    bytes each, top row first. A row holds width pixels of channels
+    interleaved uint8 samples (1 = L, 3 = RGB, 4 = RGBA with straight, not
+    premultiplied, alpha) followed by stride - width * channels bytes of
+    padding, which are ignored. The file holds at least
+    offset + height * stride bytes.
+
+    Results are written at offset 0 without padding, the layout of sharp's
+    raw() output and of its raw input option. Files under /dev/shm live in
+    shared memory on Linux, so the pixels never reach a disk.
+"""
+
+import mmap
+import numpy as np
+from PIL import Image
+
+from .pixel_bridge import SHARED_MODES, shared_image, counted_copy
+
+# Image mode of each channel count
+RAW_MODES = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+def raw_layout(path, width, height, channels, stride=None, offset=0):
+    """Describe a raw buffer; stride defaults to rows without padding"""
+    return {'path': path, 'width': width, 'height': height, 'channels': channels,
+            'stride': stride or width * channels, 'offset': offset}
+
+def raw_size(layout):
+    """Bytes a file needs to hold a raw buffer"""
+    return layout['offset'] + layout['height'] * layout['stride']
+
+def check_layout(layout):
+    """
+    Validate a raw buffer description and fill in its stride and offset
+
+    Raises:
+        ValueError: When a field is missing or out of range
+    """
+    try:
+        layout = raw_layout(layout['path'], int(layout['width']), int(layout['height']),
+                            int(layout['channels']), int(layout.get('stride') or 0),
+                            int(layout.get('offset') or 0))
+    except KeyError as e:
+        raise ValueError(f"A raw buffer needs a {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("Raw buffer width, height, channels, stride and offset must be integers")
+
+    if layout['channels'] not in RAW_MODES:
+        raise ValueError(f"Raw buffers have 1, 3 or 4 channels, got {layout['channels']}")
+    if layout['width'] <= 0 or layout['height'] <= 0:
+        raise ValueError(f"Invalid raw buffer size: {layout['width']}x{layout['height']}")
+    if layout['stride'] < layout['width'] * layout['channels']:
+        raise ValueError(f"A stride of {layout['stride']} bytes is shorter than a row of "
+                         f"{layout['width']} x {layout['channels']} samples")
+    if layout['offset'] < 0:
+        raise ValueError(f"Invalid raw buffer offset: {layout['offset']}")
+    return layout
+
+def read_raw(layout):
+    """
+    Return an Image of a raw buffer
+
+    L and RGBA buffers are mapped, padding and all, without copying; the
+    Image is read-only, so changing it copies first. Pillow has no mapped
+    RGB layout, so RGB buffers are unpacked once.
+    """
+    layout = check_layout(layout)
+    mode = RAW_MODES[layout['channels']]
+    size = (layout['width'], layout['height'])
+    with open(layout['path'], 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapping) < raw_size(layout):
+        raise ValueError(f"{layout['path']} holds {len(mapping)} bytes, the layout needs {raw_size(layout)}")
+
+    # The Image keeps the mapping open for as long as it is alive
+    data = memoryview(mapping)[layout['offset']:raw_size(layout)]
+    if mode not in SHARED_MODES.values():
+        counted_copy(size[0] * size[1] * 4)
+    return Image.frombuffer(mode, size, data, 'raw', mode, layout['stride'], 1)
+
+def write_raw(image, path):
+    """
+    Write an Image to path as a raw buffer without padding and return its
+    description
+
+    L, RGB and RGBA Images keep their mode; others are converted to RGBA.
+    L and RGBA are pasted straight into the mapped file, RGB is packed once
+    and written.
+    """
+    if image.mode not in RAW_MODES.values():
+        image = image.convert('RGBA')
+        counted_copy(image.size[0] * image.size[1] * 4)
+    layout = raw_layout(path, image.size[0], image.size[1], len(image.getbands()))
+    nbytes = raw_size(layout)
+
+    with open(path, 'w+b') as f:
+        if image.mode in SHARED_MODES.values():
+            f.truncate(nbytes)
+            mapping = mmap.mmap(f.fileno(), nbytes)
+            shape = (layout['height'], layout['width'])
+            if layout['channels'] > 1:
+                shape += (layout['channels'],)
+            pixels = np.frombuffer(mapping, dtype=np.uint8).reshape(shape)
+            view = shared_image(pixels, writable=True)
+            view.paste(image)
+            del view, pixels
+            mapping.close()
+        else:
+            f.write(image.tobytes())
+    counted_copy(nbytes)
+    return layout
+
+def reference_read(layout):
+    """
+    Read a raw buffer with plain file reads, following the documented layout
+    and nothing else
+
+    This is the reference other consumers of the layout are checked against;
+    it does not share any code with read_raw().
+    """
+    path, width, height = layout['path'], layout['width'], layout['height']
+    channels = layout['channels']
+    stride = layout.get('stride') or width * channels
+    row_bytes = width * channels
+    rows = []
+    with open(path, 'rb') as f:
+        f.seek(layout.get('offset') or 0)
+        for _ in range(height):
+            row = f.read(stride)
+            if len(row) < row_bytes:
+                raise ValueError(f"{path} ends before row {len(rows)} of {height}")
+            rows.append(row[:row_bytes])
+    return Image.frombytes(RAW_MODES[channels], (width, height), b''.join(rows))
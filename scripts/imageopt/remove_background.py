@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+AI Background Removal Script using RemBG
+Converts images to PNG with transparent or solid color background
+"""
+
+import sys
+import os
+import io
+
+from .image_io import load_image, save_image, encode_image
+from .background_mask import MODES
+from .strip_stream import stream_segmented
+from .output_encoder import PROFILES, DEFAULT_PROFILE, OPTIMIZE_OUTPUTS, save_with_profile, report_encode
+from .model_backends import resolve_backend
+from .pixel_bridge import to_image, flatten_pixels
+from .mask_artifact import segment_foreground
+from .animation import foreground_frames, write_animation
+from .admission import JobRejected, plan_job
+from .instrumentation import measure, stage, record
+
+# Bump whenever the output for the same input and parameters changes
+__version__ = '1.2.0'
+
+def parse_hex_color(background_color):
+    """Convert a '#rrggbb' string to an (r, g, b) tuple"""
+    hex_color = background_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+def composite_solid(pixels, background_color):
+    """
+    Flatten an H x W x 4 RGBA array onto a '#rrggbb' background and return
+    it as an RGB Image, leaving the array unchanged
+    """
+    return flatten_pixels(pixels, parse_hex_color(background_color))
+
+def remove_background_image(source, background_type='transparent', background_color='#ffffff', mode='color',
+                            threads=None, backend=None):
+    """
+    Remove the background of an in-memory image and return a PIL Image
+    
+    Args:
+        source: File path, bytes, file-like object or PIL Image
+        background_type (str): 'transparent' or 'solid'
+        background_color (str): Hex color used when background_type is 'solid'
+        mode (str): 'color' removes every background-colored pixel,
+            'connected' only those connected to the image border, and
+            'pyramid' runs 'connected' at reduced resolution and refines
+            the edges at full resolution
+        threads (int): Bands segmented in parallel; None uses the configured
+            band_scheduler thread count
+        backend: 'auto', 'heuristic', 'onnx' or an .onnx model path, see
+            model_backends; a model replaces the mode-based segmentation
+    
+    With a result cache configured, the mask of a path or bytes source is
+    stored (see mask_artifact), so another background color for the same
+    input only re-composites and re-encodes.
+    """
+    # Background pixels become transparent; a mask stored for the same
+    # input is reused instead of segmenting again
+    image, img_array = segment_foreground(source, mode, threads, backend)
+    record(width=image.size[0], height=image.size[1])
+    
+    if background_type == 'solid':
+        # Blend the foreground onto the solid background
+        with stage('composite'):
+            return composite_solid(img_array, background_color)
+    
+    # Keep transparent background; the Image shares the array
+    return to_image(img_array)
+
+def remove_background_animation(source, destination, background_type='transparent', background_color='#ffffff',
+                                mode='color', profile=None, segmenter=None, threads=None):
+    """
+    Remove the background of every frame of an animated GIF or WebP
+
+    Frames are segmented in parallel a chunk at a time, sharing the first
+    frame's mask while the background stays static (see animation), and
+    written as an animation with the source frame durations.
+    
+    Returns:
+        dict: Encode report with the number of frames
+    """
+    image = load_image(source)
+    
+    def finish(pixels):
+        if background_type == 'solid':
+            return composite_solid(pixels, background_color)
+        return to_image(pixels)
+    
+    frames = foreground_frames(image, finish, mode, segmenter, threads)
+    return write_animation(image, frames, destination, profile)
+
+def remove_background_bytes(source, background_type='transparent', background_color='#ffffff', mode='color', format='PNG',
+                            profile=None, backend=None):
+    """
+    Remove the background of an in-memory image and return the encoded bytes
+    
+    An encoder profile, when given, takes precedence over format. The header
+    is checked against the limits in admission first, so jobs that do not
+    fit in memory raise JobRejected before anything is decoded.
+    """
+    if hasattr(source, 'read'):
+        source = source.read()
+    plan_job('remove_background', source, mode, stream=False)
+    result = remove_background_image(source, background_type, background_color, mode, backend=backend)
+    if profile is None:
+        return encode_image(result, format)
+    buffer = io.BytesIO()
+    save_with_profile(result, buffer, profile)
+    return buffer.getvalue()
+
+def remove_background(input_path, output_path, background_type='transparent', background_color='#ffffff', mode='color',
+                      stream=None, profile=None, backend=None, optimize_output=None):
+    """
+    Remove background from image with a segmentation model when one is
+    configured (see model_backends), else with simple color-based detection
+    that works without heavy AI dependencies
+    
+    With stream=True the image is processed in horizontal strips that are fed
+    straight into the PNG encoder; None does this automatically for very
+    large images in 'color' and 'pyramid' mode.
+    
+    Animated GIF and WebP inputs have every frame processed and are written
+    as animations in their own format.
+    
+    profile picks the encoder settings from output_encoder.PROFILES; streamed
+    outputs are always PNG, and animations are GIF or, with the webp
+    profile, WebP. optimize_output ('lossless' or 'crop', see
+    output_encoder.OPTIMIZE_OUTPUTS) shrinks the encoded output; it does
+    not apply to streamed or animated outputs.
+    
+    The header is checked against the limits in admission first: inputs
+    too large to hold in memory are streamed, and jobs no path fits raise
+    JobRejected before anything is decoded.
+    
+    Returns True on success, False when the plain PNG fallback was written
+    """
+    params = {'background_type': background_type, 'background_color': background_color, 'mode': mode,
+              'stream': stream, 'profile': profile, 'backend': backend, 'optimize_output': optimize_output}
+    with measure('remove_background', params):
+        try:
+            segmenter = resolve_backend('segment', backend)
+            plan = plan_job('remove_background', input_path, mode, stream, model=segmenter is not None,
+                            profile=profile)
+            record(path=plan['path'], estimated_memory_mb=plan['memory_mb'],
+                   estimated_cpu_seconds=plan['cpu_seconds'])
+            if plan['path'] == 'animation':
+                with stage('animation'):
+                    report = remove_background_animation(input_path, output_path, background_type,
+                                                         background_color, mode, profile, segmenter)
+                record(frames=report['frames'])
+            elif plan['path'] == 'stream':
+                fill_color = parse_hex_color(background_color) if background_type == 'solid' else None
+                with stage('stream'):
+                    report = stream_segmented(input_path, output_path, 0, mode, fill_color, profile=profile)
+            else:
+                final_image = remove_background_image(input_path, background_type, background_color, mode,
+                                                      backend=segmenter or 'heuristic')
+            
+                # Save the result
+                with stage('encode'):
+                    report = save_with_profile(final_image, output_path, profile, optimize_output)
+            record(output_bytes=report['bytes'], format=report['format'],
+                   backend=segmenter.name if segmenter is not None else 'heuristic')
+        
+            print(f"Background removed successfully: {output_path}")
+            report_encode(report)
+            if segmenter is not None:
+                print(f"Segmented with model: {segmenter.model_path}")
+            else:
+                print("Note: Using basic color-based detection. For better results, configure a segmentation model.")
+            return True
+        
+        except JobRejected:
+            # The fallback would decode the image the limits just rejected
+            raise
+        except Exception as e:
+            print(f"Error during background removal: {e}")
+            # Ultimate fallback - just convert to PNG with transparency
+            try:
+                image = load_image(input_path, 'RGBA')
+                save_image(image, output_path, 'PNG')
+                print(f"Image converted to PNG: {output_path}")
+                record(fallback=True)
+                return False
+            except Exception as fallback_error:
+                print(f"Fallback conversion failed: {fallback_error}")
+                sys.exit(1)
+
+def main(argv=None):
+    """Remove the background of one image from the command line"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print("Usage: python remove_background.py <input_path> <output_path> [background_type] [background_color] [mode] [profile] [optimize_output]")
+        sys.exit(1)
+    
+    input_path = argv[0]
+    output_path = argv[1]
+    background_type = argv[2] if len(argv) > 2 else 'transparent'
+    background_color = argv[3] if len(argv) > 3 else '#ffffff'
+    mode = argv[4] if len(argv) > 4 else 'color'
+    profile = argv[5] if len(argv) > 5 else DEFAULT_PROFILE
+    optimize_output = argv[6] if len(argv) > 6 else None
+    
+    # Validate segmentation mode
+    if mode not in MODES:
+        print(f"Mode must be one of: {', '.join(MODES)}")
+        sys.exit(1)
+    
+    # Validate encoder profile
+    if profile not in PROFILES:
+        print(f"Profile must be one of: {', '.join(PROFILES)}")
+        sys.exit(1)
+    
+    # Validate output optimization
+    if optimize_output is not None and optimize_output not in OPTIMIZE_OUTPUTS:
+        print(f"Output optimization must be one of: {', '.join(OPTIMIZE_OUTPUTS)}")
+        sys.exit(1)
+    
+    # Check if input file exists
+    if not os.path.exists(input_path):
+        print(f"Input file not found: {input_path}")
+        sys.exit(1)
+    
+    # Create output directory if it doesn't exist
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    try:
+        remove_background(input_path, output_path, background_type, background_color, mode, profile=profile,
+                          optimize_output=optimize_output)
+    except JobRejected as e:
+        print(f"Job rejected: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
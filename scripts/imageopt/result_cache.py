@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Result Cache for AI Tools
+Content-addressed on-disk cache of encoded outputs with LRU eviction
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import tempfile
+
+# Read input files in chunks of this size while hashing
+HASH_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1GB
+DEFAULT_MAX_ENTRIES = 10000
+
+# Writes between full scans of the cache directory, which pick up entries
+# other workers added and removed
+RESCAN_WRITES = 256
+
+# Cache shared by all operations in this process, configured on first use
+_cache = None
+_cache_configured = False
+
+def hash_input(source):
+    """Return a sha256 object fed with an input file's bytes, or with bytes themselves"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source)
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest
+
+class ResultCache:
+    """
+    Cache encoded results keyed by input bytes, operation, parameters and version
+
+    Entries are plain files, so hits are served by copying bytes without
+    decoding anything. Writes go through a temporary file and os.replace() so
+    concurrent workers sharing a cache directory never see partial entries.
+    Recency is tracked with file modification times, which are refreshed on
+    every hit.
+
+    Each process keeps running totals of the entries and bytes in the cache
+    and only scans the directory when they go over a limit, or after
+    RESCAN_WRITES writes to pick up other workers' changes. A scan that finds
+    the cache over its limits evicts down to 90% of them, so a full cache is
+    not rescanned on every write.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Running totals, filled in by the first scan
+        self.count = None
+        self.total_bytes = None
+        self.writes_since_scan = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, input_path, operation, params, version):
+        """Hash the input file together with everything that affects the output"""
+        digest = hash_input(input_path)
+        digest.update(json.dumps({
+            'operation': operation,
+            'params': params,
+            'version': version,
+        }, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        """Return the file path of a cache entry"""
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key, output_path):
+        """
+        Copy a cached result to output_path, returning whether it was a hit
+
+        The copy goes through a temporary file next to output_path, so readers
+        of output_path never see a partial file.
+        """
+        path = self.entry_path(key)
+        tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(path, 'rb') as src, open(tmp_path, 'xb') as tmp:
+                shutil.copyfileobj(src, tmp)
+            os.replace(tmp_path, output_path)
+            os.utime(path)
+        except FileNotFoundError:
+            # Missing, or evicted by another worker between lookup and copy
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            self.misses += 1
+            return False
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.hits += 1
+        return True
+
+    def get_bytes(self, key):
+        """
+        Return the bytes of an entry, or None when missing
+
+        Used for intermediate artifacts such as masks, so it does not count
+        towards the result hit/miss counters.
+        """
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def write_entry(self, key, write):
+        """Create an entry atomically with write(file) and evict old entries if needed"""
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                write(tmp)
+                size = tmp.tell()
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = None
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self.track(size, replaced)
+
+    def track(self, size, replaced=None):
+        """
+        Add a written entry to the running totals and scan the cache when
+        they go over a limit or a rescan is due
+        """
+        self.writes_since_scan += 1
+        if self.count is not None:
+            self.count += 1 if replaced is None else 0
+            self.total_bytes += size - (replaced or 0)
+        if (self.count is None or self.writes_since_scan >= RESCAN_WRITES
+                or self.count > self.max_entries or self.total_bytes > self.max_bytes):
+            self.evict()
+
+    def put(self, key, result_path):
+        """Store a result file under key and evict old entries if needed"""
+        with open(result_path, 'rb') as src:
+            self.write_entry(key, lambda tmp: shutil.copyfileobj(src, tmp))
+
+    def put_bytes(self, key, data):
+        """Store bytes under key and evict old entries if needed"""
+        self.write_entry(key, lambda tmp: tmp.write(data))
+
+    def entries(self):
+        """List (mtime, size, path) for every entry"""
+        found = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, path))
+        return found
+
+    def evict(self):
+        """
+        Scan the cache and, when it is over a limit, remove least recently
+        used entries until it is within 90% of its limits
+        """
+        entries = sorted(self.entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        count = len(entries)
+
+        if total_bytes > self.max_bytes or count > self.max_entries:
+            target_bytes = self.max_bytes - self.max_bytes // 10
+            target_entries = self.max_entries - self.max_entries // 10
+            for _, size, path in entries:
+                if total_bytes <= target_bytes and count <= target_entries:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+                count -= 1
+
+        self.count = count
+        self.total_bytes = total_bytes
+        self.writes_since_scan = 0
+
+    def stats(self):
+        """Return hit/miss counters and current cache usage"""
+        entries = self.entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+        }
+
+def cache_from_env():
+    """Create a cache from IMAGEOPT_CACHE_* environment variables, or None"""
+    cache_dir = os.environ.get('IMAGEOPT_CACHE_DIR')
+    if not cache_dir:
+        return None
+    return ResultCache(
+        cache_dir,
+        max_bytes=int(os.environ.get('IMAGEOPT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+        max_entries=int(os.environ.get('IMAGEOPT_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+    )
+
+def configure_cache(cache):
+    """Use the given ResultCache (or None to disable caching) in this process"""
+    global _cache, _cache_configured
+    _cache = cache
+    _cache_configured = True
+
+def get_cache():
+    """Return the process-wide cache, configuring it from the environment once"""
+    if not _cache_configured:
+        configure_cache(cache_from_env())
+    return _cache
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Strip Streaming for Very Large Images
+Runs background removal and transparency one horizontal strip at a time and
+feeds the rows straight into the streaming PNG encoder
+"""
+
+import os
+import math
+import numpy as np
+from PIL import Image
+
+from .image_io import REDUCED_MAX_SIDE, load_image, load_reduced, reduce_image
+from .png_stream import PngStreamWriter
+from .pixel_bridge import rgba_pixels
+from .output_encoder import png_compress_level, stream_report
+from .background_mask import (
+    DEFAULT_TOLERANCE, detect_background_color, apply_background_alpha,
+    pyramid_reduced_masks, refine_pyramid_rows,
+)
+
+# Rows converted and processed at a time
+DEFAULT_STRIP_ROWS = 256
+
+# Images with more pixels than this are streamed automatically, see admission
+STREAMING_PIXELS = 64 * 1000 * 1000
+
+# Segmentation modes that only need per-strip work
+STREAMING_MODES = ('color', 'pyramid')
+
+# Raw modes that can be memory-mapped straight from an uncompressed file
+MAPPABLE_MODES = {'L': 1, 'RGB': 3, 'RGBA': 4}
+
+def raw_pixel_layout(image):
+    """
+    Return (filename, offset, channels) of an opened image whose pixels are
+    one contiguous raw block in its file, or None
+
+    Only the header is looked at; admission uses this to tell which streamed
+    jobs skip the whole-image decode.
+    """
+    filename = getattr(image, 'filename', None)
+    if not filename or not os.path.isfile(filename) or len(image.tile) != 1:
+        return None
+
+    tile = image.tile[0]
+    codec, extents, offset, args = tile[0], tile[1], tile[2], tile[3]
+    if isinstance(args, str):
+        args = (args, 0, 1)
+    rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+    channels = MAPPABLE_MODES.get(image.mode)
+    width, height = image.size
+    if (codec != 'raw' or rawmode != image.mode or channels is None
+            or tuple(extents) != (0, 0, width, height)
+            or stride not in (0, width * channels) or orientation != 1):
+        return None
+    return filename, offset, channels
+
+def map_raw_pixels(image):
+    """
+    Memory-map the pixels of an uncompressed file, or return None
+
+    Uncompressed TIFF and PPM files store their rows as one contiguous raw
+    block, so np.memmap can expose them as an H x W x C array without
+    decoding; pages are read from disk only as strips touch them.
+    """
+    layout = raw_pixel_layout(image)
+    if layout is None:
+        return None
+
+    filename, offset, channels = layout
+    width, height = image.size
+    pixels = np.memmap(filename, dtype=np.uint8, mode='r', offset=offset, shape=(height, width, channels))
+    return pixels if channels > 1 else pixels[:, :, np.newaxis]
+
+def corner_pixels(image):
+    """Return the four corners of an image as a 2 x 2 RGBA array"""
+    width, height = image.size
+    corners = np.empty((2, 2, 4), dtype=np.uint8)
+    for row, y in enumerate([0, height - 1]):
+        for col, x in enumerate([0, width - 1]):
+            corners[row, col] = np.asarray(image.crop((x, y, x + 1, y + 1)).convert('RGBA'))[0, 0]
+    return corners
+
+def iter_rgba_strips(image, strip_rows=DEFAULT_STRIP_ROWS, mapped=None):
+    """
+    Yield (y0, y1, pixels) with a writable RGBA array for each strip
+
+    When mapped holds the memory-mapped pixels from map_raw_pixels(), strips
+    are copied from it instead of from the decoded image.
+    """
+    width, height = image.size
+    for y0 in range(0, height, strip_rows):
+        y1 = min(y0 + strip_rows, height)
+        if mapped is not None:
+            strip = np.empty((y1 - y0, width, 4), dtype=np.uint8)
+            strip[:, :, :3] = mapped[y0:y1, :, :3]
+            strip[:, :, 3] = mapped[y0:y1, :, 3] if mapped.shape[2] == 4 else 255
+            yield y0, y1, strip
+            continue
+        yield y0, y1, rgba_pixels(image, (0, y0, width, y1))[0]
+
+def reduced_rgba(image, source):
+    """Reduced RGBA copy matching what load_image_pyramid() produces"""
+    if image.format == 'JPEG':
+        return load_reduced(source, 'RGBA')
+    try:
+        return reduce_image(image).convert('RGBA')
+    except ValueError:
+        # Modes such as P cannot be reduced directly
+        return reduce_image(image.convert('RGBA'))
+
+def reduced_from_mapped(mapped, strip_rows=DEFAULT_STRIP_ROWS):
+    """
+    Box-reduce memory-mapped pixels band by band
+
+    Bands are whole multiples of the reduction factor, so the result matches
+    reduce_image() on the full image while only one band is in memory.
+    """
+    height, width = mapped.shape[:2]
+    factor = math.ceil(max(width, height) / REDUCED_MAX_SIDE)
+    band_rows = max(strip_rows // factor, 1) * factor
+    mode = {1: 'L', 3: 'RGB', 4: 'RGBA'}[mapped.shape[2]]
+    bands = []
+    for y0 in range(0, height, band_rows):
+        band = np.ascontiguousarray(mapped[y0:y0 + band_rows])
+        band = Image.fromarray(band[:, :, 0] if mode == 'L' else band, mode).convert('RGBA')
+        bands.append(np.asarray(band.reduce(factor) if factor > 1 else band))
+    return np.concatenate(bands)
+
+def stream_segmented(source, destination, background_alpha=0, mode='color', fill_color=None,
+                     strip_rows=DEFAULT_STRIP_ROWS, tolerance=DEFAULT_TOLERANCE, profile=None):
+    """
+    Segment the background strip by strip and stream the result into a PNG
+
+    Uncompressed TIFF and PPM files are memory-mapped and never decoded as a
+    whole. Other formats are decoded once in their native mode. Either way,
+    RGBA conversion, masking, compositing and encoding happen per strip, so
+    beyond the decode memory scales with strip_rows rather than image area.
+
+    Args:
+        source: File path, bytes, file-like object or PIL Image
+        destination: Output path or writable binary file
+        background_alpha (int): Alpha written for background pixels
+        mode (str): 'color' or 'pyramid'
+        fill_color (tuple): When given, background pixels are filled with this
+            (r, g, b) color and an RGB PNG is written
+        profile (str): Encoder profile; only its PNG compression level applies
+
+    Returns:
+        dict: Encode report, see output_encoder.save_with_profile()
+    """
+    if mode not in STREAMING_MODES:
+        raise ValueError(f"Streaming supports the {' and '.join(STREAMING_MODES)} modes, not {mode}")
+
+    if hasattr(source, 'read'):
+        source = source.read()
+    image = load_image(source)
+    width, height = image.size
+    mapped = map_raw_pixels(image)
+    if mapped is not None:
+        color = detect_background_color(mapped[::height - 1 or 1, ::width - 1 or 1])
+    else:
+        color = detect_background_color(corner_pixels(image))
+
+    if mode == 'pyramid':
+        if mapped is not None:
+            reduced = reduced_from_mapped(mapped, strip_rows)
+        else:
+            reduced = np.asarray(reduced_rgba(image, source))
+        reduced_mask, reduced_band = pyramid_reduced_masks(reduced, color, tolerance)
+
+    if fill_color is not None:
+        fill = np.array(fill_color[:3], dtype=np.uint8)
+
+    with PngStreamWriter(destination, width, height, 'RGB' if fill_color is not None else 'RGBA',
+                         png_compress_level(profile)) as writer:
+        for y0, y1, strip in iter_rgba_strips(image, strip_rows, mapped):
+            if mode == 'color':
+                apply_background_alpha(strip, color, background_alpha, tolerance=tolerance)
+            else:
+                mask = refine_pyramid_rows(strip, (height, width), y0, reduced_mask, reduced_band,
+                                           color, tolerance)
+                alpha = strip[:, :, 3]
+                alpha.fill(255)
+                np.copyto(alpha, np.uint8(background_alpha), where=mask)
+
+            if fill_color is not None:
+                # Alpha is either 0 or 255 here, so compositing is a plain select
+                rgb = strip[:, :, :3]
+                np.copyto(rgb, fill, where=strip[:, :, 3:] == 0)
+                writer.write_rows(rgb)
+            else:
+                writer.write_rows(strip)
+
+    return stream_report(writer, profile)
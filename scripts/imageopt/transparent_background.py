@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Transparent Background Script using RemBG
+Makes image backgrounds transparent with adjustable transparency levels
+"""
+
+import sys
+import os
+import io
+from PIL import Image
+import numpy as np
+
+from .image_io import load_image, load_reduced, save_image, encode_image
+from .background_mask import (
+    MODES, apply_background_alpha,
+    detect_background_color, connected_background_mask, render_preview,
+)
+from .strip_stream import stream_segmented
+from .output_encoder import PROFILES, DEFAULT_PROFILE, OPTIMIZE_OUTPUTS, save_with_profile, report_encode
+from .model_backends import resolve_backend
+from .pixel_bridge import to_image
+from .mask_artifact import segment_foreground
+from .animation import foreground_frames, write_animation
+from .admission import JobRejected, plan_job, get_limits, read_header
+from .instrumentation import measure, stage, record
+
+# Bump whenever the output for the same input and parameters changes
+__version__ = '1.2.0'
+
+def background_alpha_for(transparency_level):
+    """Convert a transparency level (0-100) to the alpha of background pixels"""
+    if transparency_level >= 100:
+        # Make background completely transparent
+        return 0
+    return int((transparency_level / 100) * 255)
+
+def blend_foreground_alpha(foreground, background_alpha, out=None):
+    """
+    Map a foreground alpha (255 foreground, 0 background, or a model's
+    probability in between) to the alpha of a transparency level
+
+    The mapping is looked up in a 256-entry table and written into out
+    (allocated when None; may be foreground itself, e.g. the alpha channel
+    of an RGBA array, to blend in place).
+    """
+    levels = np.arange(256, dtype=np.uint16)
+    table = ((levels * 255 + (255 - levels) * background_alpha + 127) // 255).astype(np.uint8)
+    if out is None:
+        out = np.empty_like(foreground)
+    return np.take(table, foreground, out=out, mode='clip')
+
+def make_transparent_image(source, transparency_level=100, mode='color', threads=None, backend=None):
+    """
+    Make the background of an in-memory image transparent and return a PIL Image
+    
+    Args:
+        source: File path, bytes, file-like object or PIL Image
+        transparency_level (int): 0-100, where 100 is fully transparent
+        mode (str): 'color', 'connected' or 'pyramid' background segmentation
+        threads (int): Bands segmented in parallel; None uses the configured
+            band_scheduler thread count
+        backend: 'auto', 'heuristic', 'onnx' or an .onnx model path, see
+            model_backends; a model replaces the mode-based segmentation
+    
+    With a result cache configured, the mask of a path or bytes source is
+    stored (see mask_artifact), so moving the transparency slider on the
+    same input only re-blends the alpha and re-encodes.
+    """
+    # Convert transparency level to alpha value (0-255)
+    alpha_value = background_alpha_for(transparency_level)
+    
+    # Blend between the background alpha and opaque by the foreground alpha;
+    # a mask stored for the same input is reused instead of segmenting again
+    image, data = segment_foreground(source, mode, threads, backend)
+    record(width=image.size[0], height=image.size[1])
+    with stage('composite'):
+        blend_foreground_alpha(data[:, :, 3], alpha_value, out=data[:, :, 3])
+    
+    # The Image shares the array
+    return to_image(data)
+
+def make_transparent_animation(source, destination, transparency_level=100, mode='color', profile=None,
+                               segmenter=None, threads=None):
+    """
+    Make the background of every frame of an animated GIF or WebP transparent
+
+    Frames are segmented in parallel a chunk at a time, sharing the first
+    frame's mask while the background stays static (see animation). GIF
+    only has on/off transparency, so partial levels need the webp profile.
+    
+    Returns:
+        dict: Encode report with the number of frames
+    """
+    alpha_value = background_alpha_for(transparency_level)
+    image = load_image(source)
+    
+    def finish(pixels):
+        blend_foreground_alpha(pixels[:, :, 3], alpha_value, out=pixels[:, :, 3])
+        return to_image(pixels)
+    
+    frames = foreground_frames(image, finish, mode, segmenter, threads)
+    return write_animation(image, frames, destination, profile)
+
+def make_transparent_bytes(source, transparency_level=100, mode='color', format='PNG', profile=None, backend=None):
+    """
+    Make the background of an in-memory image transparent and return the encoded bytes
+    
+    An encoder profile, when given, takes precedence over format. The header
+    is checked against the limits in admission first, so jobs that do not
+    fit in memory raise JobRejected before anything is decoded.
+    """
+    if hasattr(source, 'read'):
+        source = source.read()
+    plan_job('make_transparent', source, mode, stream=False)
+    result = make_transparent_image(source, transparency_level, mode, backend=backend)
+    if profile is None:
+        return encode_image(result, format)
+    buffer = io.BytesIO()
+    save_with_profile(result, buffer, profile)
+    return buffer.getvalue()
+
+def make_transparent_preview(source, max_side=512):
+    """
+    Render a cheap detection preview with the background tinted red
+    
+    Only a reduced decode is needed (JPEG draft mode where possible), so this
+    stays fast on very large photos.
+    """
+    data = np.array(load_reduced(source, 'RGBA', max_side))
+    mask = connected_background_mask(data, detect_background_color(data))
+    return Image.fromarray(render_preview(data, mask), 'RGBA')
+
+def transparent_preview(input_path, output_path, max_side=512, profile=None):
+    """
+    Write the detection preview of make_transparent_preview() to output_path
+
+    This is the make_transparent_preview operation of the worker and of
+    the --preview flag. JPEGs are decoded at reduced size in draft mode, so
+    only make_transparent's input pixel limit applies to them. Other
+    formats are decoded whole before they are reduced and are checked
+    against make_transparent's limits as an in-memory job.
+
+    Returns:
+        bool: True on success
+
+    Raises:
+        JobRejected: When the source does not fit the limits
+    """
+    with measure('make_transparent_preview', {'max_side': max_side, 'profile': profile}):
+        width, height, _, source_format, _ = read_header(input_path)
+        if source_format == 'JPEG':
+            limit = get_limits('make_transparent')['max_input_pixels']
+            if width * height > limit:
+                raise JobRejected(f"make_transparent_preview accepts inputs up to {limit / 1e6:g} MP, "
+                                  f"got {width}x{height} ({width * height / 1e6:.1f} MP)")
+        else:
+            plan_job('make_transparent', input_path, stream=False)
+        preview = make_transparent_preview(input_path, max_side)
+        with stage('encode'):
+            report = save_with_profile(preview, output_path, profile)
+        record(output_bytes=report['bytes'], format=report['format'])
+
+    print(f"Detection preview created: {output_path}")
+    report_encode(report)
+    return True
+
+def make_transparent(input_path, output_path, transparency_level=100, mode='color', stream=None, profile=None,
+                     backend=None, optimize_output=None):
+    """
+    Make image background transparent with a segmentation model when one is
+    configured (see model_backends), else with simple color-based detection
+    
+    Args:
+        input_path (str): Path to input image
+        output_path (str): Path to output image
+        transparency_level (int): 0-100, where 100 is fully transparent
+        mode (str): 'color', 'connected' or 'pyramid' background segmentation
+        stream (bool): Process in strips fed straight into the PNG encoder.
+            None streams automatically for very large images
+        profile (str): Encoder profile from output_encoder.PROFILES; streamed
+            outputs are always PNG, animated inputs are written as GIF or,
+            with the webp profile, WebP
+        backend: 'auto', 'heuristic', 'onnx' or an .onnx model path
+        optimize_output (str): 'lossless' or 'crop', see
+            output_encoder.OPTIMIZE_OUTPUTS; not applied to streamed or
+            animated outputs
+    
+    The header is checked against the limits in admission first: inputs
+    too large to hold in memory are streamed, and jobs no path fits raise
+    JobRejected before anything is decoded.
+    
+    Returns:
+        bool: True on success, False when the white-background fallback was used
+    """
+    params = {'transparency_level': transparency_level, 'mode': mode, 'stream': stream, 'profile': profile,
+              'backend': backend, 'optimize_output': optimize_output}
+    with measure('make_transparent', params):
+        try:
+            segmenter = resolve_backend('segment', backend)
+            plan = plan_job('make_transparent', input_path, mode, stream, model=segmenter is not None,
+                            profile=profile)
+            record(path=plan['path'], estimated_memory_mb=plan['memory_mb'],
+                   estimated_cpu_seconds=plan['cpu_seconds'])
+            if plan['path'] == 'animation':
+                with stage('animation'):
+                    report = make_transparent_animation(input_path, output_path, transparency_level, mode, profile,
+                                                        segmenter)
+                record(frames=report['frames'])
+            elif plan['path'] == 'stream':
+                with stage('stream'):
+                    report = stream_segmented(input_path, output_path, background_alpha_for(transparency_level), mode,
+                                              profile=profile)
+            else:
+                result_image = make_transparent_image(input_path, transparency_level, mode,
+                                                      backend=segmenter or 'heuristic')
+            
+                # Save the result
+                with stage('encode'):
+                    report = save_with_profile(result_image, output_path, profile, optimize_output)
+            record(output_bytes=report['bytes'], format=report['format'],
+                   backend=segmenter.name if segmenter is not None else 'heuristic')
+        
+            print(f"Background made transparent successfully: {output_path}")
+            report_encode(report)
+            print(f"Transparency level: {transparency_level}%")
+            if segmenter is not None:
+                print(f"Segmented with model: {segmenter.model_path}")
+            else:
+                print("Note: Using basic color-based detection. For better results, configure a segmentation model.")
+            return True
+        
+        except JobRejected:
+            # The fallback would decode the image the limits just rejected
+            raise
+        except Exception as e:
+            print(f"Error during transparency processing: {e}")
+            # Ultimate fallback - just convert to PNG with basic transparency
+            try:
+                image = load_image(input_path, 'RGBA')
+            
+                # Simple white background removal: every channel above 240
+                data = np.array(image)
+                alpha_value = int((transparency_level / 100) * 255)
+                apply_background_alpha(data, (255, 255, 255), background_alpha=alpha_value, tolerance=15)
+            
+                result_image = Image.fromarray(data, 'RGBA')
+                save_image(result_image, output_path, 'PNG')
+                print(f"Background made transparent with fallback method: {output_path}")
+                record(fallback=True)
+                return False
+            
+            except Exception as fallback_error:
+                print(f"Fallback transparency failed: {fallback_error}")
+                sys.exit(1)
+
+def main(argv=None):
+    """Make the background of one image transparent from the command line"""
+    argv = sys.argv[1:] if argv is None else argv
+    # --preview writes the detection preview instead of the full result
+    preview = '--preview' in argv
+    argv = [arg for arg in argv if arg != '--preview']
+    if len(argv) < 2:
+        print("Usage: python transparent_background.py [--preview] <input_path> <output_path> [transparency_level] [mode] [profile] [optimize_output]")
+        sys.exit(1)
+    
+    input_path = argv[0]
+    output_path = argv[1]
+    transparency_level = int(argv[2]) if len(argv) > 2 else 100
+    mode = argv[3] if len(argv) > 3 else 'color'
+    profile = argv[4] if len(argv) > 4 else DEFAULT_PROFILE
+    optimize_output = argv[5] if len(argv) > 5 else None
+    
+    # Validate transparency level
+    if not 0 <= transparency_level <= 100:
+        print("Transparency level must be between 0 and 100")
+        sys.exit(1)
+    
+    # Validate segmentation mode
+    if mode not in MODES:
+        print(f"Mode must be one of: {', '.join(MODES)}")
+        sys.exit(1)
+    
+    # Validate encoder profile
+    if profile not in PROFILES:
+        print(f"Profile must be one of: {', '.join(PROFILES)}")
+        sys.exit(1)
+    
+    # Validate output optimization
+    if optimize_output is not None and optimize_output not in OPTIMIZE_OUTPUTS:
+        print(f"Output optimization must be one of: {', '.join(OPTIMIZE_OUTPUTS)}")
+        sys.exit(1)
+    
+    # Check if input file exists
+    if not os.path.exists(input_path):
+        print(f"Input file not found: {input_path}")
+        sys.exit(1)
+    
+    # Create output directory if it doesn't exist
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    try:
+        if preview:
+            transparent_preview(input_path, output_path, profile=profile)
+            return
+        make_transparent(input_path, output_path, transparency_level, mode, profile=profile,
+                         optimize_output=optimize_output)
+    except JobRejected as e:
+        print(f"Job rejected: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Variant Generation
+Writes several outputs of one upload in a single pass: the source is decoded
+once, the background is segmented once for all remove_background and
+make_transparent variants (see mask_artifact), and a model upscaler runs
+once for all factors.
+Every variant matches the output of its single-operation function.
+"""
+
+import os
+import sys
+import json
+import argparse
+from PIL import Image
+import numpy as np
+
+from .image_io import load_image
+from .background_mask import MODES
+from .band_scheduler import run_tasks
+from .model_backends import resolve_backend
+from .pixel_bridge import to_image, copy_pixels
+from .output_encoder import PROFILES, OPTIMIZE_OUTPUTS, save_with_profile, report_encode
+from .mask_artifact import segment_foreground
+from .remove_background import composite_solid
+from .transparent_background import background_alpha_for, blend_foreground_alpha
+from .ai_upscale import (
+    DEFAULT_SHARPEN_RADIUS, DEFAULT_SHARPEN_AMOUNT, DEFAULT_TILE_SIZE, ai_upscale_image, fit_model_output,
+    parse_factor, upscale_tiled,
+)
+from .admission import plan_job
+from .instrumentation import measure, stage, record
+
+# Parameters each variant operation accepts besides output_path and profile
+VARIANT_PARAMS = {
+    'remove_background': {'background_type': 'transparent', 'background_color': '#ffffff', 'optimize_output': None},
+    'make_transparent': {'transparency_level': 100, 'optimize_output': None},
+    'ai_upscale': {'upscale_factor': '2x', 'tile_size': None, 'sharpen_radius': DEFAULT_SHARPEN_RADIUS,
+                   'sharpen_amount': DEFAULT_SHARPEN_AMOUNT},
+}
+
+# Operations whose variants share the background mask
+MASK_OPERATIONS = ('remove_background', 'make_transparent')
+
+def normalize_variant(variant):
+    """
+    Return a variant with every parameter filled in
+
+    Raises:
+        ValueError: For an unknown operation or parameter, or a missing output_path
+    """
+    operation = variant.get('operation')
+    if operation not in VARIANT_PARAMS:
+        raise ValueError(f"Unknown variant operation: {operation}. Choose from {', '.join(VARIANT_PARAMS)}")
+    if not variant.get('output_path'):
+        raise ValueError(f"Every variant needs an output_path: {variant}")
+    unknown = set(variant) - set(VARIANT_PARAMS[operation]) - {'operation', 'output_path', 'profile'}
+    if unknown:
+        raise ValueError(f"Unknown {operation} parameter(s): {', '.join(sorted(unknown))}")
+    if variant.get('profile') is not None and variant['profile'] not in PROFILES:
+        raise ValueError(f"Unknown encoder profile: {variant['profile']}")
+    if variant.get('optimize_output') is not None and variant['optimize_output'] not in OPTIMIZE_OUTPUTS:
+        raise ValueError(f"Unknown output optimization: {variant['optimize_output']}")
+    return {**VARIANT_PARAMS[operation], 'profile': None, **variant}
+
+def generate_variants(source, variants, mode='color', threads=None, backend=None):
+    """
+    Produce several outputs of one image with a single decode
+
+    Args:
+        source: File path, bytes, file-like object or PIL Image
+        variants (list): Dicts with an 'operation' ('remove_background',
+            'make_transparent' or 'ai_upscale'), an 'output_path' (path or
+            writable file-like object), an optional encoder 'profile' and
+            that operation's parameters, e.g.
+            {'operation': 'ai_upscale', 'output_path': 'x4.png', 'upscale_factor': '4x'}
+        mode (str): Segmentation mode shared by all masked variants
+        threads (int): Threads for segmentation, upscaling and encoding;
+            None uses the configured band_scheduler thread count
+        backend: 'auto', 'heuristic', 'onnx' or an .onnx model path, used
+            for both the segmentation and the upscaling variants
+
+    Returns:
+        list: One save_with_profile() report per variant, in order, with
+            the variant's operation and output_path added
+
+    Raises:
+        JobRejected: When a variant does not fit the limits in admission;
+            every variant is checked from the header before anything is decoded
+
+    Upscales are computed one after another since each already uses every
+    thread, then all variants are encoded in parallel. Without a model,
+    every factor is resized from the source: LANCZOS costs the same per
+    output pixel either way, and resizing a 2x result again would change
+    the output.
+    """
+    variants = [normalize_variant(variant) for variant in variants]
+    if mode not in MODES:
+        raise ValueError(f"Unknown segmentation mode: {mode}")
+
+    params = {'mode': mode, 'backend': backend, 'variants': [
+        {key: value for key, value in variant.items() if key != 'output_path'} for variant in variants
+    ]}
+    with measure('variants', params):
+        if hasattr(source, 'read'):
+            source = source.read()
+        upscaler = None
+        if any(variant['operation'] == 'ai_upscale' for variant in variants):
+            upscaler = resolve_backend('upscale', backend)
+        plans = []
+        for variant in variants:
+            if variant['operation'] == 'ai_upscale':
+                plan = plan_job('ai_upscale', source, factor=parse_factor(variant['upscale_factor']),
+                         tile_size=variant['tile_size'], model=upscaler is not None)
+            else:
+                # The shared mask is held in memory, so masked variants never stream
+                plan = plan_job(variant['operation'], source, mode, stream=False)
+            plans.append(plan)
+
+        # Decode once, as RGBA when a mask is needed since RGB converts from
+        # it losslessly; the mask is segmented once or reused from the cache
+        pixels = foreground = None
+        if any(variant['operation'] in MASK_OPERATIONS for variant in variants):
+            image, pixels = segment_foreground(source, mode, threads, backend)
+            foreground = pixels[:, :, 3]
+        else:
+            with stage('decode'):
+                image = load_image(source, 'RGB')
+                image.load()
+        record(width=image.size[0], height=image.size[1], variants=len(variants))
+
+        # Upscaled images by variant index; variants asking for the same
+        # upscale share one image
+        upscales = {}
+        if any(variant['operation'] == 'ai_upscale' for variant in variants):
+            rgb = load_image(image, 'RGB')
+            native = None
+            computed = {}
+            with stage('upscale'):
+                for index, variant in enumerate(variants):
+                    if variant['operation'] != 'ai_upscale':
+                        continue
+                    factor = parse_factor(variant['upscale_factor'])
+                    if plans[index]['path'] == 'tiled':
+                        # Very large outputs stream straight to their destination
+                        upscales[index] = upscale_tiled(rgb, variant['output_path'], factor,
+                                                        variant['tile_size'] or DEFAULT_TILE_SIZE,
+                                                        variant['profile'], variant['sharpen_radius'],
+                                                        variant['sharpen_amount'], threads)
+                        continue
+
+                    if upscaler is not None:
+                        key = factor
+                    else:
+                        key = (factor, variant['sharpen_radius'], variant['sharpen_amount'])
+                    if key not in computed:
+                        if upscaler is not None:
+                            # The model runs once; each factor is fitted from its output
+                            if native is None:
+                                native = Image.fromarray(upscaler.upscale(np.asarray(rgb)))
+                            computed[key] = fit_model_output(native, rgb.size, factor)
+                        else:
+                            computed[key] = ai_upscale_image(rgb, factor, variant['sharpen_radius'],
+                                                             variant['sharpen_amount'], threads, 'heuristic')
+                    upscales[index] = computed[key]
+
+        def render(index):
+            """Build one variant from the shared intermediates and encode it"""
+            variant = variants[index]
+            operation = variant['operation']
+            if isinstance(upscales.get(index), dict):
+                # Tiled upscales were encoded while they were built
+                return upscales[index]
+            if operation == 'remove_background':
+                # Both leave the shared pixels unchanged
+                if variant['background_type'] == 'solid':
+                    result = composite_solid(pixels, variant['background_color'])
+                else:
+                    result = to_image(pixels)
+            elif operation == 'make_transparent':
+                data = copy_pixels(pixels)
+                blend_foreground_alpha(foreground, background_alpha_for(variant['transparency_level']),
+                                       out=data[:, :, 3])
+                result = to_image(data)
+            else:
+                result = upscales[index]
+            return save_with_profile(result, variant['output_path'], variant['profile'], variant.get('optimize_output'))
+
+        with stage('encode'):
+            reports = run_tasks(render, [(index,) for index in range(len(variants))], threads)
+
+        for variant, report in zip(variants, reports):
+            report['operation'] = variant['operation']
+            if isinstance(variant['output_path'], (str, os.PathLike)):
+                report['output_path'] = os.fspath(variant['output_path'])
+        record(output_bytes=sum(report['bytes'] for report in reports))
+        return reports
+
+def load_variants(spec):
+    """Parse variants from a JSON list or the path of a JSON file holding one"""
+    if os.path.exists(spec):
+        with open(spec, 'r') as f:
+            return json.load(f)
+    return json.loads(spec)
+
+def main(argv=None):
+    """Write the variants of one image from the command line"""
+    parser = argparse.ArgumentParser(description="Write several variants of one image with a single decode")
+    parser.add_argument('input_path')
+    parser.add_argument('variants', help="JSON list of variants, or a file containing one")
+    parser.add_argument('--mode', default='color', choices=MODES, help="Segmentation mode")
+    parser.add_argument('--backend', help="auto, heuristic, onnx or an .onnx model path")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input_path):
+        print(f"Input file not found: {args.input_path}")
+        sys.exit(1)
+
+    try:
+        variants = load_variants(args.variants)
+        for variant in variants:
+            output_dir = os.path.dirname(variant.get('output_path') or '')
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+        reports = generate_variants(args.input_path, variants, args.mode, backend=args.backend)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    for report in reports:
+        print(f"{report['operation']}: {report['output_path']}")
+        report_encode(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Local Job Queue for AI Tools
+Kept so existing callers can run scripts/job_queue.py; the code lives in
+imageopt.job_queue (python3 -m imageopt queue)
+"""
+
+import sys
+import importlib
+
+if __name__ == "__main__":
+    from imageopt.job_queue import main
+    main()
+else:
+    # Importing this file gives the package module itself
+    sys.modules[__name__] = importlib.import_module('imageopt.job_queue')
@@ -6,6 +6,8 @@ Tests the Python scripts without heavy dependencies
 
 import os
 import sys
+import json
+import socket
 import tempfile
 from PIL import Image
 import numpy as np
@@ -23,6 +25,20 @@ def create_test_image():
     
     return img
 
+def exit_on_crash_input(job):
+    """Pool job that kills its worker process for inputs named crash.*, like the OOM killer would"""
+    if os.path.basename(job['input_path']).startswith('crash'):
+        os._exit(1)
+    from imageopt import batch_process
+    result = batch_process.run_job(job)
+    result['input_path'] = job['input_path']
+    return result
+
+def report_threads(job):
+    """Pool job that reports the band thread count of its worker process"""
+    from imageopt.band_scheduler import get_threads
+    return {'id': job['id'], 'ok': True, 'threads': get_threads()}
+
 def test_remove_background():
     """Test the background removal script"""
     print("Testing background removal...")
@@ -42,7 +58,7 @@ def test_remove_background():
         
         # Import and test the function
         sys.path.append(os.path.dirname(__file__))
-        from remove_background import remove_background
+        from imageopt.remove_background import remove_background
         
         # Test transparent background
         remove_background(input_path, output_path, 'transparent', '#ffffff')
@@ -83,7 +99,7 @@ def test_ai_upscale():
         
         # Import and test the function
         sys.path.append(os.path.dirname(__file__))
-        from ai_upscale import ai_upscale
+        from imageopt.ai_upscale import ai_upscale
         
         # Test 2x upscaling
         ai_upscale(input_path, output_path, '2x')
@@ -127,7 +143,7 @@ def test_transparent_background():
         
         # Import and test the function
         sys.path.append(os.path.dirname(__file__))
-        from transparent_background import make_transparent
+        from imageopt.transparent_background import make_transparent
         
         # Test 100% transparency
         make_transparent(input_path, output_path, 100)
@@ -149,6 +165,1378 @@ def test_transparent_background():
     except Exception as e:
         print(f"✗ Transparent background test failed: {e}")
 
+def test_ai_worker():
+    """Test the persistent worker protocol over stdin/stdout"""
+    print("Testing persistent AI worker...")
+
+    import json
+    import subprocess
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.jpg')
+        create_test_image().save(input_path, 'JPEG')
+
+        jobs = [
+            {'id': '1', 'operation': 'remove_background', 'input_path': input_path,
+             'output_path': os.path.join(tmp_dir, 'removed.png')},
+            {'id': '2', 'operation': 'make_transparent', 'input_path': input_path,
+             'output_path': os.path.join(tmp_dir, 'transparent.png'),
+             'params': {'transparency_level': 50}},
+            {'id': '3', 'operation': 'ai_upscale', 'input_path': input_path,
+             'output_path': os.path.join(tmp_dir, 'upscaled.png'),
+             'params': {'upscale_factor': '2x'}},
+            {'id': '4', 'operation': 'unknown'},
+        ]
+        stdin = ''.join(json.dumps(job) + '\n' for job in jobs)
+
+        worker = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ai_worker.py')
+        completed = subprocess.run(
+            [sys.executable, worker], input=stdin, capture_output=True, text=True, timeout=120
+        )
+        replies = [json.loads(line) for line in completed.stdout.splitlines()]
+
+        assert replies[0]['ready'] is True
+        results = {reply['id']: reply for reply in replies[1:]}
+        assert results['1']['ok'] and results['2']['ok'] and results['3']['ok']
+        assert not results['4']['ok']
+        assert Image.open(jobs[2]['output_path']).size == (400, 400)
+
+    print("✓ AI worker test passed - jobs processed by one interpreter")
+
+def test_batch_process():
+    """Test batch processing with resume"""
+    print("Testing batch processing...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.batch_process import run_batch
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = os.path.join(tmp_dir, 'source')
+        output_dir = os.path.join(tmp_dir, 'output')
+        os.makedirs(source_dir)
+        for index in range(3):
+            create_test_image().save(os.path.join(source_dir, f'image_{index}.jpg'), 'JPEG')
+
+        threads_env = os.environ.get('IMAGEOPT_THREADS')
+        summary = run_batch('make_transparent', source_dir, output_dir,
+                            params={'transparency_level': 100}, workers=2, max_in_flight=2)
+        assert summary['succeeded'] == 3 and summary['failed'] == 0
+        # The thread count goes to the pool processes, not into this process' environment
+        assert os.environ.get('IMAGEOPT_THREADS') == threads_env
+        assert os.path.exists(os.path.join(output_dir, 'image_0.png'))
+
+        # A resumed run only picks up the new image
+        create_test_image().save(os.path.join(source_dir, 'image_3.jpg'), 'JPEG')
+        summary = run_batch('make_transparent', source_dir, output_dir,
+                            params={'transparency_level': 100}, workers=2, resume=True)
+        assert summary['skipped'] == 3 and summary['succeeded'] == 1
+
+        # Glob matches keep their subdirectories, so same-named inputs do not
+        # collide, and non-image files are skipped
+        for album in ('a', 'b'):
+            os.makedirs(os.path.join(tmp_dir, 'albums', album))
+            create_test_image().save(os.path.join(tmp_dir, 'albums', album, 'cover.png'), 'PNG')
+        with open(os.path.join(tmp_dir, 'albums', 'a', 'notes.txt'), 'w') as f:
+            f.write('not an image')
+        glob_output = os.path.join(tmp_dir, 'glob_output')
+        summary = run_batch('make_transparent', os.path.join(tmp_dir, 'albums', '*', '*'), glob_output, workers=1)
+        assert summary['succeeded'] == 2 and summary['failed'] == 0
+        assert all(os.path.exists(os.path.join(glob_output, album, 'cover.png')) for album in ('a', 'b'))
+
+        # Inputs that would overwrite each other's outputs fail before anything runs
+        create_test_image().save(os.path.join(tmp_dir, 'albums', 'a', 'cover.jpg'), 'JPEG')
+        try:
+            run_batch('make_transparent', os.path.join(tmp_dir, 'albums', '*', '*'),
+                      os.path.join(tmp_dir, 'clash_output'), workers=1)
+            assert False, "Duplicate output names should fail the batch"
+        except ValueError as e:
+            assert 'would both be written' in str(e)
+        assert not os.path.exists(os.path.join(tmp_dir, 'clash_output'))
+
+        # A worker process that dies fails its input and the batch goes on
+        crash_dir = os.path.join(tmp_dir, 'crash_source')
+        os.makedirs(crash_dir)
+        for name in ('a.jpg', 'crash.jpg', 'z.jpg'):
+            create_test_image().save(os.path.join(crash_dir, name), 'JPEG')
+        from imageopt import batch_process
+        run_batch_job = batch_process.run_batch_job
+        batch_process.run_batch_job = exit_on_crash_input
+        try:
+            summary = run_batch('make_transparent', crash_dir, os.path.join(tmp_dir, 'crash_output'),
+                                workers=1, max_in_flight=1)
+        finally:
+            batch_process.run_batch_job = run_batch_job
+        assert summary['succeeded'] == 2 and summary['failed'] == 1
+        with open(summary['report_path']) as report:
+            failed = [entry for entry in map(json.loads, report) if not entry['ok']]
+        assert [os.path.basename(entry['input_path']) for entry in failed] == ['crash.jpg']
+        assert failed[0]['error'] == "Worker process died"
+
+    print("✓ Batch processing test passed - resume skipped finished images")
+
+def test_ai_upscale_tiled():
+    """Test that tiled upscaling matches the whole-image path"""
+    print("Testing tiled AI upscaling...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.ai_upscale import ai_upscale
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        create_test_image().save(input_path, 'PNG')
+
+        for factor in ['2x', '4x']:
+            whole_path = os.path.join(tmp_dir, f'whole_{factor}.png')
+            tiled_path = os.path.join(tmp_dir, f'tiled_{factor}.png')
+            ai_upscale(input_path, whole_path, factor, tile_size=0)
+            ai_upscale(input_path, tiled_path, factor, tile_size=48)
+
+            whole = np.array(Image.open(whole_path))
+            tiled = np.array(Image.open(tiled_path))
+            assert whole.shape == tiled.shape
+            assert np.array_equal(whole, tiled)
+
+    print("✓ Tiled AI upscaling test passed - output is seam-free")
+
+def test_admission():
+    """Test that jobs are planned, routed and rejected from the header alone"""
+    print("Testing admission control...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.admission import JobRejected, configure_limits, plan_job, read_header
+    from imageopt.remove_background import remove_background
+    from imageopt.ai_upscale import ai_upscale, ai_upscale_bytes
+    from imageopt.job_queue import JobQueue
+    from imageopt import ai_worker
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        Image.new('RGB', (1000, 800), (255, 255, 255)).save(input_path)
+
+        plan = plan_job('remove_background', input_path)
+        assert plan['path'] == 'memory' and plan['width'] == 1000 and plan['frames'] == 1
+        assert plan['memory_mb'] > 0 and plan['cpu_seconds'] > 0
+        upscale_memory = [plan_job('ai_upscale', input_path, factor=factor)['memory_mb'] for factor in (2, 4)]
+        assert upscale_memory[1] > upscale_memory[0]
+
+        # Streaming a PNG still decodes it whole; an uncompressed TIFF is memory-mapped
+        tiff_path = os.path.join(tmp_dir, 'input.tif')
+        Image.open(input_path).save(tiff_path)
+        png_stream = plan_job('remove_background', input_path, stream=True)
+        tiff_stream = plan_job('remove_background', tiff_path, stream=True)
+        assert png_stream['path'] == tiff_stream['path'] == 'stream'
+        assert abs(png_stream['memory_mb'] - tiff_stream['memory_mb'] - 1000 * 800 * 3 / 1024 / 1024) < 0.2
+
+        # Reading a header closes the file it opened, but not an Image passed in
+        from imageopt import image_io
+        opened = []
+        original_load_image = image_io.load_image
+        image_io.load_image = lambda *args, **kwargs: opened.append(original_load_image(*args, **kwargs)) or opened[-1]
+        try:
+            assert read_header(input_path)[:2] == (1000, 800)
+            assert opened[0].fp is None
+            with Image.open(input_path) as image:
+                read_header(image)
+                assert image.fp is not None
+        finally:
+            image_io.load_image = original_load_image
+
+        configure_limits({
+            'remove_background': {'max_memory_mb': 70},
+            'ai_upscale': {'max_output_pixels': 10 * 1000 * 1000},
+        })
+        try:
+            # Over the memory limit in memory, but the streamed path fits
+            assert plan_job('remove_background', input_path)['path'] == 'stream'
+            output_path = os.path.join(tmp_dir, 'removed.png')
+            assert remove_background(input_path, output_path)
+            assert Image.open(output_path).size == (1000, 800)
+
+            # Connected mode cannot stream, so it is rejected
+            try:
+                remove_background(input_path, output_path, mode='connected')
+                assert False, "Connected mode should be over the memory limit"
+            except JobRejected as e:
+                assert 'MB limit' in str(e)
+
+            # 8x of 0.8 MP is over the output limit: nothing is written
+            upscaled_path = os.path.join(tmp_dir, 'upscaled.png')
+            try:
+                ai_upscale(input_path, upscaled_path, '8x')
+                assert False, "8x should be over the output limit"
+            except JobRejected:
+                pass
+            assert not os.path.exists(upscaled_path)
+            reply = ai_worker.run_job({'operation': 'ai_upscale', 'input_path': input_path,
+                                       'output_path': upscaled_path, 'params': {'upscale_factor': '8x'}})
+            assert not reply['ok'] and reply['rejected'] and 'MP' in reply['error']
+
+            # The bytes and variants entry points are admitted the same way
+            with open(input_path, 'rb') as f:
+                data = f.read()
+            try:
+                ai_upscale_bytes(data, '8x')
+                assert False, "8x bytes should be over the output limit"
+            except JobRejected:
+                pass
+            variant_paths = [os.path.join(tmp_dir, name) for name in ('cutout.png', 'x8.png')]
+            reply = ai_worker.run_job({'operation': 'variants', 'input_path': input_path, 'params': {'variants': [
+                {'operation': 'make_transparent', 'output_path': variant_paths[0]},
+                {'operation': 'ai_upscale', 'output_path': variant_paths[1], 'upscale_factor': '8x'},
+            ]}})
+            assert not reply['ok'] and reply['rejected'] and 'MP' in reply['error']
+            assert not any(os.path.exists(path) for path in variant_paths)
+            assert ai_upscale(input_path, upscaled_path, '2x')
+
+            # The queue rejects such jobs before queueing them
+            queue = JobQueue(os.path.join(tmp_dir, 'jobs.sqlite3'))
+            try:
+                queue.submit('ai_upscale', input_path, upscaled_path, {'upscale_factor': '8x'})
+                assert False, "Submitting should be rejected"
+            except JobRejected:
+                pass
+            assert queue.stats()['queued'] == 0
+            queue.close()
+        finally:
+            configure_limits(None)
+
+        # The output cap only applies in memory: 8x of a 12 MP photo is tiled
+        # under the default limits, and rejected only when tiling is off
+        photo_path = os.path.join(tmp_dir, 'photo.png')
+        Image.new('RGB', (4000, 3000), (255, 255, 255)).save(photo_path)
+        assert plan_job('ai_upscale', photo_path, factor=8)['path'] == 'tiled'
+        try:
+            plan_job('ai_upscale', photo_path, factor=8, tile_size=0)
+            assert False, "8x in memory should be over the output limit"
+        except JobRejected as e:
+            assert 'in memory' in str(e)
+
+    print("✓ Admission test passed - jobs planned from headers")
+
+def test_result_cache():
+    """Test cache hits, misses and LRU eviction"""
+    print("Testing result cache...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt import ai_worker
+    from imageopt.result_cache import ResultCache
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        create_test_image().save(input_path, 'PNG')
+        cache = ResultCache(os.path.join(tmp_dir, 'cache'), max_entries=2)
+        ai_worker.configure_cache(cache)
+
+        try:
+            job = {'operation': 'remove_background', 'input_path': input_path,
+                   'output_path': os.path.join(tmp_dir, 'first.png')}
+            first = ai_worker.run_job(job)
+            second = ai_worker.run_job(dict(job, output_path=os.path.join(tmp_dir, 'second.png')))
+            # Spelling out a default parameter hits the same entry
+            third = ai_worker.run_job(dict(job, output_path=os.path.join(tmp_dir, 'third.png'),
+                                           params={'background_type': 'transparent'}))
+        finally:
+            ai_worker.configure_cache(None)
+
+        assert first['cache'] == 'miss' and second['cache'] == 'hit' and third['cache'] == 'hit'
+        with open(job['output_path'], 'rb') as a, open(second['output_path'], 'rb') as b:
+            assert a.read() == b.read()
+        assert cache.hits == 2 and cache.misses == 1
+
+        # The least recently used entry is evicted first
+        for name in ['a', 'b', 'c']:
+            result_path = os.path.join(tmp_dir, name)
+            with open(result_path, 'wb') as f:
+                f.write(name.encode())
+            cache.put(name * 64, result_path)
+            os.utime(cache.entry_path(name * 64), (0, len(cache.entries())))
+        assert cache.stats()['entries'] == 2
+        assert not os.path.exists(cache.entry_path('a' * 64))
+
+        # Writes under the limits keep running totals instead of walking the cache
+        cache = ResultCache(os.path.join(tmp_dir, 'large'), max_entries=100)
+        scans = []
+        entries = cache.entries
+        cache.entries = lambda: scans.append(1) or entries()
+        for index in range(10):
+            cache.put_bytes(f'{index:064d}', b'x' * 10)
+        cache.put_bytes(f'{0:064d}', b'y' * 20)
+        assert len(scans) == 1
+        assert (cache.count, cache.total_bytes) == (10, 110)
+
+        # Going over the limit evicts down to 90% of it
+        for index in range(10, 101):
+            cache.put_bytes(f'{index:064d}', b'x' * 10)
+        assert len(scans) == 2 and cache.count == 90 == cache.stats()['entries']
+
+        # Hits replace the output in one step and leave no temporary files
+        output_path = os.path.join(tmp_dir, 'output.bin')
+        assert cache.get(f'{100:064d}', output_path)
+        assert os.listdir(tmp_dir).count('output.bin') == 1
+        assert not [name for name in os.listdir(tmp_dir) if name.endswith('.tmp')]
+        with open(output_path, 'rb') as f:
+            assert f.read() == b'x' * 10
+
+    print("✓ Result cache test passed - hits served from disk")
+
+def test_mask_artifact():
+    """Test that stored masks make parameter sweeps skip segmentation"""
+    print("Testing mask artifacts...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt import mask_artifact
+    from imageopt.result_cache import ResultCache, configure_cache
+    from imageopt.remove_background import remove_background_image
+    from imageopt.transparent_background import make_transparent_image
+
+    # Two-level masks are bit-packed, model probabilities kept as bytes
+    binary = np.zeros((300, 400), dtype=np.uint8)
+    binary[50:250, 100:300] = 255
+    packed = mask_artifact.pack_mask(binary)
+    assert len(packed) < binary.size // 8
+    assert np.array_equal(mask_artifact.unpack_mask(packed), binary)
+    soft = np.random.default_rng(0).integers(0, 256, (30, 40), dtype=np.uint8)
+    assert np.array_equal(mask_artifact.unpack_mask(mask_artifact.pack_mask(soft)), soft)
+    try:
+        mask_artifact.unpack_mask(b'x' * 32)
+        assert False, "Foreign data should be rejected"
+    except ValueError:
+        pass
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        create_test_image().save(input_path, 'PNG')
+        expected = [np.array(make_transparent_image(input_path, level)) for level in (30, 70)]
+        expected_solid = np.array(remove_background_image(input_path, 'solid', '#00ff00'))
+
+        segment_calls = []
+        original_segment = mask_artifact.segment_background
+        mask_artifact.segment_background = lambda *args, **kwargs: (
+            segment_calls.append(1), original_segment(*args, **kwargs))[1]
+        configure_cache(ResultCache(os.path.join(tmp_dir, 'cache')))
+        try:
+            first = np.array(make_transparent_image(input_path, 30))
+            second = np.array(make_transparent_image(input_path, 70))
+            solid = np.array(remove_background_image(input_path, 'solid', '#00ff00'))
+            # Another mode is another mask
+            remove_background_image(input_path, mode='connected')
+        finally:
+            mask_artifact.segment_background = original_segment
+            configure_cache(None)
+
+        assert len(segment_calls) == 2
+        assert np.array_equal(first, expected[0]) and np.array_equal(second, expected[1])
+        assert np.array_equal(solid, expected_solid)
+
+    print("✓ Mask artifact test passed - segmentation reused across parameters")
+
+def test_pixel_bridge():
+    """Test that pixels are shared between PIL and NumPy and copies are counted"""
+    print("Testing pixel bridge...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.pixel_bridge import count_copies, rgba_pixels, to_image
+    from imageopt.remove_background import composite_solid, remove_background_image
+    from imageopt.transparent_background import blend_foreground_alpha, make_transparent_image
+    from imageopt.ai_upscale import ai_upscale_image
+
+    # Images made from RGBA arrays share their buffer
+    pixels, view = rgba_pixels(create_test_image())
+    assert view.mode == 'RGBA' and view.getpixel((0, 0)) == (255, 255, 255, 255)
+    pixels[0, 0] = (1, 2, 3, 4)
+    assert view.getpixel((0, 0)) == (1, 2, 3, 4) and to_image(pixels).getpixel((0, 0)) == (1, 2, 3, 4)
+    region, _ = rgba_pixels(create_test_image().convert('RGBA'), (40, 60, 90, 70))
+    assert np.array_equal(region, np.array(create_test_image().convert('RGBA'))[60:70, 40:90])
+
+    # Compositing matches pasting onto a solid image and leaves the array alone
+    rgba = np.random.default_rng(0).integers(0, 256, (64, 80, 4), dtype=np.uint8)
+    before = rgba.copy()
+    expected = Image.new('RGBA', (80, 64), (0, 128, 255, 255))
+    expected.paste(Image.fromarray(before), (0, 0), Image.fromarray(before))
+    flattened = composite_solid(rgba, '#0080ff')
+    assert flattened.mode == 'RGB'
+    assert np.array_equal(np.array(flattened), np.array(expected.convert('RGB')))
+    assert np.array_equal(rgba, before)
+
+    # Blending alpha in place matches the arithmetic
+    foreground = before[:, :, 3].astype(np.uint16)
+    blend_foreground_alpha(rgba[:, :, 3], 77, out=rgba[:, :, 3])
+    assert np.array_equal(rgba[:, :, 3], (foreground * 255 + (255 - foreground) * 77 + 127) // 255)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rgb_path = os.path.join(tmp_dir, 'rgb.png')
+        rgba_path = os.path.join(tmp_dir, 'rgba.png')
+        create_test_image().save(rgb_path, 'PNG')
+        create_test_image().convert('RGBA').save(rgba_path, 'PNG')
+
+        # Full-image copies per request: RGB inputs are converted to RGBA
+        # on the way into the array, RGBA inputs are copied straight in
+        cases = [
+            (2, lambda: remove_background_image(rgb_path, threads=1)),
+            (1, lambda: remove_background_image(rgba_path, threads=1)),
+            (3, lambda: remove_background_image(rgb_path, 'solid', '#00ff00', threads=1)),
+            (2, lambda: make_transparent_image(rgb_path, 50, threads=1)),
+            (2, lambda: ai_upscale_image(rgb_path, '2x', threads=1)),
+        ]
+        for expected_copies, run in cases:
+            with count_copies() as copies:
+                run()
+            assert copies.copies == expected_copies, (copies.copies, expected_copies)
+
+    print("✓ Pixel bridge test passed - buffers shared and copies counted")
+
+def test_raw_pixels():
+    """Test that worker jobs read and write raw pixel buffers in the documented layout"""
+    print("Testing raw pixel handoff...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.ai_worker import run_job
+    from imageopt.raw_pixels import read_raw, write_raw, reference_read, check_layout
+    from imageopt.pixel_bridge import count_copies
+
+    source = create_test_image().convert('RGBA')
+    width, height = source.size
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        source.save(input_path, 'PNG')
+
+        # A padded buffer behind a header, as another process would lay it out
+        stride = width * 4 + 12
+        rows = np.zeros((height, stride), dtype=np.uint8)
+        rows[:, :width * 4] = np.array(source).reshape(height, -1)
+        raw_path = os.path.join(tmp_dir, 'input.raw')
+        with open(raw_path, 'wb') as f:
+            f.write(b'header' + rows.tobytes())
+        layout = {'path': raw_path, 'width': width, 'height': height, 'channels': 4, 'stride': stride, 'offset': 6}
+        assert reference_read(layout).tobytes() == source.tobytes()
+        with count_copies() as copies:
+            mapped = read_raw(layout)
+        assert mapped.tobytes() == source.tobytes() and copies.copies == 0
+
+        # Results written by the worker match the encoded outputs and read back with the reference consumer
+        cases = [
+            ('make_transparent', {'transparency_level': 60}, 4),
+            ('remove_background', {'background_type': 'solid', 'background_color': '#336699'}, 3),
+            ('ai_upscale', {'upscale_factor': '2x'}, 3),
+        ]
+        for operation, params, channels in cases:
+            output_path = os.path.join(tmp_dir, f'{operation}.png')
+            encoded = run_job({'operation': operation, 'input_path': input_path, 'output_path': output_path,
+                               'params': params})
+            result = run_job({'operation': operation, 'input_raw': layout,
+                              'output_raw': {'path': os.path.join(tmp_dir, f'{operation}.raw')}, 'params': params})
+            assert encoded['ok'] and result['ok'], result
+            described = result['output_raw']
+            assert described['channels'] == channels and described['offset'] == 0
+            assert described['stride'] == described['width'] * channels
+            assert os.path.getsize(described['path']) == described['stride'] * described['height']
+            assert reference_read(described).tobytes() == Image.open(output_path).tobytes()
+
+        # Encoded inputs can produce raw outputs too, and every mode round-trips
+        result = run_job({'operation': 'make_transparent', 'input_path': input_path,
+                          'output_raw': {'path': os.path.join(tmp_dir, 'from_file.raw')}})
+        assert result['ok'] and result['output_raw']['width'] == width
+        for mode in ('L', 'RGB', 'RGBA'):
+            written = write_raw(source.convert(mode), os.path.join(tmp_dir, f'{mode}.raw'))
+            assert read_raw(written).tobytes() == reference_read(written).tobytes() == source.convert(mode).tobytes()
+
+        # Bad descriptions fail the job instead of reading past the buffer
+        for bad, message in [
+            ({'path': raw_path, 'width': width}, 'needs a height'),
+            (dict(layout, channels=2), '1, 3 or 4 channels'),
+            (dict(layout, stride=width), 'shorter than a row'),
+            (dict(layout, height=height + 1), 'the layout needs'),
+        ]:
+            result = run_job({'operation': 'make_transparent', 'input_raw': bad,
+                              'output_raw': {'path': os.path.join(tmp_dir, 'bad.raw')}})
+            assert not result['ok'] and message in result['error'], result
+        assert check_layout({'path': raw_path, 'width': 3, 'height': 2, 'channels': 3})['stride'] == 9
+
+    print("✓ Raw pixel test passed - buffers handed over without encoding")
+
+def test_animation():
+    """Test that animated inputs keep every frame and their durations"""
+    print("Testing animated images...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt import animation
+    from imageopt.admission import JobRejected, configure_limits, plan_job
+    from imageopt.remove_background import remove_background, remove_background_image
+    from imageopt.ai_upscale import ai_upscale
+
+    # A square moving over a static white background
+    frames = []
+    for index in range(6):
+        pixels = np.full((60, 80, 3), 255, dtype=np.uint8)
+        pixels[20:40, 5 + index * 8:25 + index * 8] = (200, 30, 30)
+        frames.append(Image.fromarray(pixels))
+    durations = [40 + 10 * index for index in range(6)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.gif')
+        frames[0].save(input_path, save_all=True, append_images=frames[1:], duration=durations, loop=0)
+        output_path = os.path.join(tmp_dir, 'output.gif')
+
+        # Only the first frame is segmented in full; the others reuse its mask
+        segment_calls = []
+        original_segment = animation.segment_background
+        animation.segment_background = lambda *args, **kwargs: (
+            segment_calls.append(1), original_segment(*args, **kwargs))[1]
+        try:
+            assert remove_background(input_path, output_path)
+        finally:
+            animation.segment_background = original_segment
+        assert len(segment_calls) == 1
+
+        # The frames that reuse the mask are counted across threads
+        mask = animation.StaticMask()
+        with Image.open(input_path) as image:
+            original_static_mask = animation.StaticMask
+            animation.StaticMask = lambda mode: mask
+            try:
+                assert len(list(animation.segment_frames(image, threads=4))) == 6
+            finally:
+                animation.StaticMask = original_static_mask
+        assert mask.reused == 5
+
+        result = Image.open(output_path)
+        assert result.n_frames == 6
+        for index, frame in enumerate(frames):
+            result.seek(index)
+            assert result.info['duration'] == durations[index]
+            expected = np.array(remove_background_image(frame.convert('RGBA')))[:, :, 3]
+            assert np.array_equal(np.array(result.convert('RGBA'))[:, :, 3], expected)
+
+        # The webp profile writes an animated WebP
+        upscaled_path = os.path.join(tmp_dir, 'upscaled.webp')
+        assert ai_upscale(input_path, upscaled_path, '2x', profile='webp')
+        result = Image.open(upscaled_path)
+        assert result.format == 'WEBP' and result.n_frames == 6 and result.size == (160, 120)
+
+        # WebP outputs hold every frame until they are encoded, and admission
+        # charges for that, so a long WebP animation hits the memory limit
+        gif_plan = plan_job('ai_upscale', input_path, factor=8)
+        webp_plan = plan_job('ai_upscale', input_path, factor=8, profile='webp')
+        held_mb = 6 * 640 * 480 * 4 / (1024 * 1024)
+        assert abs(webp_plan['memory_mb'] - gif_plan['memory_mb'] - held_mb) < 0.2
+        configure_limits({'ai_upscale': {'max_memory_mb': gif_plan['memory_mb'] + 1}})
+        try:
+            rejected_path = os.path.join(tmp_dir, 'rejected.webp')
+            try:
+                ai_upscale(input_path, rejected_path, '8x', profile='webp')
+                assert False, "The WebP animation should be over the memory limit"
+            except JobRejected:
+                pass
+            assert not os.path.exists(rejected_path)
+        finally:
+            configure_limits(None)
+
+    print("✓ Animation test passed - every frame processed")
+
+def test_in_memory_api():
+    """Test the bytes/stream/Image variants against the path-based functions"""
+    print("Testing in-memory API...")
+
+    import io
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.remove_background import remove_background, remove_background_bytes, remove_background_image
+    from imageopt.transparent_background import make_transparent, make_transparent_bytes
+    from imageopt.ai_upscale import ai_upscale, ai_upscale_bytes, ai_upscale_image
+
+    test_img = create_test_image()
+    buffer = io.BytesIO()
+    test_img.save(buffer, 'PNG')
+    input_bytes = buffer.getvalue()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        output_path = os.path.join(tmp_dir, 'output.png')
+        with open(input_path, 'wb') as f:
+            f.write(input_bytes)
+
+        remove_background(input_path, output_path, 'solid', '#00ff00')
+        expected = np.array(Image.open(output_path))
+        result = remove_background_bytes(input_bytes, 'solid', '#00ff00')
+        assert np.array_equal(np.array(Image.open(io.BytesIO(result))), expected)
+        assert np.array_equal(np.array(remove_background_image(test_img, 'solid', '#00ff00')), expected)
+
+        make_transparent(input_path, output_path, 40)
+        result = make_transparent_bytes(io.BytesIO(input_bytes), 40)
+        assert np.array_equal(np.array(Image.open(io.BytesIO(result))), np.array(Image.open(output_path)))
+
+        ai_upscale(input_path, output_path, '2x')
+        expected = np.array(Image.open(output_path))
+        assert np.array_equal(np.array(ai_upscale_image(input_bytes, '2x')), expected)
+        result = ai_upscale_bytes(input_bytes, '2x', tile_size=64)
+        assert np.array_equal(np.array(Image.open(io.BytesIO(result))), expected)
+
+    # The caller's image is never modified
+    assert test_img.mode == 'RGB' and test_img.getpixel((0, 0)) == (255, 255, 255)
+
+    print("✓ In-memory API test passed - matches path-based output")
+
+def test_benchmark_suite():
+    """Test a benchmark case and the baseline comparison"""
+    print("Testing benchmark suite...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.benchmark_ai_tools import run_case, prepare_input, compare_results
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        case = {'operation': 'remove_background', 'size': 'thumb', 'format': 'PNG', 'alpha': True}
+        result = run_case(case, prepare_input(case, tmp_dir), repeat=1)
+
+    # The breakdown comes from the shipping function's own stages
+    assert set(result['stages']) == {'decode', 'mask', 'encode'}
+    assert result['wall_s'] > 0 and result['mp_per_s'] > 0 and result['peak_rss_mb'] > 0
+
+    baseline = {'results': [result]}
+    slower = dict(result, wall_s=result['wall_s'] * 2)
+    regressions = compare_results({'results': [slower]}, baseline, threshold=0.15)
+    assert [regression['metric'] for regression in regressions] == ['wall_s']
+    assert compare_results(baseline, baseline) == []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        case = {'operation': 'ai_upscale', 'size': 'thumb', 'format': 'PNG', 'alpha': False}
+        result = run_case(case, prepare_input(case, tmp_dir), repeat=1)
+        assert {'decode', 'encode'} <= set(result['stages']) and result['output_bytes'] > 0
+        case = {'operation': 'make_transparent', 'size': 'thumb', 'format': 'PNG', 'alpha': False}
+        result = run_case(case, prepare_input(case, tmp_dir), repeat=1)
+        assert set(result['stages']) == {'decode', 'mask', 'composite', 'encode'}
+
+    print("✓ Benchmark suite test passed - regressions are flagged")
+
+def test_background_mask():
+    """Test the shared mask engine against a widened reference"""
+    print("Testing background mask engine...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.background_mask import background_mask, apply_background_alpha, detect_background_color
+
+    rng = np.random.default_rng(1)
+    pixels = rng.integers(0, 256, size=(97, 83, 4), dtype=np.uint8)
+    for color in [(0, 0, 0), (255, 255, 255), (200, 10, 128)]:
+        for tolerance in [1, 15, 30]:
+            expected = np.abs(pixels[:, :, :3].astype(np.int32) - color).max(axis=2) < tolerance
+            assert np.array_equal(background_mask(pixels, color, tolerance, block_rows=16), expected)
+
+    # Dark pixels must not wrap around and match a white background
+    image = np.full((10, 10, 4), 255, dtype=np.uint8)
+    image[4:6, 4:6, :3] = 5
+    assert detect_background_color(image) == (255, 255, 255)
+    assert apply_background_alpha(image, (255, 255, 255), background_alpha=0, block_rows=3) == 96
+    assert image[5, 5, 3] == 255 and image[0, 0, 3] == 0
+
+    print("✓ Background mask test passed - matches reference without wrap-around")
+
+def test_connected_segmentation():
+    """Test that connected mode keeps background-colored areas inside the subject"""
+    print("Testing connected background segmentation...")
+
+    from PIL import ImageDraw
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.remove_background import remove_background_image
+    from imageopt.transparent_background import make_transparent_image
+
+    # White background, blue ring with a white center
+    img = Image.new('RGB', (200, 160), 'white')
+    draw = ImageDraw.Draw(img)
+    draw.ellipse([40, 20, 160, 140], fill=(30, 30, 200))
+    draw.ellipse([80, 60, 120, 100], fill='white')
+
+    color_alpha = np.array(remove_background_image(img, mode='color'))[:, :, 3]
+    connected_alpha = np.array(remove_background_image(img, mode='connected'))[:, :, 3]
+    assert color_alpha[80, 100] == 0
+    assert connected_alpha[80, 100] == 255
+    assert connected_alpha[5, 5] == 0 and connected_alpha[80, 50] == 255
+
+    partial_alpha = np.array(make_transparent_image(img, 60, mode='connected'))[:, :, 3]
+    assert partial_alpha[5, 5] == int(0.6 * 255) and partial_alpha[80, 100] == 255
+
+    print("✓ Connected segmentation test passed - enclosed background kept")
+
+def test_pyramid_segmentation():
+    """Test the reduced-resolution mask with full-resolution edge refinement"""
+    print("Testing pyramid segmentation and preview...")
+
+    import io
+    from PIL import ImageDraw
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.remove_background import remove_background_image
+    from imageopt.transparent_background import make_transparent_preview
+
+    img = Image.new('RGB', (1600, 1200), 'white')
+    draw = ImageDraw.Draw(img)
+    draw.ellipse([300, 200, 1300, 1000], fill=(30, 30, 200))
+    draw.ellipse([700, 500, 900, 700], fill='white')
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=95)
+    data = buffer.getvalue()
+
+    # Ground truth: everything outside the ring is background
+    outside = Image.new('L', img.size, 1)
+    ImageDraw.Draw(outside).ellipse([300, 200, 1300, 1000], fill=0)
+    expected = np.array(outside) > 0
+
+    pyramid = np.array(remove_background_image(data, mode='pyramid'))[:, :, 3]
+    assert np.mean((pyramid == 0) != expected) < 0.001
+    assert pyramid[600, 800] == 255 and pyramid[10, 10] == 0
+
+    preview = make_transparent_preview(data, max_side=256)
+    assert max(preview.size) <= 256
+    assert preview.getpixel((2, 2)) == (255, 0, 0, 200)
+
+    # The same preview as a worker job and from the command line
+    import contextlib
+    from imageopt import ai_worker, transparent_background
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'photo.jpg')
+        with open(input_path, 'wb') as f:
+            f.write(data)
+        result = ai_worker.run_job({'operation': 'make_transparent_preview', 'input_path': input_path,
+                                    'output_path': os.path.join(tmp_dir, 'job.png'), 'params': {'max_side': 256}})
+        assert result['ok'], result.get('error')
+        assert np.array_equal(np.array(Image.open(result['output_path'])), np.array(preview))
+
+        cli_path = os.path.join(tmp_dir, 'cli.png')
+        with contextlib.redirect_stdout(io.StringIO()):
+            transparent_background.main(['--preview', input_path, cli_path])
+        with Image.open(cli_path) as cli_preview:
+            assert max(cli_preview.size) <= 512 and cli_preview.getpixel((2, 2)) == (255, 0, 0, 200)
+
+        # PNGs are decoded whole, so they go through admission; JPEGs decode in draft mode
+        from imageopt.admission import configure_limits
+        png_path = os.path.join(tmp_dir, 'photo.png')
+        img.save(png_path, 'PNG')
+        configure_limits({'make_transparent': {'max_memory_mb': 65}})
+        try:
+            rejected = ai_worker.run_job({'operation': 'make_transparent_preview', 'input_path': png_path,
+                                          'output_path': os.path.join(tmp_dir, 'png.png')})
+            drafted = ai_worker.run_job({'operation': 'make_transparent_preview', 'input_path': input_path,
+                                         'output_path': os.path.join(tmp_dir, 'jpeg.png')})
+            configure_limits({'make_transparent': {'max_input_pixels': 1000}})
+            too_large = ai_worker.run_job({'operation': 'make_transparent_preview', 'input_path': input_path,
+                                           'output_path': os.path.join(tmp_dir, 'large.png')})
+        finally:
+            configure_limits(None)
+        assert rejected['rejected'] and not rejected['ok']
+        assert drafted['ok'], drafted.get('error')
+        assert too_large['rejected'] and '1600x1200' in too_large['error']
+
+    print("✓ Pyramid segmentation test passed - matches full-resolution mask")
+
+def test_strip_streaming():
+    """Test that strip streaming matches the whole-image path pixel for pixel"""
+    print("Testing strip streaming...")
+
+    import io
+    from PIL import ImageDraw
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.strip_stream import stream_segmented
+    from imageopt.remove_background import remove_background_image
+    from imageopt.transparent_background import make_transparent_image, background_alpha_for
+
+    img = Image.new('RGB', (403, 301), 'white')
+    ImageDraw.Draw(img).ellipse([80, 60, 320, 240], fill=(200, 40, 40))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # PNG is decoded once; uncompressed TIFF is memory-mapped
+        for ext in ['png', 'tif']:
+            path = os.path.join(tmp_dir, f'input.{ext}')
+            img.save(path)
+            for mode in ['color', 'pyramid']:
+                cases = [
+                    (remove_background_image(path, 'transparent', mode=mode), {}),
+                    (remove_background_image(path, 'solid', '#00ff00', mode=mode), {'fill_color': (0, 255, 0)}),
+                    (make_transparent_image(path, 60, mode=mode), {'background_alpha': background_alpha_for(60)}),
+                ]
+                for expected, options in cases:
+                    out = io.BytesIO()
+                    stream_segmented(path, out, mode=mode, strip_rows=7, **options)
+                    streamed = Image.open(io.BytesIO(out.getvalue()))
+                    assert np.array_equal(np.array(streamed), np.array(expected.convert(streamed.mode)))
+
+    print("✓ Strip streaming test passed - output matches whole-image path")
+
+def test_encoder_profiles():
+    """Test the shared encoder profiles and their reports"""
+    print("Testing encoder profiles...")
+
+    import io
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.output_encoder import PROFILES, save_with_profile
+    from imageopt.remove_background import remove_background_bytes
+    from imageopt.ai_upscale import ai_upscale
+
+    img = create_test_image()
+    expected_formats = {'fastest': 'PNG', 'balanced': 'PNG', 'smallest': 'PNG', 'webp': 'WEBP', 'jpeg': 'JPEG'}
+    sizes = {}
+    for profile in PROFILES:
+        buffer = io.BytesIO()
+        report = save_with_profile(img, buffer, profile)
+        assert report['format'] == expected_formats[profile]
+        assert report['bytes'] == len(buffer.getvalue()) and report['encode_ms'] >= 0
+        assert Image.open(io.BytesIO(buffer.getvalue())).format == report['format']
+        sizes[profile] = report['bytes']
+    assert sizes['smallest'] <= sizes['balanced'] <= sizes['fastest']
+
+    # JPEG keeps alpha-free images as JPEG and falls back to PNG otherwise
+    assert save_with_profile(img.convert('RGBA'), io.BytesIO(), 'jpeg')['format'] == 'JPEG'
+    cutout = remove_background_bytes(img, profile='jpeg')
+    assert Image.open(io.BytesIO(cutout)).format == 'PNG'
+
+    # Lossless WebP keeps every visible pixel; only the color hidden under
+    # fully transparent pixels may change
+    webp = np.array(Image.open(io.BytesIO(remove_background_bytes(img, profile='webp'))))
+    png = np.array(Image.open(io.BytesIO(remove_background_bytes(img))))
+    visible = png[:, :, 3] > 0
+    assert np.array_equal(webp[:, :, 3], png[:, :, 3]) and np.array_equal(webp[visible], png[visible])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        img.save(input_path)
+        output_path = os.path.join(tmp_dir, 'output.png')
+        assert ai_upscale(input_path, output_path, '2x', profile='fastest')
+        assert Image.open(output_path).size == (400, 400)
+
+    print("✓ Encoder profiles test passed - formats and reports are correct")
+
+def test_output_optimization():
+    """Test that optimized outputs are smaller and keep every visible pixel"""
+    print("Testing output optimization...")
+
+    import io
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.output_encoder import optimize_image, save_with_profile, read_offset
+    from imageopt import ai_worker
+
+    def visible_pixels(image, offset=(0, 0), canvas=None):
+        # Place a (possibly cropped) result on its canvas, clearing hidden colors
+        canvas = canvas or image.size
+        placed = Image.new('RGBA', tuple(canvas), (0, 0, 0, 0))
+        placed.paste(image.convert('RGBA'), tuple(offset))
+        pixels = np.array(placed)
+        pixels[pixels[:, :, 3] == 0] = 0
+        return pixels
+
+    # A few colors on a transparent canvas become a cropped palette PNG
+    pixels = np.zeros((120, 160, 4), dtype=np.uint8)
+    pixels[:, :, :3] = np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    pixels[30:90, 40:100] = (200, 40, 40, 255)
+    pixels[50:70, 60:80] = (30, 90, 180, 128)
+    image = Image.fromarray(pixels, 'RGBA')
+    buffer = io.BytesIO()
+    report = save_with_profile(image, buffer, 'balanced', 'crop')
+    optimized = report['optimized']
+    assert optimized['mode'] == 'P' and optimized['offset'] == [40, 30] and optimized['size'] == [60, 60]
+    assert report['bytes'] < save_with_profile(image, io.BytesIO(), 'balanced')['bytes']
+    placement = read_offset(io.BytesIO(buffer.getvalue()))
+    assert placement == {'offset': [40, 30], 'canvas': [160, 120]}
+    result = Image.open(io.BytesIO(buffer.getvalue()))
+    assert np.array_equal(visible_pixels(result, **placement), visible_pixels(image))
+
+    # Gray with many alpha levels needs LA; opaque images lose their alpha
+    gray = np.repeat(np.arange(256, dtype=np.uint8)[np.newaxis, :, np.newaxis], 4, axis=2).repeat(4, axis=0)
+    gray[:, :, 3] = np.arange(4, dtype=np.uint8)[:, np.newaxis] * 60 + 10
+    assert optimize_image(Image.fromarray(gray, 'RGBA'))[0].mode == 'LA'
+    opaque = create_test_image().convert('RGBA')
+    assert optimize_image(opaque, 'WEBP')[0].mode == 'RGB'
+    assert save_with_profile(opaque, io.BytesIO(), 'webp', 'lossless')['optimized']['mode'] == 'RGB'
+
+    # Worker replies carry the placement of cropped outputs
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        output_path = os.path.join(tmp_dir, 'output.png')
+        canvas = Image.new('RGB', (200, 150), (255, 255, 255))
+        canvas.paste((20, 120, 60), (50, 40, 120, 100))
+        canvas.save(input_path)
+        reply = ai_worker.run_job({'operation': 'remove_background', 'input_path': input_path,
+                                   'output_path': output_path, 'params': {'optimize_output': 'crop'}})
+        assert reply['ok'] and reply['offset'] == [50, 40] and reply['canvas'] == [200, 150]
+        assert Image.open(output_path).size == (70, 60)
+
+    print("✓ Output optimization test passed - smaller outputs, same visible pixels")
+
+def test_sharpening():
+    """Test the per-channel float32 sharpening stage"""
+    print("Testing sharpening stage...")
+
+    import io
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.ai_upscale import enhance_array, ai_upscale_image, upscale_tiled
+
+    # Channels are sharpened independently: a flat channel stays flat
+    pixels = np.zeros((40, 40, 3), dtype=np.uint8)
+    pixels[:, 20:, 0] = 200
+    pixels[:, :, 2] = 90
+    sharpened = enhance_array(pixels)
+    assert (sharpened[:, :, 1] == 0).all() and (sharpened[:, :, 2] == 90).all()
+
+    # Overshoot clips instead of wrapping around
+    assert sharpened[:, 19, 0].max() == 0 and sharpened[:, 20, 0].min() > 200
+
+    # No sharpening leaves the pixels untouched
+    assert np.array_equal(enhance_array(pixels, amount=0.0), pixels)
+
+    # Tiles stay seamless with a wider radius
+    img = create_test_image()
+    whole = np.array(ai_upscale_image(img, '4x', sharpen_radius=3.0, sharpen_amount=1.0))
+    buffer = io.BytesIO()
+    upscale_tiled(img, buffer, 4, tile_size=48, sharpen_radius=3.0, sharpen_amount=1.0)
+    assert np.array_equal(np.array(Image.open(buffer)), whole)
+
+    print("✓ Sharpening test passed - per-channel, clipped and seamless")
+
+def test_band_scheduler():
+    """Test that multi-threaded bands match the single-threaded path exactly"""
+    print("Testing band scheduler...")
+
+    from PIL import ImageDraw
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.band_scheduler import split_bands
+    from imageopt.remove_background import remove_background_image
+    from imageopt.ai_upscale import ai_upscale_image
+
+    bands = split_bands(1000, threads=3, min_rows=64)
+    assert len(bands) == 3 and bands[0][0] == 0 and bands[-1][1] == 1000
+    assert all(a[1] == b[0] for a, b in zip(bands, bands[1:]))
+    assert split_bands(100, threads=8, min_rows=64) == [(0, 100)]
+
+    img = Image.new('RGB', (320, 600), 'white')
+    draw = ImageDraw.Draw(img)
+    draw.ellipse([40, 60, 280, 540], fill=(30, 30, 200))
+    draw.rectangle([120, 250, 200, 350], fill='white')
+
+    for mode in ['color', 'connected', 'pyramid']:
+        single = np.array(remove_background_image(img, mode=mode, threads=1))
+        threaded = np.array(remove_background_image(img, mode=mode, threads=4))
+        assert np.array_equal(single, threaded)
+
+    single = np.array(ai_upscale_image(img, '2x', threads=1))
+    assert np.array_equal(np.array(ai_upscale_image(img, '2x', threads=4)), single)
+
+    # Per-call thread counts reuse one pool per size instead of creating one per call
+    import threading
+    from imageopt import band_scheduler
+    executor = band_scheduler.get_executor(3)
+    workers = set()
+    for _ in range(5):
+        workers.update(band_scheduler.run_tasks(lambda index: threading.current_thread(),
+                                                [(0,), (1,), (2,)], threads=3))
+    assert band_scheduler.get_executor(3) is executor and len(workers) <= 3
+
+    # Pool processes get a share of the cores unless IMAGEOPT_THREADS is set
+    saved = os.environ.pop('IMAGEOPT_THREADS', None)
+    try:
+        assert band_scheduler.pool_threads(os.cpu_count() or 1) == 1
+        os.environ['IMAGEOPT_THREADS'] = '2'
+        assert band_scheduler.pool_threads(1) is None
+    finally:
+        os.environ.pop('IMAGEOPT_THREADS')
+        if saved is not None:
+            os.environ['IMAGEOPT_THREADS'] = saved
+
+    print("✓ Band scheduler test passed - threaded output is bit-identical")
+
+def test_model_backends():
+    """Test the model backend layer with stand-in sessions"""
+    print("Testing model backends...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.model_backends import OnnxSegmenter, OnnxUpscaler, resolve_backend, backend_fingerprint
+    from imageopt.remove_background import remove_background_image
+    from imageopt.ai_upscale import ai_upscale_image
+
+    class Input:
+        name = 'input'
+
+    class StandInSession:
+        """Mimics onnxruntime.InferenceSession for a tiny test model"""
+        def __init__(self, model):
+            self.model = model
+            self.batches = []
+
+        def get_inputs(self):
+            return [Input()]
+
+        def run(self, output_names, feeds):
+            batch = feeds['input']
+            self.batches.append(batch.shape[0])
+            return [self.model(batch)]
+
+    # Segmentation stand-in: foreground wherever the red channel dominates
+    segment_session = StandInSession(lambda batch: (batch[:, :1] > batch[:, 1:2] + 1).astype(np.float32))
+    segmenter = OnnxSegmenter('stand-in.onnx', session=segment_session)
+    img = create_test_image()
+    masks = segmenter.predict_masks([img, img, img])
+    assert segment_session.batches == [3]
+    assert masks[0].shape == (200, 200) and masks[0][100, 100] == 255 and masks[0][5, 5] == 0
+
+    result = np.array(remove_background_image(img, backend=segmenter))
+    assert result[100, 100, 3] == 255 and result[5, 5, 3] == 0
+
+    # Upscaling stand-in: nearest-neighbour 2x, so tiling must be seamless
+    upscale_session = StandInSession(lambda batch: batch.repeat(2, axis=2).repeat(2, axis=3))
+    upscaler = OnnxUpscaler('stand-in.onnx', session=upscale_session)
+    pixels = np.random.default_rng(0).integers(0, 256, (150, 130, 3), dtype=np.uint8)
+    assert np.array_equal(upscaler.upscale(pixels), pixels.repeat(2, axis=0).repeat(2, axis=1))
+    assert upscaler.scale == 2 and len(upscale_session.batches) == 1
+    assert ai_upscale_image(Image.fromarray(pixels), '4x', backend=upscaler).size == (520, 600)
+
+    # Without a configured model every call falls back to the heuristic
+    os.environ.pop('IMAGEOPT_SEGMENT_MODEL', None)
+    assert resolve_backend('segment', 'onnx') is None
+    assert backend_fingerprint('segment', 'auto') == 'heuristic'
+    assert np.array_equal(np.array(remove_background_image(img, backend='onnx')),
+                          np.array(remove_background_image(img, backend='heuristic')))
+
+    print("✓ Model backends test passed - batching, tiling and fallback work")
+
+def test_job_queue():
+    """Test the SQLite job queue: priority, limits, backpressure and cleanup"""
+    print("Testing job queue...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.job_queue import JobQueue, QueueFull, serve
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        small = os.path.join(tmp_dir, 'small.png')
+        large = os.path.join(tmp_dir, 'large.png')
+        create_test_image().save(small)
+        create_test_image().resize((400, 400)).save(large)
+
+        queue = JobQueue(os.path.join(tmp_dir, 'jobs.sqlite3'), max_queued=3,
+                         concurrency={'ai_upscale': 1, 'remove_background': 1})
+        upscale_id = queue.submit('ai_upscale', large, os.path.join(tmp_dir, 'up.png'), {'upscale_factor': '2x'})
+        second_upscale = queue.submit('ai_upscale', small, os.path.join(tmp_dir, 'up2.png'))
+        removal_id = queue.submit('remove_background', small, os.path.join(tmp_dir, 'rb.png'))
+        try:
+            queue.submit('make_transparent', small, os.path.join(tmp_dir, 'mt.png'))
+            assert False, "Submitting to a full queue should fail"
+        except QueueFull:
+            pass
+
+        # The smallest job is claimed first and limits apply per operation
+        assert queue.status(removal_id)['position'] == 0
+        assert queue.claim('test:1')['id'] == removal_id
+        assert queue.claim('test:1')['id'] == second_upscale
+        assert queue.claim('test:1') is None
+        assert queue.status(upscale_id)['state'] == 'queued'
+
+        # Jobs of a dead owner go back to the queue and then all run
+        queue._db.execute("UPDATE jobs SET owner = ? WHERE state = 'running'", (f"{socket.gethostname()}:999999999",))
+        assert queue.recover() == 2
+        serve(queue, workers=2, until_idle=True)
+        assert queue.stats() == {'queued': 0, 'running': 0, 'done': 3, 'failed': 0}
+        result = queue.result(upscale_id)
+        assert result['ok'] and Image.open(result['output_path']).size == (800, 800)
+
+        # Expired results and their files are removed
+        assert queue.cleanup(ttl=0) == 3
+        assert queue.status(upscale_id) is None and not os.path.exists(result['output_path'])
+
+        # A worker process that dies fails its job and the daemon keeps serving
+        crash = os.path.join(tmp_dir, 'crash.png')
+        create_test_image().save(crash)
+        crash_id = queue.submit('remove_background', crash, os.path.join(tmp_dir, 'crash_out.png'))
+        after_id = queue.submit('remove_background', small, os.path.join(tmp_dir, 'after.png'))
+        from imageopt import ai_worker
+        run_job = ai_worker.run_job
+        ai_worker.run_job = exit_on_crash_input
+        try:
+            serve(queue, workers=1, until_idle=True)
+        finally:
+            ai_worker.run_job = run_job
+        assert queue.result(crash_id) == {'id': crash_id, 'ok': False, 'error': "Worker process died"}
+        assert queue.result(after_id)['ok']
+
+        # Pool processes split the cores instead of taking a thread per core each
+        threads_id = queue.submit('remove_background', small, os.path.join(tmp_dir, 'threads.png'))
+        saved_threads = os.environ.pop('IMAGEOPT_THREADS', None)
+        cpu_count = os.cpu_count
+        ai_worker.run_job = report_threads
+        os.cpu_count = lambda: 8
+        try:
+            serve(queue, workers=2, until_idle=True)
+        finally:
+            ai_worker.run_job = run_job
+            os.cpu_count = cpu_count
+            if saved_threads is not None:
+                os.environ['IMAGEOPT_THREADS'] = saved_threads
+        assert queue.result(threads_id)['threads'] == 4
+        queue.close()
+
+    print("✓ Job queue test passed - priority, limits and cleanup work")
+
+def test_variants():
+    """Test that decode-once variants match the single-operation outputs"""
+    print("Testing variant generation...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt import mask_artifact
+    from imageopt import ai_worker
+    from imageopt.variants import generate_variants
+    from imageopt.remove_background import remove_background
+    from imageopt.transparent_background import make_transparent
+    from imageopt.ai_upscale import ai_upscale
+    from imageopt.model_backends import OnnxUpscaler
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.jpg')
+        create_test_image().save(input_path, 'JPEG')
+
+        def path(name):
+            return os.path.join(tmp_dir, name)
+
+        variants = [
+            {'operation': 'remove_background', 'output_path': path('v_transparent.png')},
+            {'operation': 'remove_background', 'output_path': path('v_white.png'), 'background_type': 'solid'},
+            {'operation': 'remove_background', 'output_path': path('v_brand.webp'), 'background_type': 'solid',
+             'background_color': '#1e40af', 'profile': 'webp'},
+            {'operation': 'make_transparent', 'output_path': path('v_60.png'), 'transparency_level': 60},
+            {'operation': 'ai_upscale', 'output_path': path('v_2x.png'), 'upscale_factor': '2x'},
+            {'operation': 'ai_upscale', 'output_path': path('v_4x.png'), 'upscale_factor': '4x'},
+        ]
+
+        # The mask is computed once for all four masked variants
+        segment_calls = []
+        original_segment = mask_artifact.segment_background
+        mask_artifact.segment_background = lambda *args, **kwargs: (
+            segment_calls.append(1), original_segment(*args, **kwargs))[1]
+        try:
+            reports = generate_variants(input_path, variants, threads=4)
+        finally:
+            mask_artifact.segment_background = original_segment
+        assert len(segment_calls) == 1
+        assert [report['format'] for report in reports] == ['PNG', 'PNG', 'WEBP', 'PNG', 'PNG', 'PNG']
+
+        remove_background(input_path, path('s_transparent.png'))
+        remove_background(input_path, path('s_white.png'), 'solid')
+        remove_background(input_path, path('s_brand.webp'), 'solid', '#1e40af', profile='webp')
+        make_transparent(input_path, path('s_60.png'), 60)
+        ai_upscale(input_path, path('s_2x.png'), '2x')
+        ai_upscale(input_path, path('s_4x.png'), '4x')
+        for name in ['transparent.png', 'white.png', 'brand.webp', '60.png', '2x.png', '4x.png']:
+            assert np.array_equal(np.array(Image.open(path('v_' + name))), np.array(Image.open(path('s_' + name)))), name
+
+        # A model upscaler runs once for every factor
+        class StandInSession:
+            def __init__(self):
+                self.runs = 0
+
+            def get_inputs(self):
+                return [type('Input', (), {'name': 'input'})]
+
+            def run(self, output_names, feeds):
+                self.runs += 1
+                return [feeds['input'].repeat(2, axis=2).repeat(2, axis=3)]
+
+        session = StandInSession()
+        upscaler = OnnxUpscaler('stand-in.onnx', session=session)
+        reports = generate_variants(input_path, variants[4:], backend=upscaler)
+        assert session.runs == 1 and Image.open(path('v_4x.png')).size == (800, 800)
+
+        # The worker accepts the same request as a "variants" job
+        result = ai_worker.run_job({'operation': 'variants', 'input_path': input_path,
+                                    'params': {'variants': variants[:2], 'mode': 'connected'}})
+        assert result['ok'] and [output['output_path'] for output in result['outputs']] == [
+            path('v_transparent.png'), path('v_white.png')]
+        result = ai_worker.run_job({'operation': 'variants', 'input_path': input_path,
+                                    'params': {'variants': [{'operation': 'resize', 'output_path': path('x.png')}]}})
+        assert not result['ok'] and 'Unknown variant operation' in result['error']
+
+    print("✓ Variant generation test passed - one decode and mask, identical outputs")
+
+def test_http_service():
+    """Test the HTTP service end to end and the load generator against it"""
+    print("Testing HTTP service...")
+
+    import io
+    import asyncio
+    import http.client
+    from urllib.parse import urlsplit
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.http_service import HttpError, ImageService, parse_multipart
+    from imageopt.load_generator import encode_multipart, local_server, percentile, run_load
+
+    buffer = io.BytesIO()
+    create_test_image().save(buffer, 'PNG')
+    png = buffer.getvalue()
+
+    body, content_type = encode_multipart(png, {'mode': 'connected'})
+    parts = parse_multipart(body, content_type.split('boundary=')[1])
+    assert bytes(parts['file'][1]) == png and bytes(parts['mode'][1]) == b'connected'
+    assert percentile([4, 1, 3, 2][:0], 0.5) is None
+    assert percentile(list(range(1, 101)), 0.5) == 50 and percentile(list(range(1, 101)), 0.99) == 99
+
+    # A full server refuses uploads before reading them, so no reader is needed
+    service = ImageService(processes=1, max_pending=1)
+    service.pending = 1
+    try:
+        asyncio.run(service.run_operation('ai_upscale', {'content-length': '100'}, None, None, True))
+        assert False, "upload accepted past max_pending"
+    except HttpError as e:
+        assert e.status == 503 and e.close
+
+    limits = json.dumps({'ai_upscale': {'max_output_pixels': 1000}})
+    with local_server(1, ['--limits', limits]) as url:
+        address = urlsplit(url)
+
+        def request(method, path, fields=None):
+            connection = http.client.HTTPConnection(address.hostname, address.port, timeout=120)
+            try:
+                if fields is None:
+                    connection.request(method, path)
+                else:
+                    body, content_type = encode_multipart(png, fields)
+                    connection.request(method, path, body, {'Content-Type': content_type})
+                response = connection.getresponse()
+                return response.status, response.getheader('Content-Type'), response.read()
+            finally:
+                connection.close()
+
+        status, content_type, data = request('POST', '/remove-background', {'background_type': 'solid'})
+        assert status == 200 and content_type == 'image/png'
+        assert Image.open(io.BytesIO(data)).mode == 'RGB'
+        status, content_type, data = request('POST', '/transparent-background', {'transparency_level': '50'})
+        assert status == 200 and Image.open(io.BytesIO(data)).mode == 'RGBA'
+
+        # Admission rejections, bad parameters and unknown paths
+        status, _, data = request('POST', '/ai-upscale', {'upscale_factor': '2x'})
+        assert status == 413 and json.loads(data)['rejected'] is True
+        assert request('POST', '/remove-background', {'mode': 'bogus'})[0] == 400
+        assert request('POST', '/remove-background', {'transparency_level': '50'})[0] == 400
+        assert request('POST', '/ai-upscale', {'upscale_factor': '2x', 'tile_size': '-5'})[0] == 400
+        assert request('POST', '/ai-upscale', {'upscale_factor': '2x', 'tile_size': '4'})[0] == 400
+        body, content_type = encode_multipart(png, {'mode': 'invalid-utf8'})
+        connection = http.client.HTTPConnection(address.hostname, address.port, timeout=120)
+        try:
+            connection.request('POST', '/remove-background', body.replace(b'invalid-utf8', b'\xff\xfe'),
+                               {'Content-Type': content_type})
+            response = connection.getresponse()
+            assert response.status == 400 and 'UTF-8' in json.loads(response.read())['error']
+        finally:
+            connection.close()
+        assert request('POST', '/nowhere', {})[0] == 404
+        assert request('GET', '/remove-background')[0] == 405
+        status, _, data = request('GET', '/health')
+        assert status == 200 and json.loads(data)['processes'] == 1
+
+        reports = asyncio.run(run_load(url, 'remove_background', png, levels=(1, 3), requests=6))
+        for report in reports:
+            latency = report['latency_ms']
+            assert report['ok'] == 6 and report['errors'] == 0 and report['throughput_rps'] > 0
+            assert latency['p50'] <= latency['p95'] <= latency['p99'] <= latency['max']
+
+    print("✓ HTTP service test passed - uploads served and load measured")
+
+def test_instrumentation():
+    """Test per-stage metrics through a hook, a capture and the worker"""
+    print("Testing instrumentation...")
+
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt import ai_worker
+    from imageopt.instrumentation import add_metrics_hook, remove_metrics_hook, capture_metrics, measure
+    from imageopt.remove_background import remove_background
+    from imageopt.ai_upscale import ai_upscale
+
+    # Nothing is measured unless a hook, a capture or IMAGEOPT_METRICS asks
+    os.environ.pop('IMAGEOPT_METRICS', None)
+    with measure('noop') as measurement:
+        assert measurement is None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        create_test_image().save(input_path, 'PNG')
+
+        seen = []
+        add_metrics_hook(seen.append)
+        try:
+            remove_background(input_path, os.path.join(tmp_dir, 'rb.png'), 'solid', '#00ff00')
+        finally:
+            remove_metrics_hook(seen.append)
+        metrics = seen[0]
+        assert metrics['operation'] == 'remove_background' and metrics['params']['background_type'] == 'solid'
+        assert (metrics['width'], metrics['height']) == (200, 200) and metrics['backend'] == 'heuristic'
+        assert set(metrics['stages']) == {'decode', 'mask', 'composite', 'encode'}
+        assert all({'wall_ms', 'cpu_ms'} <= set(entry) for entry in metrics['stages'].values())
+        # Stages sample the current RSS; the lifetime peak is only reported,
+        # labelled as such, for the whole operation
+        assert all('peak_rss_mb' not in entry for entry in metrics['stages'].values())
+        assert metrics['process_peak_rss_mb'] > 0
+        if os.path.exists('/proc/self/statm'):
+            assert all({'rss_mb', 'rss_delta_mb'} <= set(entry) for entry in metrics['stages'].values())
+            assert metrics['rss_mb'] > 0 and 'rss_delta_mb' in metrics
+
+        with capture_metrics() as captured:
+            ai_upscale(input_path, os.path.join(tmp_dir, 'up.png'), '2x', tile_size=0)
+        assert captured[0]['output_width'] == 400
+        assert set(captured[0]['stages']) == {'decode', 'resize', 'sharpen', 'encode'}
+
+        # IMAGEOPT_METRICS appends one JSON line per operation
+        metrics_path = os.path.join(tmp_dir, 'metrics.jsonl')
+        os.environ['IMAGEOPT_METRICS'] = metrics_path
+        try:
+            ai_upscale(input_path, os.path.join(tmp_dir, 'tiled.png'), '2x', tile_size=64)
+        finally:
+            del os.environ['IMAGEOPT_METRICS']
+        with open(metrics_path) as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == 1 and 'tiled' in lines[0]['stages']
+
+        result = ai_worker.run_job({'operation': 'make_transparent', 'input_path': input_path,
+                                    'output_path': os.path.join(tmp_dir, 'mt.png'), 'metrics': True})
+        assert result['ok'] and result['metrics']['operation'] == 'make_transparent'
+
+    print("✓ Instrumentation test passed - stages, hooks and sinks work")
+
+def test_package_startup():
+    """Test the imageopt CLI import budget and that commands load only what they need"""
+    print("Testing imageopt startup...")
+
+    import subprocess
+    sys.path.append(os.path.dirname(__file__))
+    from imageopt.cli import STARTUP_BUDGET_MS
+
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+
+    def run_python(*args):
+        completed = subprocess.run([sys.executable, *args], cwd=scripts_dir, capture_output=True,
+                                   text=True, timeout=120)
+        assert completed.returncode == 0, completed.stderr
+        return completed
+
+    # Cold import of the entry point, as reported by -X importtime
+    completed = run_python('-X', 'importtime', '-c', 'import imageopt.cli')
+    import_us = 0
+    for line in completed.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() in ('imageopt', 'imageopt.cli'):
+            import_us += int(fields[1])
+    assert 0 < import_us / 1000 < STARTUP_BUDGET_MS, f"imageopt.cli imports in {import_us / 1000:.1f} ms"
+
+    def loaded_after(argv):
+        """Run a command in a fresh interpreter and return the heavy modules it loaded"""
+        code = (
+            "import sys, json\n"
+            "from imageopt.cli import main\n"
+            f"main({argv!r})\n"
+            "print(json.dumps(sorted({name.split('.')[0] for name in sys.modules} & {'PIL', 'numpy', 'scipy'})))\n"
+        )
+        return set(json.loads(run_python('-c', code).stdout.splitlines()[-1]))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        create_test_image().save(input_path, 'PNG')
+
+        assert loaded_after(['--help']) == set()
+        assert loaded_after(['queue', '--db', os.path.join(tmp_dir, 'jobs.sqlite3'), 'stats']) == set()
+        assert loaded_after(['remove-background', input_path, os.path.join(tmp_dir, 'rb.png')]) == {'PIL', 'numpy'}
+        assert loaded_after(['upscale', input_path, os.path.join(tmp_dir, 'up.png')]) == {'PIL', 'numpy', 'scipy'}
+        assert Image.open(os.path.join(tmp_dir, 'up.png')).size == (400, 400)
+
+    print(f"✓ imageopt startup test passed - CLI imports in {import_us / 1000:.1f} ms")
+
 def main():
     """Run all tests"""
     print("Testing AI Tools Python Scripts")
@@ -169,7 +1557,32 @@ def main():
     # Run tests
     test_remove_background()
     test_ai_upscale()
+    test_ai_upscale_tiled()
+    test_sharpening()
+    test_band_scheduler()
+    test_model_backends()
     test_transparent_background()
+    test_in_memory_api()
+    test_background_mask()
+    test_connected_segmentation()
+    test_pyramid_segmentation()
+    test_strip_streaming()
+    test_encoder_profiles()
+    test_output_optimization()
+    test_ai_worker()
+    test_batch_process()
+    test_job_queue()
+    test_http_service()
+    test_variants()
+    test_animation()
+    test_instrumentation()
+    test_package_startup()
+    test_result_cache()
+    test_admission()
+    test_mask_artifact()
+    test_pixel_bridge()
+    test_raw_pixels()
+    test_benchmark_suite()
     
     print()
     print("=" * 40)
@@ -0,0 +1,80 @@
+// ImageOptimizer.in Python AI Job Queue
+//
+// Submits slow AI jobs (large upscales, batch removals) to the SQLite queue
+// in `scripts/job_queue.py` so API routes can return immediately and poll
+// for the result. Run `python3 scripts/job_queue.py serve` alongside the app.
+
+import { execFile } from 'child_process';
+import path from 'path';
+
+const QUEUE_SCRIPT = path.join(process.cwd(), 'scripts', 'job_queue.py');
+const PYTHON_PATH = process.env.PYTHON_PATH || 'python3';
+
+/**
+ * Run a job_queue.py command and parse its JSON reply
+ * @param {string[]} args - Command line arguments
+ * @returns {Promise<Object>} Parsed reply
+ */
+const runQueueCommand = (args) => {
+  return new Promise((resolve, reject) => {
+    execFile(PYTHON_PATH, [QUEUE_SCRIPT, ...args], { cwd: path.dirname(QUEUE_SCRIPT) }, (error, stdout) => {
+      let reply;
+      try {
+        reply = JSON.parse(stdout);
+      } catch (parseError) {
+        reject(error || new Error(`Invalid job queue output: ${stdout}`));
+        return;
+      }
+
+      if (reply && reply.error) {
+        const queueError = new Error(reply.error);
+        if (reply.queue_full) {
+          queueError.code = 'QUEUE_FULL';
+        } else if (reply.rejected) {
+          queueError.code = 'JOB_REJECTED';
+        } else {
+          queueError.code = 'QUEUE_ERROR';
+        }
+        reject(queueError);
+        return;
+      }
+      resolve(reply);
+    });
+  });
+};
+
+/**
+ * Path a route keeps a queued upload at, derived from the job's output path
+ * so the upload can be removed once the result has been read
+ * @param {string} outputPath - Path the result is written to
+ * @returns {string} Path of the upload
+ */
+export const queuedInputPath = (outputPath) => `${outputPath}.upload`;
+
+/**
+ * Queue an AI operation for background processing
+ * @param {string} operation - remove_background, make_transparent or ai_upscale
+ * @param {string} inputPath - Path of the uploaded image
+ * @param {string} outputPath - Path the result should be written to
+ * @param {Object} params - Keyword arguments for the operation
+ * @returns {Promise<string>} Job id; rejects with code QUEUE_FULL when the queue is at capacity and
+ *   JOB_REJECTED when the image is over the admission limits
+ */
+export const submitAiJob = async (operation, inputPath, outputPath, params = {}) => {
+  const reply = await runQueueCommand(['submit', operation, inputPath, outputPath, '--params', JSON.stringify(params)]);
+  return reply.id;
+};
+
+/**
+ * Get the state of a queued job
+ * @param {string} jobId - Id returned by submitAiJob
+ * @returns {Promise<Object>} State (queued, running, done or failed), timings and queue position
+ */
+export const getAiJobStatus = (jobId) => runQueueCommand(['status', jobId]);
+
+/**
+ * Get the worker result of a finished job
+ * @param {string} jobId - Id returned by submitAiJob
+ * @returns {Promise<Object|null>} Result with output_path, or null while the job is pending
+ */
+export const getAiJobResult = (jobId) => runQueueCommand(['result', jobId]);
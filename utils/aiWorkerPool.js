@@ -0,0 +1,290 @@
+// ImageOptimizer.in Python AI Worker Pool
+//
+// Keeps a small number of warm `scripts/ai_worker.py` processes alive so the
+// AI routes do not pay the Python/NumPy/SciPy import cost on every request.
+
+import { spawn } from 'child_process';
+import crypto from 'crypto';
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import readline from 'readline';
+
+const WORKER_SCRIPT = path.join(process.cwd(), 'scripts', 'ai_worker.py');
+const PYTHON_PATH = process.env.PYTHON_PATH || 'python3';
+const POOL_SIZE = parseInt(process.env.AI_WORKER_POOL_SIZE || '2', 10);
+const JOB_TIMEOUT = parseInt(process.env.AI_WORKER_TIMEOUT || '120000', 10);
+// Workers that exit before they are ready are restarted after a growing
+// delay; after this many in a row the queued jobs are rejected
+const MAX_START_FAILURES = parseInt(process.env.AI_WORKER_MAX_START_FAILURES || '3', 10);
+const START_BACKOFF = 500;
+// Raw pixel buffers go through shared memory where the OS has it
+const RAW_DIR = process.env.AI_RAW_DIR || (fs.existsSync('/dev/shm') ? '/dev/shm' : os.tmpdir());
+
+// Inputs above this use pyramid segmentation, which masks a reduced copy
+// and can stream; connected mode holds labels for every pixel
+const PYRAMID_PIXELS = 12 * 1000 * 1000;
+
+const workers = [];
+const queue = [];
+let nextJobId = 1;
+let startFailures = 0;
+let restartAt = 0;
+
+/**
+ * Start a new Python worker process and register it in the pool
+ * @returns {Object} Worker record
+ */
+const startWorker = () => {
+  const child = spawn(PYTHON_PATH, [WORKER_SCRIPT], {
+    cwd: path.dirname(WORKER_SCRIPT),
+    stdio: ['pipe', 'pipe', 'inherit'],
+  });
+
+  const worker = { child, ready: false, current: null, exited: false };
+  const lines = readline.createInterface({ input: child.stdout });
+
+  lines.on('line', (line) => {
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (error) {
+      console.error('AI worker sent invalid output:', line);
+      return;
+    }
+
+    if (message.ready) {
+      worker.ready = true;
+      startFailures = 0;
+      dispatch();
+      return;
+    }
+
+    const job = worker.current;
+    worker.current = null;
+    if (job && job.id === message.id) {
+      clearTimeout(job.timer);
+      job.resolve(message);
+    }
+    dispatch();
+  });
+
+  const retire = (reason) => {
+    if (worker.exited) {
+      return;
+    }
+    worker.exited = true;
+    const index = workers.indexOf(worker);
+    if (index !== -1) {
+      workers.splice(index, 1);
+    }
+    if (worker.current) {
+      clearTimeout(worker.current.timer);
+      worker.current.reject(new Error(`AI worker ${reason}`));
+      worker.current = null;
+    }
+    if (!worker.ready) {
+      startFailed(reason);
+    }
+    dispatch();
+  };
+
+  child.on('exit', (code) => retire(`exited with code ${code}`));
+  // Spawn failures, e.g. a missing interpreter, may not be followed by exit
+  child.on('error', (error) => retire(`failed to start: ${error.message}`));
+  // Writes to a worker that just died are reported by its exit
+  child.stdin.on('error', () => {});
+
+  workers.push(worker);
+  return worker;
+};
+
+/**
+ * Count a worker that exited before it was ready, delaying the next start
+ * and rejecting every queued job once starts keep failing
+ * @param {string} reason - How the worker failed
+ */
+const startFailed = (reason) => {
+  startFailures += 1;
+  if (startFailures < MAX_START_FAILURES) {
+    const delay = START_BACKOFF * 2 ** (startFailures - 1);
+    restartAt = Date.now() + delay;
+    setTimeout(dispatch, delay);
+    return;
+  }
+
+  console.error(`AI worker ${reason}; ${startFailures} starts failed in a row, rejecting queued jobs`);
+  const error = new Error(`AI workers could not start: ${reason}`);
+  queue.splice(0).forEach((job) => job.reject(error));
+  // The next job tries again from scratch
+  startFailures = 0;
+  restartAt = 0;
+};
+
+/**
+ * Hand queued jobs to idle workers, starting workers up to the pool size
+ */
+const dispatch = () => {
+  while (queue.length > 0) {
+    const worker = workers.find((candidate) => candidate.ready && !candidate.current);
+    if (!worker) {
+      const starting = workers.some((candidate) => !candidate.ready);
+      // One worker starts at a time while starts are failing
+      if (workers.length < POOL_SIZE && Date.now() >= restartAt && !(startFailures && starting)) {
+        startWorker();
+      }
+      return;
+    }
+
+    const job = queue.shift();
+    worker.current = job;
+    job.timer = setTimeout(() => {
+      // A stuck worker is killed; the exit handler rejects the job
+      worker.child.kill('SIGKILL');
+    }, JOB_TIMEOUT);
+    worker.child.stdin.write(JSON.stringify(job.payload) + '\n');
+  }
+};
+
+/**
+ * Queue a job for the next idle worker
+ * @param {Object} payload - Job fields other than the id
+ * @returns {Promise<Object>} Structured result from the worker
+ */
+const enqueue = (payload) => {
+  return new Promise((resolve, reject) => {
+    const id = String(nextJobId++);
+    queue.push({ id, resolve, reject, payload: { id, ...payload } });
+    dispatch();
+  });
+};
+
+/**
+ * Run an AI operation on a warm Python worker
+ * @param {string} operation - remove_background, make_transparent or ai_upscale
+ * @param {string} inputPath - Path of the uploaded image
+ * @param {string} outputPath - Path the result should be written to
+ * @param {Object} params - Keyword arguments for the operation
+ * @returns {Promise<Object>} Structured result from the worker
+ */
+export const runAiJob = (operation, inputPath, outputPath, params = {}) => {
+  return enqueue({ operation, input_path: inputPath, output_path: outputPath, params });
+};
+
+/**
+ * Pick the segmentation mode that matches the routes' edge-aware flood fill:
+ * only background connected to the border is removed
+ * @param {number} width - Image width
+ * @param {number} height - Image height
+ * @returns {string} 'connected', or 'pyramid' for large images
+ */
+export const segmentationMode = (width, height) => {
+  return width * height > PYRAMID_PIXELS ? 'pyramid' : 'connected';
+};
+
+/**
+ * Run an AI operation on an uploaded file and read back the encoded result
+ * @param {string} operation - remove_background, make_transparent or ai_upscale
+ * @param {string} inputPath - Path of the uploaded image
+ * @param {Object} params - Keyword arguments for the operation
+ * @returns {Promise<Object>} Structured result from the worker; on success also the output bytes as data
+ */
+export const runAiFileJob = async (operation, inputPath, params = {}) => {
+  const outputPath = path.join(os.tmpdir(), `imageopt-${crypto.randomUUID()}.out`);
+  try {
+    const result = await runAiJob(operation, inputPath, outputPath, params);
+    return result.ok ? { ...result, data: await fs.promises.readFile(outputPath) } : result;
+  } finally {
+    await fs.promises.rm(outputPath, { force: true });
+  }
+};
+
+/**
+ * Write a pixel buffer to a raw file straight from the caller's memory
+ * @param {string} file - Path of the raw file
+ * @param {Buffer} data - Pixel rows
+ */
+const writeRaw = async (file, data) => {
+  const handle = await fs.promises.open(file, 'w');
+  try {
+    let written = 0;
+    while (written < data.length) {
+      const { bytesWritten } = await handle.write(data, written, data.length - written, written);
+      written += bytesWritten;
+    }
+  } finally {
+    await handle.close();
+  }
+};
+
+/**
+ * Read a raw result into a single buffer of its known size, without the
+ * zero fill and growth of a generic file read
+ * @param {string} file - Path of the raw file
+ * @param {number} size - Bytes of pixel data
+ * @returns {Promise<Buffer>} Pixel rows
+ */
+const readRaw = async (file, size) => {
+  const handle = await fs.promises.open(file, 'r');
+  try {
+    const pixels = Buffer.allocUnsafe(size);
+    let read = 0;
+    while (read < size) {
+      const { bytesRead } = await handle.read(pixels, read, size - read, read);
+      if (bytesRead === 0) {
+        throw new Error(`${file} ends after ${read} of ${size} bytes`);
+      }
+      read += bytesRead;
+    }
+    return pixels;
+  } finally {
+    await handle.close();
+  }
+};
+
+/**
+ * Run an AI operation on pixels the route has already decoded, without
+ * encoding them for Python or decoding its result
+ * @param {string} operation - remove_background, make_transparent or ai_upscale
+ * @param {Buffer} data - Unpadded pixel rows, e.g. from sharp's raw().toBuffer({ resolveWithObject: true })
+ * @param {Object} info - width, height and channels (1, 3 or 4) of data
+ * @param {Object} params - Keyword arguments for the operation
+ * @returns {Promise<Object>} Structured result from the worker; on success also the result's
+ *   data and info, ready for sharp(data, { raw: info })
+ */
+export const runAiRawJob = async (operation, data, info, params = {}) => {
+  const name = path.join(RAW_DIR, `imageopt-${crypto.randomUUID()}`);
+  const inputRaw = { path: `${name}.in.raw`, width: info.width, height: info.height, channels: info.channels };
+  const outputRaw = { path: `${name}.out.raw` };
+  try {
+    // Both files are removed below, even when writing the input fails
+    await writeRaw(inputRaw.path, data);
+    const result = await enqueue({ operation, input_raw: inputRaw, output_raw: outputRaw, params });
+    if (!result.ok) {
+      return result;
+    }
+    const { width, height, channels } = result.output_raw;
+    const pixels = await readRaw(outputRaw.path, width * height * channels);
+    return { ...result, data: pixels, info: { width, height, channels } };
+  } finally {
+    await Promise.all([inputRaw.path, outputRaw.path].map((file) => fs.promises.rm(file, { force: true })));
+  }
+};
+
+/**
+ * Write several variants of one upload with a single decode and mask
+ * @param {string} inputPath - Path of the uploaded image
+ * @param {Object[]} variants - Objects with operation, output_path, an optional profile and operation parameters
+ * @param {Object} params - Shared settings such as mode and backend
+ * @returns {Promise<Object>} Structured result whose outputs hold one encode report per variant
+ */
+export const runAiVariants = (inputPath, variants, params = {}) => {
+  return runAiJob('variants', inputPath, null, { ...params, variants });
+};
+
+/**
+ * Stop all pooled workers
+ */
+export const shutdownAiWorkers = () => {
+  workers.forEach((worker) => worker.child.stdin.end());
+};